@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 from supabase import create_client, Client
 import google.generativeai as genai
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import plotly.graph_objects as go
 import re
 import base64
@@ -11,8 +11,21 @@ import os
 
 
 # 분리된 모듈에서 함수 임포트 (legacy/hybrid 수정 없음)
-from legacy import fetch_db_data_legacy, query_gemini_ai_legacy
-from hybrid import ask_professional_scheduler
+from legacy import fetch_db_data_legacy, format_freshness_note, query_gemini_ai_legacy
+from hybrid import (
+    DEFAULT_CAPA_LIMITS,
+    DEFAULT_REDUCE_SOLVER,
+    DEFAULT_TODAY,
+    StageCache,
+    adjust_date_range,
+    ask_professional_scheduler,
+    format_leveling_report,
+    format_range_report,
+    level_capa_month,
+)
+from data_sync import DataSync, LazyTable, SnapshotStore, plan_partitions
+from llm_cache import LLMCache
+from llm_guard import CircuitBreaker
 
 
 
@@ -534,54 +547,187 @@ genai.configure(api_key=GENAI_KEY)
 
 
 
-CAPA_LIMITS = {"조립1": 3300, "조립2": 3700, "조립3": 3600}
+CAPA_LIMITS = dict(DEFAULT_CAPA_LIMITS)
 TEST_MODE = True
-TODAY = datetime(2026, 1, 5).date() if TEST_MODE else datetime.now().date()
+TODAY = DEFAULT_TODAY if TEST_MODE else datetime.now().date()
+REDUCE_SOLVER = DEFAULT_REDUCE_SOLVER  # 감축 폴백: "flow"(최소비용 유량) / "greedy"(기존 단계별 폴백)
 
 
 
 
 # ==================== 데이터 로드 ====================
-@st.cache_data(ttl=600)
-def fetch_data(target_date=None):
-    try:
-        if target_date:
-            dt = datetime.strptime(target_date, "%Y-%m-%d")
-            start_date = (dt - timedelta(days=10)).strftime("%Y-%m-%d")
-            end_date = (dt + timedelta(days=10)).strftime("%Y-%m-%d")
-            plan_res = (
-                supabase.table("production_plan_2026_01")
-                .select("*")
-                .gte("plan_date", start_date)
-                .lte("plan_date", end_date)
-                .execute()
-            )
-        else:
-            plan_res = supabase.table("production_plan_2026_01").select("*").execute()
+PLAN_TABLE_TEMPLATE = "production_plan_{year:04d}_{month:02d}"  # 월별 파티션 테이블
+PLAN_DEFAULT_MONTH = (2026, 1)  # target_date 없을 때 읽을 월
+PLAN_WINDOW_DAYS = 10  # target_date 기준 ±N일
+PLAN_TABLE_OPTS = {
+    # 병합 키는 기본키(id): 같은 날짜·라인·품목 행이 여러 개여도 서로 덮어쓰지 않음
+    "key_cols": ("id",),
+    "order_by": ("plan_date", "line", "product_name", "id"),
+}
+HIST_TABLE = "production_investigation"
+SYNC_INTERVAL_SEC = 60  # 이 간격 안에서는 원격 변경분 조회 없이 로컬 사본 사용
+HIST_TTL_SEC = 600  # hist_df(production_investigation)는 실제로 쓰일 때만 조회, 이후 이 간격으로 재확인
+FETCH_PAGE_SIZE = 1000  # Range 페이지 크기 (Supabase/PostgREST max-rows 이하)
+FETCH_MAX_WORKERS = 4  # 페이지 병렬 조회 스레드 수
+STAGE_CACHE_SIZE = 64  # 엔진 1~4단계 캐시 항목 수 (LRU)
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshots")
+LLM_CACHE_PATH = os.path.join(SNAPSHOT_DIR, "llm_cache.sqlite")  # 프로세스/레플리카 간 공유 LLM 응답 캐시
+LLM_CACHE_TTL_SEC = 6 * 3600
+AI_TIMEOUT_SEC = 20.0  # Gemini 응답 대기 예산 (초과 시 Python 폴백)
+AI_BREAKER_FAILURES = 3  # 연속 실패/시간 초과 이 횟수면 쿨다운 동안 Gemini 호출 생략
+AI_BREAKER_COOLDOWN_SEC = 120
+EVENT_SEARCH_LIMIT = 24  # 감축 미달 시 평가할 잔업/특근 조합 수 (0 = 기본 제안 1건만)
+
+
+
+@st.cache_resource
+def get_snapshot_store():
+    # 마지막 정상 스냅샷 보관소 (재시작/새 레플리카 콜드스타트용)
+    return SnapshotStore(SNAPSHOT_DIR)
+
+
+
+@st.cache_resource
+def get_data_sync():
+    # 테이블별 로컬 사본 (워터마크 이후 변경분만 증분 동기화)
+    # - 월별 계획 파티션은 처음 필요할 때 ensure()로 등록되고, 월마다 독립적으로 캐시/동기화됨
+    return DataSync(
+        supabase,
+        {},
+        store=get_snapshot_store(),
+        page_size=FETCH_PAGE_SIZE,
+        max_workers=FETCH_MAX_WORKERS,
+    )
+
+
+
+@st.cache_resource
+def get_hist_table():
+    # production_investigation: 소비자가 get(columns)을 부를 때만 필요한 컬럼으로 조회 (자체 TTL)
+    return LazyTable(
+        supabase,
+        HIST_TABLE,
+        ttl_sec=HIST_TTL_SEC,
+        store=get_snapshot_store(),
+        page_size=FETCH_PAGE_SIZE,
+        max_workers=FETCH_MAX_WORKERS,
+    )
+
+
+
+@st.cache_resource
+def get_stage_cache():
+    # 같은 스냅샷·날짜·라인 질문은 1~4단계(재고/누적여유/CAPA/제약)를 재사용하고 5~6단계만 다시 계산
+    return StageCache(maxsize=STAGE_CACHE_SIZE)
+
+
+
+@st.cache_resource
+def get_llm_cache():
+    # 동일 프롬프트(같은 사실 보고서 + 목표)의 Gemini 응답 재사용 → 반복 질문은 LLM 왕복 생략
+    return LLMCache(ttl_sec=LLM_CACHE_TTL_SEC, path=LLM_CACHE_PATH)
+
+
+
+@st.cache_resource
+def get_ai_breaker():
+    # 세션 간 공유: Gemini가 느리거나 죽어 있으면 모든 세션이 쿨다운 동안 바로 Python 폴백으로 진행
+    return CircuitBreaker(failure_threshold=AI_BREAKER_FAILURES, cooldown_sec=AI_BREAKER_COOLDOWN_SEC)
+
+
+
+def _plan_window(target_date, end_date=None):
+    # (시작일, 종료일) — target_date(~end_date) 기준 ±N일, target_date 없으면 기본 월 전체
+    if target_date:
+        dt = datetime.strptime(target_date, "%Y-%m-%d").date()
+        end = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else dt
+        return dt - timedelta(days=PLAN_WINDOW_DAYS), end + timedelta(days=PLAN_WINDOW_DAYS)
+    y, m = PLAN_DEFAULT_MONTH
+    start = datetime(y, m, 1).date()
+    end = (datetime(y + (m == 12), m % 12 + 1, 1) - timedelta(days=1)).date()
+    return start, end
+
+
+
+def _ingest_plan(plan_df):
+    # 수집 단계 1회 정규화: product_name/line/name_clean은 Categorical로 인터닝
+    # → 정규식·T6 판정은 고유 품목 수만큼만, 이후 필터/그룹핑은 정수 코드 비교
+    plan_df = plan_df.copy()
+    plan_df["product_name"] = plan_df["product_name"].astype(str).astype("category")
+    plan_df["line"] = plan_df["line"].astype(str).astype("category")
+
+    names = plan_df["product_name"].cat.categories.to_series()
+    clean = names.str.replace(r"\s+", "", regex=True).str.strip().to_numpy()
+    plan_df["name_clean"] = pd.Categorical(clean[plan_df["product_name"].cat.codes.to_numpy()])
+
+    codes = pd.DataFrame({
+        "name": plan_df["name_clean"].cat.codes.to_numpy(),
+        "line": plan_df["line"].cat.codes.to_numpy(),
+        "plt": plan_df["plt"].to_numpy() if "plt" in plan_df.columns else None,
+    })
+    clean_labels = plan_df["name_clean"].cat.categories
+    line_labels = plan_df["line"].cat.categories.to_numpy()
+
+    plt_map = {clean_labels[c]: v for c, v in codes.groupby("name", sort=True)["plt"].first().items()}
+    product_map = {
+        clean_labels[c]: line_labels[grp.to_numpy()]
+        for c, grp in codes.drop_duplicates(["name", "line"]).groupby("name", sort=True)["line"]
+    }
+    for k in product_map:
+        if "T6" in str(k).upper():
+            product_map[k] = ["조립1", "조립2", "조립3"]
+    return plan_df, product_map, plt_map
+
+
 
+@st.cache_data(max_entries=32)
+def _build_frames(target_date, versions, end_date=None):
+    # versions(파티션별 동기화 version)가 캐시 키 → 해당 월에 실제 변경이 있을 때만 재계산
+    sync = get_data_sync()
+    plan_df = sync.concat([name for name, _ in versions])
 
+    if not plan_df.empty:
+        start, end = _plan_window(target_date, end_date)
+        d = plan_df["plan_date"].astype(str).str[:10]
+        plan_df = plan_df[(d >= start.strftime("%Y-%m-%d")) & (d <= end.strftime("%Y-%m-%d"))].reset_index(drop=True)
 
-        plan_df = pd.DataFrame(plan_res.data) if plan_res.data else pd.DataFrame()
-        hist_res = supabase.table("production_investigation").select("*").execute()
-        hist_df = pd.DataFrame(hist_res.data) if hist_res.data else pd.DataFrame()
 
 
+    if not plan_df.empty:
+        plan_df, product_map, plt_map = _ingest_plan(plan_df)
+        # 엔진 1~4단계 캐시(StageCache)의 스냅샷 키: 조회 구간 + 파티션 version
+        plan_df.attrs["snapshot_key"] = f"{target_date}~{end_date}:{versions}" if end_date else f"{target_date}:{versions}"
+        return plan_df, product_map, plt_map
 
-        if not plan_df.empty:
-            plan_df["name_clean"] = plan_df["product_name"].apply(lambda x: re.sub(r"\s+", "", str(x)).strip())
-            plt_map = plan_df.groupby("name_clean")["plt"].first().to_dict()
-            product_map = plan_df.groupby("name_clean")["line"].unique().to_dict()
-            for k in product_map:
-                if "T6" in str(k).upper():
-                    product_map[k] = ["조립1", "조립2", "조립3"]
-            return plan_df, hist_df, product_map, plt_map
 
 
+    return pd.DataFrame(), {}, {}
 
-        return pd.DataFrame(), pd.DataFrame(), {}, {}
+
+
+def fetch_data(target_date=None, end_date=None):
+    # hist_df는 LazyTable 핸들로 넘긴다 (실제 사용 전까지 다운로드 없음, 로드 실패 시에도 빈 핸들)
+    try:
+        sync = get_data_sync()
+        start, end = _plan_window(target_date, end_date)
+        partitions = plan_partitions(start, end, PLAN_TABLE_TEMPLATE)
+        for name in partitions:
+            sync.ensure(name, **PLAN_TABLE_OPTS)
+        # 걸치는 월 파티션을 병렬 동기화 (아직 없는 달 테이블만 빈 파티션으로 취급, 그 외 오류는 예외)
+        sync.refresh(partitions, min_interval=SYNC_INTERVAL_SEC, background=True, strict=False)
+        st.session_state["data_load_report"] = sync.last_report
+        failed = {name: r["error"] for name, r in sync.last_report.items() if r.get("error")}
+        stale = [f"{n}({e})" for n, e in failed.items() if sync.table(n).loaded]
+        missing = [n for n in failed if sync.table(n).missing and not sync.table(n).loaded]
+        if stale:
+            st.warning(f"일부 테이블 동기화 실패 → 기존 데이터 사용: {', '.join(stale)}")
+        if missing:
+            st.caption(f"조회되지 않은 계획 파티션(해당 월 데이터 없음): {', '.join(missing)}")
+        plan_df, product_map, plt_map = _build_frames(target_date, sync.versions(partitions), end_date)
+        return plan_df, get_hist_table(), product_map, plt_map
     except Exception as e:
         st.error(f"데이터 로드 실패: {e}")
-        return pd.DataFrame(), pd.DataFrame(), {}, {}
+        return pd.DataFrame(), LazyTable.empty(HIST_TABLE), {}, {}
 
 
 
@@ -604,6 +750,37 @@ def extract_date(text):
 
 
 
+_DATE_TOKEN = r"(?:202[56]-\d{1,2}-\d{1,2}|\d{1,2}/\d{1,2}|\d{1,2}월\s*\d{1,2}일)"
+
+
+def extract_date_range(text):
+    # "1/19~1/23", "1/19~23", "1월 19일~1월 23일", "2026-01-19~2026-01-23" → (시작일, 종료일), 기간이 없으면 None
+    # - 종료일을 일자만 적었는데 시작 일자보다 작으면 다음 달로 본다 ("1/29~3" → 1/29~2/3)
+    # - 기간 표기는 있는데 실제 날짜가 아니면 ("1/19~35", "2/30~3/2") ValueError (데이터 로드 전에 안내)
+    if not text:
+        return None
+    match = re.search(rf"({_DATE_TOKEN})\s*[~～]\s*({_DATE_TOKEN}|\d{{1,2}}일?)", text)
+    if not match:
+        return None
+    start_raw = extract_date(match.group(1))
+    end_token = match.group(2)
+    try:
+        start = datetime.strptime(start_raw, "%Y-%m-%d").date()
+        if re.fullmatch(r"\d{1,2}일?", end_token):
+            day = int(end_token.rstrip("일"))
+            y, m = start.year, start.month
+            if day < start.day:
+                y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+            end = date(y, m, day)
+        else:
+            end = datetime.strptime(extract_date(end_token), "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        raise ValueError(f"기간을 해석할 수 없습니다: '{match.group(0)}' (예: '1/19~1/23', '1/29~2/3')") from None
+    start, end = start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+    return (start, end) if start <= end else (end, start)
+
+
+
 
 # ==================== HTML 렌더 도구들 ====================
 def clean_content(text):
@@ -1020,7 +1197,7 @@ def render_hybrid_details_tabs(report_md: str, plan_df: pd.DataFrame | None = No
 
         with t4:
             if isinstance(plan_df, pd.DataFrame) and (not plan_df.empty) and ("qty_1차" in plan_df.columns):
-                daily = plan_df.groupby(["plan_date", "line"])["qty_1차"].sum().reset_index()
+                daily = plan_df.groupby(["plan_date", "line"], observed=True)["qty_1차"].sum().reset_index()
                 daily.columns = ["plan_date", "line", "current_qty"]
 
 
@@ -1138,7 +1315,13 @@ if prompt := st.chat_input("무엇을 도와드릴까요?"):
 if st.session_state.is_loading:
     user_messages = [m for m in st.session_state.messages if isinstance(m, dict) and m.get("role") == "user"]
     prompt = user_messages[-1]["content"] if user_messages else ""
-    target_date = extract_date(prompt)
+    # "1/19~1/23 조립2 80%": 기간이면 시작일 기준으로 라우팅하고, 엔진은 기간 전체를 한 번에 처리
+    try:
+        date_range, range_error = extract_date_range(prompt), None
+    except ValueError as e:
+        date_range, range_error = None, str(e)
+    target_date = date_range[0] if date_range else extract_date(prompt)
+    end_date = date_range[1] if date_range else None
 
 
 
@@ -1151,9 +1334,50 @@ if st.session_state.is_loading:
 
 
 
+    # "평준화": 로드된 계획 전체의 CAPA 초과 슬롯을 한 번에 해소 (날짜 없으면 기본 월)
+    is_leveling_mode = "평준화" in prompt
+
+
+
     try:
-        if is_adjustment_mode:
-            plan_df, hist_df, product_map, plt_map = fetch_data(target_date)
+        if range_error:
+            # 잘못된 기간은 데이터 로드 실패가 아니라 입력 오류로 안내
+            st.session_state.messages.append({"role": "assistant", "engine": "legacy", "content": f"❌ {range_error}"})
+
+        elif is_leveling_mode:
+            plan_df, _, _, _ = fetch_data(target_date, end_date)
+            if plan_df.empty:
+                report = "## 🧾 최종 조치 계획\n❌ 데이터를 불러올 수 없습니다."
+                moves = None
+            else:
+                leveling = level_capa_month(
+                    plan_df,
+                    today=TODAY,
+                    capa_limits=CAPA_LIMITS,
+                    start_date=target_date if date_range else None,
+                    end_date=end_date,
+                    reduce_solver=REDUCE_SOLVER,
+                )
+                report = format_leveling_report(leveling)
+                moves = leveling["moves"]
+
+            st.session_state.messages.append(
+                {
+                    "role": "assistant",
+                    "engine": "hybrid",
+                    "content": "",
+                    "action_md": build_action_md(report),
+                    "delta_html": build_delta_html(moves),
+                    "validated_moves": moves,
+                    "report_md": report,
+                    "plan_df": plan_df,
+                }
+            )
+
+
+
+        elif is_adjustment_mode:
+            plan_df, hist_df, product_map, plt_map = fetch_data(target_date, end_date)
 
 
 
@@ -1169,6 +1393,32 @@ if st.session_state.is_loading:
                         "report_md": "",
                     }
                 )
+            elif date_range:
+                # 기간 조정: 날짜별 결정을 공유 원장에 이어서 반영하고 통합 보고서 1개로 응답
+                range_result = adjust_date_range(
+                    prompt,
+                    plan_df,
+                    start_date=target_date,
+                    end_date=end_date,
+                    today=TODAY,
+                    capa_limits=CAPA_LIMITS,
+                    reduce_solver=REDUCE_SOLVER,
+                    stage_cache=get_stage_cache(),
+                )
+                report = format_range_report(range_result)
+                moves = range_result.get("moves") or None
+                st.session_state.messages.append(
+                    {
+                        "role": "assistant",
+                        "engine": "hybrid",
+                        "content": "",
+                        "action_md": build_action_md(report),
+                        "delta_html": build_delta_html(moves),
+                        "validated_moves": moves,
+                        "report_md": report,
+                        "plan_df": plan_df,
+                    }
+                )
             else:
                 result = ask_professional_scheduler(
                     question=prompt,
@@ -1181,6 +1431,12 @@ if st.session_state.is_loading:
                     today=TODAY,
                     capa_limits=CAPA_LIMITS,
                     genai_key=GENAI_KEY,
+                    reduce_solver=REDUCE_SOLVER,
+                    stage_cache=get_stage_cache(),
+                    llm_cache=get_llm_cache(),
+                    ai_timeout_sec=AI_TIMEOUT_SEC,
+                    breaker=get_ai_breaker(),
+                    event_search_limit=EVENT_SEARCH_LIMIT,
                 )
 
 
@@ -1222,11 +1478,20 @@ if st.session_state.is_loading:
 
 
         else:
-            db_result = fetch_db_data_legacy(prompt, supabase)
+            freshness = []
+            db_result = fetch_db_data_legacy(
+                prompt,
+                supabase,
+                store=get_snapshot_store(),
+                page_size=FETCH_PAGE_SIZE,
+                max_workers=FETCH_MAX_WORKERS,
+                freshness=freshness,
+            )
             if "찾을 수 없습니다" in db_result or "오류" in db_result:
                 answer = db_result
             else:
                 answer = query_gemini_ai_legacy(prompt, db_result, GENAI_KEY)
+            answer += format_freshness_note(freshness)  # 오래된 스냅샷 기준이면 표시
 
 
 
@@ -0,0 +1,729 @@
+"""
+data_sync.py
+- Supabase(PostgREST) 테이블 로컬 동기화 계층
+- 최초 1회 전체 로드 후에는 워터마크(updated_at) 이후 변경분만 가져와 기본키(id) 기준으로 병합
+  (updated_at/기본키가 없는 테이블은 매번 전체 조회 + 내용 해시 비교, 삭제는 주기적 전체 대조로 반영)
+- 실제 변경이 있을 때만 version이 올라가므로, 앱 캐시는 version을 키로 써서 변경 시에만 무효화
+- client는 supabase-py와 같은 체이닝 인터페이스(table().select().gte().order().execute())만 있으면 되므로
+  로컬 PostgREST(create_client(로컬 URL))나 테스트용 대역으로 바꿔 끼울 수 있음
+- SnapshotStore: 마지막 정상 스냅샷을 로컬 컬럼 파일(Parquet, pyarrow 없으면 pickle)로 보관
+  → 재시작/새 레플리카는 파일에서 즉시 올라오고, 원격 재검증은 백그라운드에서 수행
+- LazyTable: 처음 실제로 쓰일 때만 필요한 컬럼으로 조회하는 지연 로딩 핸들 (자체 TTL)
+- fetch_paginated: PostgREST 응답 상한(max-rows)에 잘리지 않도록 Range 페이지 단위로 나눠 병렬 조회
+- run_parallel: 서로 독립인 테이블 로드를 공용 executor에서 동시에 실행하고 테이블별 소요시간/오류를 보고
+- plan_partitions: 날짜 구간 → 월별 계획 테이블명(production_plan_YYYY_MM) 목록 (월 추가 시 코드 수정 불필요)
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+# 워터마크 후보 컬럼 (앞에 있을수록 우선)
+# - 수정 시각 컬럼만 허용: id 같은 삽입 순서 컬럼은 수정/삭제를 못 잡으므로 증분 기준이 될 수 없음
+DEFAULT_WATERMARK_COLS = ("updated_at",)
+DEFAULT_KEY_COLS = ("id",)
+# PostgREST "테이블 없음" 오류 코드 (42P01: undefined_table, PGRST205: 스키마 캐시에 테이블 없음, HTTP 404)
+MISSING_TABLE_CODES = ("42P01", "PGRST205")
+# 증분 모드에서도 이 간격마다 전체 조회로 대조 (워터마크로는 안 보이는 삭제 반영, None = 최초 로드 때만)
+FULL_RECONCILE_SEC = 1800
+
+# 페이지 조회 기본값
+# - PAGE_SIZE는 서버 max-rows(PostgREST 기본 1000) 이하여야 함: 더 크면 잘린 페이지를 마지막 페이지로 오인
+PAGE_SIZE = 1000
+PAGE_WORKERS = 4
+
+# 테이블 단위 동시 로드용 공용 executor (페이지 조회는 fetch_paginated 자체 풀을 쓰므로 중첩 대기 없음)
+LOAD_WORKERS = 4
+_LOAD_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_LOAD_EXECUTOR_LOCK = threading.Lock()
+
+
+def is_missing_table(exc: BaseException) -> bool:
+    """원격 조회 예외가 '테이블이 아직 없음'인지 (예: 아직 만들어지지 않은 다음 달 파티션)"""
+    code = str(getattr(exc, "code", "") or "")
+    if code in MISSING_TABLE_CODES or code == "404":
+        return True
+    msg = str(exc)
+    return any(c in msg for c in MISSING_TABLE_CODES)
+
+
+def frame_hash(df: pd.DataFrame) -> str:
+    """DataFrame 내용 해시 (컬럼명 + 값 기준)"""
+    if df is None or df.empty:
+        return "empty"
+    h = pd.util.hash_pandas_object(df, index=False).sum()
+    return f"{len(df)}:{'|'.join(map(str, df.columns))}:{int(h) & 0xFFFFFFFFFFFFFFFF:x}"
+
+
+# ========================================================================
+# 페이지 단위 병렬 조회
+# ========================================================================
+
+def fetch_paginated(
+    query_factory: Callable[[], Any],
+    order_by: Sequence[str] = (),
+    page_size: int = PAGE_SIZE,
+    max_workers: int = PAGE_WORKERS,
+) -> pd.DataFrame:
+    """query_factory()로 만든 쿼리를 Range 페이지로 나눠 조회 후 하나의 DataFrame으로 합침.
+    - 첫 페이지가 꽉 차 있으면 다음 페이지들을 max_workers개씩 병렬 요청, 덜 찬 페이지가 나오면 종료
+    - 페이지 경계가 흔들리지 않도록 order_by(가능하면 유일 키)를 지정할 것
+      (미지정 시 테이블 물리 순서에 의존)
+    """
+    page_size = max(int(page_size), 1)
+    max_workers = max(int(max_workers), 1)
+
+    def _page(i: int) -> List[Dict[str, Any]]:
+        q = query_factory()
+        for col in order_by:
+            q = q.order(col)
+        res = q.range(i * page_size, (i + 1) * page_size - 1).execute()
+        return res.data or []
+
+    pages: List[List[Dict[str, Any]]] = [_page(0)]
+    if len(pages[0]) >= page_size:
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            nxt = 1
+            done = False
+            while not done:
+                batch = list(range(nxt, nxt + max_workers))
+                for rows in ex.map(_page, batch):
+                    pages.append(rows)
+                    if len(rows) < page_size:
+                        done = True
+                        break
+                nxt += max_workers
+
+    rows = [r for page in pages for r in page]
+    return pd.DataFrame(rows) if rows else pd.DataFrame()
+
+
+# ========================================================================
+# 월별 파티션 테이블
+# ========================================================================
+
+PLAN_TABLE_TEMPLATE = "production_plan_{year:04d}_{month:02d}"
+
+
+def plan_partitions(start: date, end: date, template: str = PLAN_TABLE_TEMPLATE) -> List[str]:
+    """[start, end] 구간이 걸치는 월별 테이블명 (월 순서)"""
+    if end < start:
+        start, end = end, start
+    names = []
+    y, m = start.year, start.month
+    while (y, m) <= (end.year, end.month):
+        names.append(template.format(year=y, month=m))
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return names
+
+
+# ========================================================================
+# 테이블 단위 병렬 로드
+# ========================================================================
+
+def _load_executor() -> ThreadPoolExecutor:
+    global _LOAD_EXECUTOR
+    with _LOAD_EXECUTOR_LOCK:
+        if _LOAD_EXECUTOR is None:
+            _LOAD_EXECUTOR = ThreadPoolExecutor(max_workers=LOAD_WORKERS, thread_name_prefix="data-load")
+        return _LOAD_EXECUTOR
+
+
+def run_parallel(tasks: Dict[str, Callable[[], Any]]) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """이름 → 로더 함수들을 공용 executor에서 동시에 실행, 모두 끝나면 결과를 모아 반환.
+    Returns: (results, report)
+    - results: 성공한 로더의 반환값
+    - report: 이름별 {"ok", "elapsed_ms", "error"}
+    """
+
+    def _timed(fn: Callable[[], Any]) -> Tuple[Any, float]:
+        t0 = time.perf_counter()
+        out = fn()
+        return out, (time.perf_counter() - t0) * 1000
+
+    submitted = time.perf_counter()
+    futures = {name: _load_executor().submit(_timed, fn) for name, fn in tasks.items()}
+
+    results: Dict[str, Any] = {}
+    report: Dict[str, Dict[str, Any]] = {}
+    for name, fut in futures.items():
+        try:
+            out, elapsed = fut.result()
+            results[name] = out
+            report[name] = {"ok": True, "elapsed_ms": round(elapsed, 1), "error": None}
+        except Exception as e:
+            elapsed = (time.perf_counter() - submitted) * 1000
+            report[name] = {"ok": False, "elapsed_ms": round(elapsed, 1), "error": str(e)}
+    return results, report
+
+
+# ========================================================================
+# 로컬 스냅샷 파일
+# ========================================================================
+
+class SnapshotStore:
+    """테이블/조회 결과의 마지막 정상 스냅샷을 디스크에 보관.
+    - 데이터: <root>/<name>.parquet (pyarrow 없거나 변환 불가 컬럼이면 .pkl)
+    - 메타: <root>/<name>.json (content hash, fetched_at, 워터마크 등)
+    - 쓰기는 임시 파일 → os.replace로 원자적 교체
+    """
+
+    def __init__(self, root: str, parquet: Optional[bool] = None):
+        """parquet=None: pyarrow가 설치돼 있으면 Parquet, 없으면 pickle
+        parquet=True: Parquet 강제 (pyarrow 미설치면 바로 ImportError)"""
+        has_arrow = importlib.util.find_spec("pyarrow") is not None
+        if parquet and not has_arrow:
+            raise ImportError("SnapshotStore(parquet=True)에는 pyarrow가 필요합니다: pip install pyarrow")
+        self.parquet = has_arrow if parquet is None else bool(parquet)
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def _safe(name: str) -> str:
+        return "".join(ch if (ch.isalnum() or ch in "-_.") else "_" for ch in name)
+
+    def _path(self, name: str, ext: str) -> str:
+        return os.path.join(self.root, f"{self._safe(name)}.{ext}")
+
+    def prune(self, prefix: str, keep: int) -> int:
+        """이름이 prefix로 시작하는 스냅샷 중 최근 저장된 keep개만 남기고 삭제 (삭제 개수 반환)
+        - 질문마다 키가 달라지는 조회 스냅샷(예: 레거시 조회)이 디스크에 끝없이 쌓이지 않도록"""
+        safe = self._safe(prefix)
+        metas = []
+        with os.scandir(self.root) as it:
+            for e in it:
+                if e.name.startswith(safe) and e.name.endswith(".json"):
+                    try:
+                        metas.append((e.stat().st_mtime, e.name[: -len(".json")]))
+                    except OSError:
+                        pass  # 다른 스레드가 방금 지운 파일
+        metas.sort(reverse=True)
+        for _, stem in metas[max(int(keep), 0):]:
+            for ext in ("json", "parquet", "pkl"):
+                try:
+                    os.remove(os.path.join(self.root, f"{stem}.{ext}"))
+                except FileNotFoundError:
+                    pass
+        return max(len(metas) - max(int(keep), 0), 0)
+
+    def save(self, name: str, df: pd.DataFrame, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        meta = dict(meta or {})
+        meta.setdefault("fetched_at", datetime.now().isoformat(timespec="seconds"))
+        meta["hash"] = frame_hash(df)
+        meta["rows"] = int(len(df))
+
+        fmt = "pkl"
+        if self.parquet:
+            tmp = self._path(name, "parquet.tmp")
+            try:
+                df.to_parquet(tmp, index=False)
+                os.replace(tmp, self._path(name, "parquet"))
+                fmt = "parquet"
+            except Exception:
+                # 혼합 타입 컬럼 등 Parquet 변환 불가 → pickle로 보관
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        if fmt == "pkl":
+            tmp = self._path(name, "pkl.tmp")
+            df.to_pickle(tmp)
+            os.replace(tmp, self._path(name, "pkl"))
+        meta["format"] = fmt
+
+        tmp = self._path(name, "json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, default=str)
+        os.replace(tmp, self._path(name, "json"))
+        return meta
+
+    def load(self, name: str) -> Optional[Tuple[pd.DataFrame, Dict[str, Any]]]:
+        meta_path = self._path(name, "json")
+        if not os.path.exists(meta_path):
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("format") == "parquet":
+                df = pd.read_parquet(self._path(name, "parquet"))
+            else:
+                df = pd.read_pickle(self._path(name, "pkl"))
+        except Exception:
+            # 깨진 스냅샷은 없는 것으로 취급 (원격에서 다시 받는다)
+            return None
+        return df, meta
+
+
+def stale_while_revalidate(
+    store: Optional[SnapshotStore],
+    name: str,
+    fetch: Callable[[], pd.DataFrame],
+    max_age_sec: float = 600,
+    status: Optional[Dict[str, Any]] = None,
+) -> pd.DataFrame:
+    """디스크 스냅샷이 있으면 즉시 반환하고, max_age_sec보다 오래됐으면 백그라운드로 재조회해 갱신.
+    스냅샷이 없으면 동기로 조회 후 저장.
+    - status: dict를 넘기면 반환한 데이터의 신선도를 채움
+      {"age_sec": 스냅샷 나이(새로 조회했으면 0), "stale": max_age_sec 초과 여부,
+       "error": 이 스냅샷의 마지막 백그라운드 재조회 실패 메시지 (없으면 None)}
+    """
+    if status is not None:
+        status.update(age_sec=0.0, stale=False, error=None)
+    if store is None:
+        return fetch()
+
+    cached = store.load(name)
+    if cached is None:
+        df = fetch()
+        store.save(name, df)
+        _clear_revalidate_error(name)
+        return df
+
+    df, meta = cached
+    try:
+        age = (datetime.now() - datetime.fromisoformat(str(meta.get("fetched_at")))).total_seconds()
+    except Exception:
+        age = float("inf")
+    if status is not None:
+        status.update(age_sec=age, stale=age > max_age_sec, error=revalidate_error(name))
+    if age > max_age_sec:
+        _revalidate_in_background(store, name, fetch)
+    return df
+
+
+_REVALIDATING: set = set()
+_REVALIDATE_ERRORS: Dict[str, str] = {}  # 스냅샷 이름 → 마지막 백그라운드 재조회 실패 (성공하면 삭제)
+_REVALIDATING_LOCK = threading.Lock()
+
+
+def revalidate_error(name: str) -> Optional[str]:
+    """스냅샷 name의 마지막 백그라운드 재조회 실패 메시지 (성공했거나 실패한 적 없으면 None)"""
+    with _REVALIDATING_LOCK:
+        return _REVALIDATE_ERRORS.get(name)
+
+
+def _clear_revalidate_error(name: str) -> None:
+    with _REVALIDATING_LOCK:
+        _REVALIDATE_ERRORS.pop(name, None)
+
+
+def _revalidate_in_background(store: SnapshotStore, name: str, fetch: Callable[[], pd.DataFrame]) -> None:
+    with _REVALIDATING_LOCK:
+        if name in _REVALIDATING:
+            return
+        _REVALIDATING.add(name)
+
+    def _run():
+        try:
+            store.save(name, fetch())
+            _clear_revalidate_error(name)
+        except Exception as e:
+            # 기존 스냅샷은 유지하되 실패를 남겨 호출 측이 오래된 데이터임을 표시할 수 있게 함
+            logger.warning("snapshot %s revalidation failed: %s", name, e, exc_info=True)
+            with _REVALIDATING_LOCK:
+                _REVALIDATE_ERRORS[name] = f"{type(e).__name__}: {e}"
+        finally:
+            with _REVALIDATING_LOCK:
+                _REVALIDATING.discard(name)
+
+    threading.Thread(target=_run, daemon=True).start()
+
+
+# ========================================================================
+# 테이블 증분 동기화
+# ========================================================================
+
+class TableSync:
+    """테이블 1개의 로컬 사본 + 워터마크 기반 증분 동기화
+    - 증분 모드: 워터마크 컬럼(updated_at)과 기본키(key_cols)가 모두 있을 때만.
+      워터마크 이후 변경분을 받아 같은 키의 기존 행을 교체하고, reconcile_sec마다 전체 조회로 삭제까지 대조
+    - 그 외: 매번 전체 조회 후 내용 해시로 변경 여부 판단
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        table: str,
+        columns: str = "*",
+        watermark_cols: Sequence[str] = DEFAULT_WATERMARK_COLS,
+        key_cols: Sequence[str] = DEFAULT_KEY_COLS,
+        store: Optional[SnapshotStore] = None,
+        snapshot_name: Optional[str] = None,
+        order_by: Sequence[str] = (),
+        page_size: int = PAGE_SIZE,
+        max_workers: int = PAGE_WORKERS,
+        reconcile_sec: Optional[float] = FULL_RECONCILE_SEC,
+    ):
+        self.client = client
+        self.table = table
+        self.snapshot_name = snapshot_name or table
+        self.order_by = tuple(order_by)
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self.columns = columns
+        self.watermark_cols = tuple(watermark_cols)
+        self.key_cols = tuple(key_cols)
+        self.reconcile_sec = reconcile_sec
+        self.store = store
+
+        self.df: pd.DataFrame = pd.DataFrame()
+        self.loaded = False
+        self.version = 0
+        self.watermark_col: Optional[str] = None
+        self.watermark: Any = None
+        self.last_sync: Optional[float] = None
+        self.last_full: Optional[float] = None  # 마지막 전체 조회 시각 (None = 원격과 대조한 적 없음)
+        self.last_error: Optional[str] = None
+        self.missing = False  # 마지막 조회가 '테이블 없음'으로 실패
+        self.from_snapshot = False  # 디스크 스냅샷으로 올라와 아직 원격 재검증 전
+        self._lock = threading.Lock()  # df/version 등 공개 상태 교체용 (짧게만 잡음)
+        self._sync_lock = threading.Lock()  # 원격 조회~병합~저장 직렬화 (snapshot()은 기다리지 않음)
+        self._revalidating = False
+
+    # ---------------------------------------------------------------
+    # 원격 조회
+    # ---------------------------------------------------------------
+    def _query(self):
+        return self.client.table(self.table).select(self.columns)
+
+    def _fetch_all(self) -> pd.DataFrame:
+        return fetch_paginated(self._query, self.order_by, self.page_size, self.max_workers)
+
+    def _fetch_since(self, col: str, mark: Any) -> pd.DataFrame:
+        order_by = (col,) + tuple(c for c in self.order_by if c != col)
+        # gte: 워터마크와 같은 시각에 늦게 커밋된 행도 받음 (이미 가진 행은 키 기준으로 자기 자신을 교체)
+        return fetch_paginated(lambda: self._query().gte(col, mark), order_by, self.page_size, self.max_workers)
+
+    # ---------------------------------------------------------------
+    # 워터마크/병합
+    # ---------------------------------------------------------------
+    def _pick_watermark_col(self, df: pd.DataFrame) -> Optional[str]:
+        if not all(c in df.columns for c in self.key_cols):
+            return None  # 기본키 없이는 변경분을 기존 행에 맞춰 교체할 수 없음 → 전체 조회 모드
+        for c in self.watermark_cols:
+            if c in df.columns:
+                return c
+        return None
+
+    @staticmethod
+    def _max_mark(df: pd.DataFrame, col: Optional[str], current: Any) -> Any:
+        if not col or df.empty or col not in df.columns:
+            return current
+        mark = df[col].dropna().max()
+        if hasattr(mark, "item"):
+            mark = mark.item()  # numpy 스칼라 → 파이썬 값 (쿼리 파라미터용)
+        if pd.notna(mark) and (current is None or mark > current):
+            return mark
+        return current
+
+    def _merged(self, delta: pd.DataFrame) -> pd.DataFrame:
+        """기존 사본에서 delta와 키가 겹치는 행만 빼고 delta를 붙임
+        (키가 겹치지 않는 기존 행은 중복 여부와 무관하게 그대로 유지)"""
+        keys = list(self.key_cols)
+        old = self.df
+        if not old.empty:
+            hit = pd.MultiIndex.from_frame(old[keys]).isin(pd.MultiIndex.from_frame(delta[keys]))
+            old = old[~hit]
+        return pd.concat([old, delta], ignore_index=True)
+
+    def _delta_changes(self, delta: pd.DataFrame) -> bool:
+        """delta가 기존 사본과 다른 행을 담고 있는지 (워터마크 경계에서 다시 받은 같은 행만이면 False)"""
+        keys = list(self.key_cols)
+        old = self.df
+        if old.empty or list(old.columns) != list(delta.columns):
+            return True
+        prev = old[pd.MultiIndex.from_frame(old[keys]).isin(pd.MultiIndex.from_frame(delta[keys]))]
+        if len(prev) != len(delta):
+            return True
+        a = prev.sort_values(keys, kind="stable").reset_index(drop=True)
+        b = delta.sort_values(keys, kind="stable").reset_index(drop=True)
+        return frame_hash(a) != frame_hash(b)
+
+    def _reconcile_due(self, now: float) -> bool:
+        if self.last_full is None:
+            return True
+        return self.reconcile_sec is not None and (now - self.last_full) >= self.reconcile_sec
+
+    def _pull(self, now: float) -> Tuple[pd.DataFrame, Optional[str], Any, bool, bool]:
+        """원격 조회 1회. Returns: (새 사본, 워터마크 컬럼, 워터마크, 변경 여부, 전체 조회 여부)"""
+        if self.loaded and self.watermark_col and self.watermark is not None and not self._reconcile_due(now):
+            delta = self._fetch_since(self.watermark_col, self.watermark)
+            if delta.empty or not self._delta_changes(delta):
+                return self.df, self.watermark_col, self.watermark, False, False
+            mark = self._max_mark(delta, self.watermark_col, self.watermark)
+            return self._merged(delta), self.watermark_col, mark, True, False
+
+        fresh = self._fetch_all()
+        changed = not self.loaded or frame_hash(fresh) != frame_hash(self.df)
+        col = self._pick_watermark_col(fresh)
+        return (fresh if changed else self.df), col, self._max_mark(fresh, col, None), changed, True
+
+    # ---------------------------------------------------------------
+    # 동기화
+    # ---------------------------------------------------------------
+    def warm_start(self) -> bool:
+        """디스크 스냅샷이 있으면 원격 조회 없이 로컬 사본으로 올림
+        (다음 refresh는 전체 대조: 스냅샷 이후 삭제/워터마크 규칙 변경까지 반영)"""
+        if self.store is None or self.loaded:
+            return False
+        with self._sync_lock:
+            if self.loaded:
+                return False
+            cached = self.store.load(self.snapshot_name)
+            if cached is None:
+                return False
+            df, meta = cached
+            with self._lock:
+                self.df = df
+                self.loaded = True
+                self.from_snapshot = True
+                self.watermark_col = meta.get("watermark_col") if meta.get("watermark_col") in self.watermark_cols else None
+                self.watermark = meta.get("watermark") if self.watermark_col else None
+                self.last_full = None
+                self.version += 1
+        return True
+
+    def refresh_in_background(self) -> None:
+        """원격 재검증을 데몬 스레드로 (이미 진행 중이면 무시)"""
+        with self._lock:
+            if self._revalidating:
+                return
+            self._revalidating = True
+
+        def _run():
+            try:
+                self.refresh()
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._revalidating = False
+
+        threading.Thread(target=_run, daemon=True).start()
+
+    def refresh(self, min_interval: float = 0.0, background: bool = False) -> bool:
+        """원격 변경분을 반영. 실제로 바뀐 게 있으면 True.
+        - min_interval초 안에 다시 불리면 원격 조회 없이 False
+        - 증분 모드가 아니거나 전체 대조 주기(reconcile_sec)가 되면 전체 재조회 후 내용 해시로 변경 여부 판단
+        - background=True: 처음 불릴 때 디스크 스냅샷이 있으면 그걸로 바로 올리고 원격 재검증은 백그라운드
+        """
+        if background and not self.loaded and self.warm_start():
+            self.refresh_in_background()
+            return True
+
+        # 원격 조회·병합은 _sync_lock에서만 수행 (self.df를 바꾸는 건 이 경로뿐이라 읽기는 안전)
+        # → 느린 조회 중에도 snapshot()은 기존 사본을 바로 반환, 교체 순간에만 _lock
+        with self._sync_lock:
+            now = time.monotonic()
+            if (
+                self.loaded
+                and min_interval > 0
+                and self.last_sync is not None
+                and (now - self.last_sync) < min_interval
+            ):
+                return False
+
+            try:
+                df, col, mark, changed, full = self._pull(now)
+            except Exception as e:
+                # 동기화 실패 시 기존 사본을 그대로 쓴다 (다음 refresh에서 재시도)
+                with self._lock:
+                    self.last_error = str(e)
+                    self.missing = is_missing_table(e)
+                if not self.loaded:
+                    raise
+                return False
+
+            with self._lock:
+                self.df = df
+                self.loaded = True
+                self.watermark_col, self.watermark = col, mark
+                self.last_sync = now
+                if full:
+                    self.last_full = now
+                self.last_error = None
+                self.missing = False
+                self.from_snapshot = False
+                if changed:
+                    self.version += 1
+            if changed:
+                self._persist()  # _sync_lock 안이라 저장 순서 = version 순서
+            return changed
+
+    def _persist(self) -> None:
+        if self.store is None:
+            return
+        try:
+            self.store.save(
+                self.snapshot_name,
+                self.df,
+                {"watermark_col": self.watermark_col, "watermark": self.watermark},
+            )
+        except Exception:
+            pass  # 스냅샷 저장 실패는 동기화 자체를 막지 않음
+
+    def snapshot(self) -> pd.DataFrame:
+        """현재 로컬 사본 (호출 측에서 수정해도 원본이 바뀌지 않도록 복사본)"""
+        with self._lock:
+            return self.df.copy()
+
+
+class DataSync:
+    """여러 TableSync 묶음. versions()는 캐시 키로 쓰기 위한 (테이블, version) 튜플"""
+
+    def __init__(
+        self,
+        client: Any,
+        tables: Dict[str, Dict[str, Any]],
+        store: Optional[SnapshotStore] = None,
+        page_size: int = PAGE_SIZE,
+        max_workers: int = PAGE_WORKERS,
+    ):
+        self.client = client
+        self.store = store
+        self.page_size = page_size
+        self.max_workers = max_workers
+        self.tables: Dict[str, TableSync] = {}
+        self.last_report: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        for name, opts in tables.items():
+            self.ensure(name, **(opts or {}))
+
+    def ensure(self, name: str, **opts: Any) -> TableSync:
+        """테이블이 없으면 등록 (월별 파티션처럼 필요할 때 추가되는 테이블용)"""
+        with self._lock:
+            if name not in self.tables:
+                opts = {"page_size": self.page_size, "max_workers": self.max_workers, **opts}
+                self.tables[name] = TableSync(self.client, name, store=self.store, **opts)
+            return self.tables[name]
+
+    def table(self, name: str) -> TableSync:
+        return self.tables[name]
+
+    def refresh(
+        self,
+        names: Optional[Sequence[str]] = None,
+        min_interval: float = 0.0,
+        background: bool = False,
+        strict: bool = True,
+    ) -> bool:
+        """테이블들을 동시에 동기화 (소요시간/오류는 last_report)
+        - 로컬 사본이 전혀 없는 테이블이 실패한 경우에만 예외를 올림 (나머지는 기존 사본 유지)
+        - strict=False: '테이블 없음'(404/42P01) 실패만 빈 테이블로 취급해 넘어감
+          (예: 아직 없는 다음 달 파티션). 권한/네트워크 등 다른 오류는 그대로 예외
+        """
+        names = list(names or self.tables)
+        results, report = run_parallel(
+            {
+                name: (lambda t=self.tables[name]: t.refresh(min_interval=min_interval, background=background))
+                for name in names
+            }
+        )
+        for name in names:
+            table = self.tables[name]
+            if report[name]["ok"] and table.last_error:
+                # TableSync가 내부에서 삼킨 오류(기존 사본으로 계속 사용)도 보고에 포함
+                report[name]["error"] = table.last_error
+        self.last_report = report
+
+        failed = [n for n in names if not report[n]["ok"] and not self.tables[n].loaded]
+        if not strict:
+            failed = [n for n in failed if not self.tables[n].missing]
+        if failed:
+            raise RuntimeError("; ".join(f"{n}: {report[n]['error']}" for n in failed))
+        return any(results.get(n) for n in names)
+
+    def versions(self, names: Optional[Sequence[str]] = None) -> Tuple[Tuple[str, int], ...]:
+        return tuple((name, self.tables[name].version) for name in (names or list(self.tables)))
+
+    def concat(self, names: Sequence[str]) -> pd.DataFrame:
+        """여러 테이블(예: 월별 파티션) 로컬 사본을 하나로 합침 (로드 안 된 테이블은 건너뜀)"""
+        frames = [self.tables[n].snapshot() for n in names if n in self.tables and self.tables[n].loaded]
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+
+# ========================================================================
+# 지연 로딩 핸들
+# ========================================================================
+
+class LazyTable:
+    """첫 get() 호출 전까지는 원격 조회를 하지 않는 테이블 핸들.
+    - get(columns): 요청 컬럼만 select (이미 받은 컬럼으로 충분하면 재조회 없이 잘라서 반환)
+    - 받은 뒤에는 ttl_sec 간격으로만 원격 변경 여부를 확인 (TableSync 증분/해시 비교)
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        table: str,
+        ttl_sec: float = 600,
+        store: Optional[SnapshotStore] = None,
+        **sync_opts: Any,
+    ):
+        self.client = client
+        self.table = table
+        self.ttl_sec = ttl_sec
+        self.store = store
+        self.sync_opts = sync_opts
+        self._sync: Optional[TableSync] = None
+        self._cols: Optional[frozenset] = None  # None = 전체 컬럼
+        self._lock = threading.Lock()
+        self._empty = False
+
+    @classmethod
+    def empty(cls, table: str = "") -> "LazyTable":
+        """원격 조회 없이 항상 빈 DataFrame을 돌려주는 핸들 (데이터 로드 실패 시에도 같은 타입을 넘기기 위함)"""
+        handle = cls(None, table)
+        handle._empty = True
+        return handle
+
+    @property
+    def loaded(self) -> bool:
+        return self._sync is not None and self._sync.loaded
+
+    def _covers(self, want: Optional[frozenset]) -> bool:
+        if self._sync is None:
+            return False
+        if self._cols is None:
+            return True
+        return want is not None and want <= self._cols
+
+    def get(self, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        if self._empty:
+            return pd.DataFrame(columns=list(columns or []))
+        want = frozenset(columns) if columns else None
+        with self._lock:
+            if not self._covers(want):
+                # 이미 받은 컬럼 + 새로 요청한 컬럼으로 다시 조회 (None이면 전체)
+                cols = None if want is None else want | (self._cols or frozenset())
+                select = "*" if cols is None else ",".join(sorted(cols))
+                name = self.table if cols is None else f"{self.table}__{'-'.join(sorted(cols))}"
+                self._sync = TableSync(
+                    self.client, self.table, columns=select, store=self.store, snapshot_name=name, **self.sync_opts
+                )
+                self._cols = cols
+            sync = self._sync
+
+        sync.refresh(min_interval=self.ttl_sec)
+        df = sync.snapshot()
+        if want is not None:
+            df = df[[c for c in df.columns if c in want]]
+        return df
+
+    def __repr__(self) -> str:
+        state = "empty" if self._empty else ("loaded" if self.loaded else "not loaded")
+        return f"LazyTable({self.table!r}, {state})"
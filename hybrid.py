@@ -10,35 +10,49 @@ hybrid.py
 ✅ FIX 2) generate_full_report()
 - 최종 조치 계획 출력 시, 동일 item/from/to는 합산해서 1줄로 표시
   → 같은 내용이 1PLT씩 여러 줄로 쪼개져 보이던 문제 개선(표시만 변경, 계산 로직 불변)
+
+✅ FIX 3) step6_validate_ai_strategy()
+- 누적 납기(cumsum1>=cumsum0) 검증을 품목별 DueLedger로 수행하고, 승인된 이동을 원장에 누적 반영
+  → 같은 품목을 여러 번 옮길 때 앞선 이동을 무시하고 원본 계획 기준으로만 검증하던 문제 해결
 """
 
 from __future__ import annotations
 
 import json
+import os
 import re
-from datetime import datetime, timedelta
-from typing import Any, Dict, List, Tuple, Optional
-from copy import deepcopy
-
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, replace
+from datetime import date, datetime, timedelta
+from functools import partial
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Set, Tuple, Optional
+
+import numpy as np
 import pandas as pd
 import google.generativeai as genai
 
-
-# ========================================================================
-# 전역 변수 (앱에서 넘겨준 today/capa_limits를 여기서 세팅)
-# ========================================================================
-TODAY = None
-CAPA_LIMITS = None
-
+from llm_cache import LLMCache
+from llm_guard import LLM_TIMEOUT_SEC, CircuitBreaker
 
 
 # 사람 같은 분산: T6 '같은날 타라인 이송'은 우선 1회, 최대 5PLT까지만 사용
 MAX_T6_SAMEDAY_SHIFT_PLTS = 5
 ENGINE_VERSION = "HUMANPLAN_V5"
-def initialize_globals(today, capa_limits):
-    global TODAY, CAPA_LIMITS
-    TODAY = today
-    CAPA_LIMITS = capa_limits
+AI_MODEL_NAME = "gemini-2.0-flash-exp"
+AI_STRATEGY_SOURCE = "AI 하이브리드 전략 (Gemini 2.0 Flash)"
+AI_SOURCE_FAILED = "AI 실패"
+AI_SOURCE_TIMEOUT = "AI 시간 초과"
+AI_SOURCE_BLOCKED = "AI 차단"
+AI_SOURCE_BUSY = "AI 포화"
+# 감축 폴백 기본 방식: "flow"(python_optimize_reduce 최소비용 유량 1회) / "greedy"(python_fallback_reduce 단계별)
+DEFAULT_REDUCE_SOLVER = "flow"
 
 
 # ========================================================================
@@ -72,36 +86,738 @@ def _coerce_is_workday(v: Any) -> bool:
         return False
 
 
+# ========================================================================
+# 계획 인덱스 (plan_df 스냅샷당 1회 구축 → 단계별 O(1) 조회)
+# ========================================================================
+
+def product_flags(name: Any) -> Tuple[bool, bool]:
+    """품목명 → (T6 여부, A2XX 여부)"""
+    up = str(name).upper()
+    return "T6" in up, "A2XX" in up
+
+
+def _intern(series: pd.Series, normalize=None) -> Tuple[np.ndarray, List[str]]:
+    """컬럼 → (정수 코드, 코드별 문자열 라벨).
+    Categorical이면 코드를 그대로 쓰고, 아니면 factorize 한 번으로 만든다.
+    normalize는 고유값(라벨)에만 적용 → 행 수가 아니라 고유값 수만큼만 문자열 처리.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy(dtype=np.int64)
+        uniques = list(series.cat.categories)
+    else:
+        codes, uniques = pd.factorize(series, sort=False)
+        codes = codes.astype(np.int64)
+        uniques = list(uniques)
+    labels = [str(u) for u in uniques]
+    if (codes < 0).any():
+        # 결측값은 기존 str(x) 처리와 동일하게 "nan" 라벨로
+        codes = np.where(codes < 0, len(labels), codes)
+        labels.append("nan")
+    if normalize is not None:
+        labels = [normalize(x) for x in labels]
+    return codes, labels
+
+
+class PlanIndex:
+    """plan_df를 한 번만 스캔해서 만든 조회용 인덱스.
+    - (plan_date, line, product_name) → qty_1차 합
+    - (plan_date, line) → qty_1차 합 / 행 목록(품목, qty_1차, plt)
+    - product_name → 원본 행 위치 (누적 납기 계산용, apply_move로 옮긴 품목은 이동 반영 사본)
+    - product_name → (T6, A2XX) 플래그 (고유 품목당 1회 계산)
+    - 납기 프로파일: 전체 마지막 납기일/계획일, 품목 코드별 마지막 납기일·첫/마지막 생산일 배열
+    그룹핑은 정수 코드(Categorical이면 그 코드) 기준으로 수행한다.
+    """
+
+    def __init__(self, plan_df: pd.DataFrame):
+        self.plan_df = plan_df
+        self.columns = set(plan_df.columns)
+        self.slot_total: Dict[Tuple[str, str], int] = {}
+        self.slot_item_qty: Dict[Tuple[str, str, str], int] = {}
+        self.slot_rows: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._flags_by_name: Dict[str, Tuple[bool, bool]] = {}
+        self._product_pos: Dict[str, Any] = {}
+        self._moved_rows: Dict[str, pd.DataFrame] = {}  # apply_move로 수량이 바뀐 품목의 행 사본
+        self.last_plan_date: Optional[str] = None
+        self.last_due_date: Optional[str] = None  # qty_0차 > 0인 마지막 날짜 (전체)
+        self._product_code: Dict[str, int] = {}
+        self._date_labels: List[str] = []
+        self._due_last = np.zeros(0, dtype=np.int64)  # 품목 코드 → 날짜 순위 (-1 = 없음)
+        self._prod_first = np.zeros(0, dtype=np.int64)
+        self._prod_last = np.zeros(0, dtype=np.int64)
+
+        if plan_df.empty or not {"plan_date", "line"}.issubset(self.columns):
+            return
+
+        n = len(plan_df)
+        d_codes, d_labels = _intern(plan_df["plan_date"], normalize=lambda x: x[:10])
+        l_codes, l_labels = _intern(plan_df["line"])
+        if "product_name" in self.columns:
+            p_codes, p_labels = _intern(plan_df["product_name"])
+        else:
+            p_codes, p_labels = np.zeros(n, dtype=np.int64), [""]
+        if "qty_1차" in self.columns:
+            qty1 = pd.to_numeric(plan_df["qty_1차"], errors="coerce").fillna(0).astype(int).to_numpy()
+        else:
+            qty1 = np.zeros(n, dtype=np.int64)
+        if "plt" in self.columns:
+            plts = pd.to_numeric(plan_df["plt"], errors="coerce").fillna(0).astype(int).to_numpy()
+            plts = np.where(plts > 0, plts, 1)
+        else:
+            plts = np.ones(n, dtype=np.int64)
+
+        codes = pd.DataFrame({"d": d_codes, "l": l_codes, "p": p_codes, "q": qty1})
+        # 날짜 라벨은 [:10] 정규화 후 겹칠 수 있으므로 누적 합산
+        for (d, l), q in codes.groupby(["d", "l"], sort=False)["q"].sum().items():
+            key = (d_labels[d], l_labels[l])
+            self.slot_total[key] = self.slot_total.get(key, 0) + int(q)
+        for (d, l, p), q in codes.groupby(["d", "l", "p"], sort=False)["q"].sum().items():
+            key = (d_labels[d], l_labels[l], p_labels[p])
+            self.slot_item_qty[key] = self.slot_item_qty.get(key, 0) + int(q)
+
+        d_arr, l_arr, p_arr = np.asarray(d_labels, dtype=object), np.asarray(l_labels, dtype=object), np.asarray(p_labels, dtype=object)
+        for d, l, p, q, plt in zip(d_arr[d_codes], l_arr[l_codes], p_arr[p_codes], qty1.tolist(), plts.tolist()):
+            self.slot_rows.setdefault((d, l), []).append({"name": p, "qty_1차": int(q), "plt": int(plt)})
+
+        self._build_due_profile(d_codes, d_labels, p_codes, p_labels, qty1)
+
+        if "product_name" in self.columns:
+            self._flags_by_name = {p: product_flags(p) for p in p_labels}
+            for code, pos in codes.groupby("p", sort=False).indices.items():
+                name = p_labels[code]
+                prev = self._product_pos.get(name)
+                self._product_pos[name] = pos if prev is None else np.sort(np.concatenate([prev, pos]))
+
+    def _build_due_profile(
+        self,
+        d_codes: np.ndarray,
+        d_labels: List[str],
+        p_codes: np.ndarray,
+        p_labels: List[str],
+        qty1: np.ndarray,
+    ) -> None:
+        """품목 코드별 마지막 납기일(qty_0차 > 0), 첫/마지막 생산일(qty_1차 > 0)을 날짜 순위 배열로 1회 계산"""
+        self._date_labels = sorted(set(d_labels))
+        rank_of = {d: i for i, d in enumerate(self._date_labels)}
+        d_rank = np.array([rank_of[d] for d in d_labels], dtype=np.int64)[d_codes]
+        self.last_plan_date = self._date_labels[-1] if self._date_labels else None
+
+        n_codes = len(p_labels)
+        self._due_last = np.full(n_codes, -1, dtype=np.int64)
+        self._prod_first = np.full(n_codes, len(self._date_labels), dtype=np.int64)
+        self._prod_last = np.full(n_codes, -1, dtype=np.int64)
+        if "qty_0차" in self.columns:
+            due = pd.to_numeric(self.plan_df["qty_0차"], errors="coerce").fillna(0).to_numpy() > 0
+            np.maximum.at(self._due_last, p_codes[due], d_rank[due])
+            if due.any():
+                self.last_due_date = self._date_labels[int(d_rank[due].max())]
+        prod = qty1 > 0
+        np.minimum.at(self._prod_first, p_codes[prod], d_rank[prod])
+        np.maximum.at(self._prod_last, p_codes[prod], d_rank[prod])
+
+        # 같은 라벨로 정규화된 코드가 여럿이면 첫 코드로 합침
+        for code, name in enumerate(p_labels):
+            first = self._product_code.setdefault(name, code)
+            if first != code:
+                self._due_last[first] = max(self._due_last[first], self._due_last[code])
+                self._prod_first[first] = min(self._prod_first[first], self._prod_first[code])
+                self._prod_last[first] = max(self._prod_last[first], self._prod_last[code])
+
+    @property
+    def horizon_end(self) -> Optional[str]:
+        """미래 확장 상한: 마지막 납기일, 납기가 없으면 마지막 계획일"""
+        return self.last_due_date or self.last_plan_date
+
+    def last_due(self, product_name: Any) -> Optional[str]:
+        """품목의 마지막 납기일(qty_0차 > 0인 마지막 plan_date)"""
+        code = self._product_code.get(str(product_name))
+        if code is None or self._due_last[code] < 0:
+            return None
+        return self._date_labels[self._due_last[code]]
+
+    def production_span(self, product_name: Any) -> Tuple[Optional[str], Optional[str]]:
+        """품목의 (첫 생산일, 마지막 생산일) (qty_1차 > 0 기준, 스냅샷 원본 기준)"""
+        code = self._product_code.get(str(product_name))
+        if code is None or self._prod_last[code] < 0:
+            return None, None
+        return self._date_labels[self._prod_first[code]], self._date_labels[self._prod_last[code]]
+
+    def dates(self) -> List[str]:
+        """인덱스에 있는 날짜 (정렬)"""
+        return sorted({d for d, _ in self.slot_total})
+
+    def apply_move(self, product_name: str, from_loc: str, to_loc: str, qty: int, plt: Optional[int] = None) -> None:
+        """승인된 이동을 (날짜, 라인) 합계/품목 수량/행 목록/product_rows()에 반영
+        (월 단위 평준화처럼 이동을 누적해 갈 때 사용 → 뒤 슬롯의 2단계 누적 여유도 이동 후 수량 기준).
+        납기 프로파일(last_due/production_span)은 스냅샷 원본 기준 그대로, 누적 납기 검증은 DueLedger가 추적.
+        """
+        qty = int(qty)
+        name = str(product_name)
+        (fd, fl), (td, tl) = [tuple(x.split("_", 1)) for x in (from_loc, to_loc)]
+        fd, td = fd[:10], td[:10]
+
+        self.slot_total[(fd, fl)] = self.slot_total.get((fd, fl), 0) - qty
+        self.slot_total[(td, tl)] = self.slot_total.get((td, tl), 0) + qty
+        self.slot_item_qty[(fd, fl, name)] = self.slot_item_qty.get((fd, fl, name), 0) - qty
+        self.slot_item_qty[(td, tl, name)] = self.slot_item_qty.get((td, tl, name), 0) + qty
+
+        left = qty
+        for row in self.slot_rows.get((fd, fl), []):
+            if left <= 0:
+                break
+            if row["name"] == name and row["qty_1차"] > 0:
+                take = min(left, row["qty_1차"])
+                row["qty_1차"] -= take
+                left -= take
+                plt = plt or row["plt"]
+
+        dest = self.slot_rows.setdefault((td, tl), [])
+        row = next((r for r in dest if r["name"] == name), None)
+        if row is None:
+            dest.append({"name": name, "qty_1차": qty, "plt": int(plt or 1)})
+        else:
+            row["qty_1차"] += qty
+
+        self._move_product_rows(name, (fd, fl), (td, tl), qty)
+
+    def _move_product_rows(self, name: str, src: Tuple[str, str], dst: Tuple[str, str], qty: int) -> None:
+        """품목 행 사본에 이동 반영 (출발 행들에서 앞에서부터 차감, 도착 행이 없으면 qty_0차 0인 행 추가)"""
+        df = self._moved_rows.get(name)
+        if df is None:
+            df = self.product_rows(name)
+            if df.empty or "qty_1차" not in df.columns:
+                return
+            df = df.reset_index(drop=True)
+            df["qty_1차"] = pd.to_numeric(df["qty_1차"], errors="coerce").fillna(0).astype(np.int64)
+
+        d = df["plan_date"].astype(str).str[:10].to_numpy()
+        ln = df["line"].astype(str).to_numpy()
+        q = df["qty_1차"].to_numpy(dtype=np.int64, copy=True)
+        left = qty
+        for i in np.flatnonzero((d == src[0]) & (ln == src[1]) & (q > 0)):
+            take = min(left, int(q[i]))
+            q[i] -= take
+            left -= take
+            if left <= 0:
+                break
+        hit = np.flatnonzero((d == dst[0]) & (ln == dst[1]))
+        if len(hit):
+            q[hit[0]] += qty
+        df = df.assign(qty_1차=q)
+        if not len(hit):
+            new = df.iloc[[0]].assign(plan_date=dst[0], line=dst[1], qty_1차=qty)
+            if "qty_0차" in new.columns:
+                new = new.assign(qty_0차=0)
+            df = pd.concat([df, new], ignore_index=True)
+        self._moved_rows[name] = df
+
+    def flags(self, product_name: Any) -> Tuple[bool, bool]:
+        """품목 (T6, A2XX) 플래그 (인덱스에 없으면 즉석 계산)"""
+        cached = self._flags_by_name.get(str(product_name))
+        return cached if cached is not None else product_flags(product_name)
+
+    def slot_qty(self, date_str: str, line: str) -> int:
+        """(날짜, 라인) qty_1차 합"""
+        return self.slot_total.get((str(date_str)[:10], line), 0)
+
+    def item_qty(self, date_str: str, line: str, product_name: str) -> int:
+        """(날짜, 라인, 품목) qty_1차 합"""
+        return self.slot_item_qty.get((str(date_str)[:10], line, str(product_name)), 0)
+
+    def rows(self, date_str: str, line: str) -> List[Dict[str, Any]]:
+        """(날짜, 라인)에 찍힌 행 목록 (원본 순서 유지)"""
+        return self.slot_rows.get((str(date_str)[:10], line), [])
+
+    def slot_items(self, date_str: str, line: str) -> Dict[str, int]:
+        """(날짜, 라인)의 품목별 qty_1차 합 (행 목록 기준, 처음 나온 순서 유지)"""
+        out: Dict[str, int] = {}
+        for row in self.rows(date_str, line):
+            out[row["name"]] = out.get(row["name"], 0) + int(row["qty_1차"])
+        return out
+
+    def product_rows(self, product_name: str) -> pd.DataFrame:
+        """품목의 전체 행 (plan_df 부분 프레임, apply_move로 옮긴 품목은 이동 반영 사본)"""
+        moved = self._moved_rows.get(str(product_name))
+        if moved is not None:
+            return moved
+        pos = self._product_pos.get(str(product_name))
+        if pos is None:
+            return self.plan_df.iloc[0:0]
+        return self.plan_df.iloc[pos]
+
+
+# ========================================================================
+# 가동일 달력 (plan_df 스냅샷당 1회 구축 → bisect 조회)
+# ========================================================================
+
+class WorkdayCalendar:
+    """DB is_workday 기반 가동일 달력.
+    - 가동일은 정렬된 ordinal 배열로 보관하고 bisect로 "다음 N개/이전 N개"를 조회
+    - is_workday는 날짜별 플래그 dict로 O(1) 조회 (날짜별 첫 행 값 기준)
+    """
+
+    def __init__(self, plan_df: pd.DataFrame):
+        # is_workday가 없으면 "가동일 체크 불가"로 보고 is_workday는 True, 가동일 목록은 빈 리스트
+        self.has_flags = (not plan_df.empty) and ("is_workday" in plan_df.columns)
+        self._flags: Dict[str, bool] = {}
+        self._ordinals: List[int] = []
+        self._dates: List[str] = []
+
+        if not self.has_flags:
+            return
+
+        db_dates = plan_df[["plan_date", "is_workday"]].drop_duplicates("plan_date")
+        for d, v in zip(db_dates["plan_date"].tolist(), db_dates["is_workday"].tolist()):
+            self._flags[str(d)[:10]] = _coerce_is_workday(v)
+
+        workdays = sorted(d for d, ok in self._flags.items() if ok)
+        self._dates = workdays
+        self._ordinals = [_safe_date(d).toordinal() for d in workdays]
+
+    def is_workday(self, date_str: str) -> bool:
+        """특정 날짜가 가동일인지 확인 (DB에 없는 날짜는 비가동)"""
+        if not self.has_flags:
+            return True
+        return self._flags.get(str(date_str)[:10], False)
+
+    def next_workdays(self, start_date_str: str, days_count: int = 10) -> List[str]:
+        """start_date(포함) 이후 가동일 최대 days_count개"""
+        i = bisect_left(self._ordinals, _safe_date(start_date_str).toordinal())
+        return self._dates[i : i + max(int(days_count), 0)]
+
+    def prev_workdays(self, start_date_str: str, days_count: int = 10, today=None) -> List[str]:
+        """start_date(미포함) 이전 가동일 최대 days_count개 (today 이하는 제외)"""
+        hi = bisect_left(self._ordinals, _safe_date(start_date_str).toordinal())
+        lo = bisect_right(self._ordinals, today.toordinal()) if today else 0
+        return self._dates[max(lo, hi - max(int(days_count), 0)) : hi] if hi > lo else []
+
+    def workdays(self, start_date_str: str, direction="future", days_count=10, today=None) -> List[str]:
+        if direction == "future":
+            return self.next_workdays(start_date_str, days_count)
+        return self.prev_workdays(start_date_str, days_count, today=today)
+
+
+# ========================================================================
+# 품목별 누적 납기 원장 (이동 검증용)
+# ========================================================================
+
+class _RangeMinTree:
+    """구간 덧셈 + 최솟값 lazy segment tree (누적 여유 cumsum1-cumsum0 보관용)"""
+
+    def __init__(self, values: List[int]):
+        self.n = len(values)
+        size = 1
+        while size < max(self.n, 1):
+            size *= 2
+        self.size = size
+        self.mn: List[float] = [float("inf")] * (2 * size)
+        self.lz: List[int] = [0] * (2 * size)
+        for i, v in enumerate(values):
+            self.mn[size + i] = int(v)
+        for i in range(size - 1, 0, -1):
+            self.mn[i] = min(self.mn[2 * i], self.mn[2 * i + 1])
+
+    def copy(self) -> "_RangeMinTree":
+        other = _RangeMinTree.__new__(_RangeMinTree)
+        other.n, other.size = self.n, self.size
+        other.mn, other.lz = list(self.mn), list(self.lz)
+        return other
+
+    def add(self, lo: int, hi: int, delta: int, node: int = 1, nl: int = 0, nr: Optional[int] = None) -> None:
+        """[lo, hi) 구간에 delta 더하기"""
+        if nr is None:
+            nr = self.size
+        if hi <= nl or nr <= lo or lo >= hi:
+            return
+        if lo <= nl and nr <= hi:
+            self.mn[node] += delta
+            self.lz[node] += delta
+            return
+        mid = (nl + nr) // 2
+        self.add(lo, hi, delta, 2 * node, nl, mid)
+        self.add(lo, hi, delta, 2 * node + 1, mid, nr)
+        self.mn[node] = min(self.mn[2 * node], self.mn[2 * node + 1]) + self.lz[node]
+
+    def first_below(self, threshold: int) -> Optional[int]:
+        """값이 threshold 미만인 첫 위치 (없으면 None)"""
+        if self.mn[1] >= threshold:
+            return None
+        node, acc = 1, 0
+        while node < self.size:
+            acc += self.lz[node]
+            left = 2 * node
+            node = left if self.mn[left] + acc < threshold else left + 1
+        return node - self.size if node - self.size < self.n else None
+
+
+class DueLedger:
+    """품목별 일자 qty_0차/qty_1차 원장.
+    - 품목을 처음 조회할 때 NumPy 배열(일자별 수량 + 누적합)로 구축
+    - 누적 여유(cumsum1 - cumsum0)는 _RangeMinTree로 보관 → 이동 1건 검증/반영이 O(log n)
+    - 승인된 이동은 apply_move()로 누적 반영되어, 같은 품목의 다음 이동 검증에 포함됨
+    - fork(): 품목 원장을 공유하다가 어느 한쪽이 그 품목을 처음 검증/반영할 때 복사 (copy-on-write)
+    """
+
+    def __init__(self, plan_index: PlanIndex):
+        self.plan_index = plan_index
+        self.enabled = {"product_name", "plan_date", "qty_0차", "qty_1차"}.issubset(plan_index.columns)
+        self._products: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._shared: Set[str] = set()
+
+    def fork(self) -> "DueLedger":
+        """현재 누적 상태의 독립 사본 (품목 원장은 첫 사용 때 복사)"""
+        other = DueLedger.__new__(DueLedger)
+        other.plan_index = self.plan_index
+        other.enabled = self.enabled
+        other._products = dict(self._products)
+        built = {name for name, p in self._products.items() if p is not None}
+        other._shared = set(built)
+        self._shared |= built
+        return other
+
+    def _own(self, name: str) -> Optional[Dict[str, Any]]:
+        p = self._product(name)
+        if p is not None and name in self._shared:
+            p = {
+                "dates": list(p["dates"]),
+                "pos": dict(p["pos"]),
+                "qty0": p["qty0"].copy(),
+                "qty1": p["qty1"].copy(),
+                "tree": p["tree"].copy(),
+            }
+            self._products[name] = p
+            self._shared.discard(name)
+        return p
+
+    def _build(self, dates: List[str], qty0: np.ndarray, qty1: np.ndarray) -> Dict[str, Any]:
+        cum0 = np.cumsum(qty0)
+        cum1 = np.cumsum(qty1)
+        return {
+            "dates": dates,
+            "pos": {d: i for i, d in enumerate(dates)},
+            "qty0": qty0,
+            "qty1": qty1,
+            "tree": _RangeMinTree((cum1 - cum0).tolist()),
+        }
+
+    def _product(self, name: str) -> Optional[Dict[str, Any]]:
+        if name in self._products:
+            return self._products[name]
+
+        entry = None
+        df = self.plan_index.product_rows(name)
+        if self.enabled and not df.empty:
+            daily = pd.DataFrame(
+                {
+                    "plan_date": df["plan_date"].astype(str).str[:10],
+                    "qty_0차": pd.to_numeric(df["qty_0차"], errors="coerce").fillna(0).astype(int),
+                    "qty_1차": pd.to_numeric(df["qty_1차"], errors="coerce").fillna(0).astype(int),
+                }
+            ).groupby("plan_date", sort=True)[["qty_0차", "qty_1차"]].sum()
+            entry = self._build(
+                daily.index.tolist(),
+                np.array(daily["qty_0차"], dtype=np.int64),
+                np.array(daily["qty_1차"], dtype=np.int64),
+            )
+        self._products[name] = entry
+        return entry
+
+    def _ensure_date(self, name: str, date_str: str) -> Dict[str, Any]:
+        """원장에 없는 날짜로 이동이 반영될 때만 해당 날짜(수량 0)를 끼워 넣고 재구축"""
+        p = self._products[name]
+        if date_str in p["pos"]:
+            return p
+        i = bisect_left(p["dates"], date_str)
+        # 기존 누적 여유(이동 반영분 포함)는 일자 수량에서 다시 계산되므로 그대로 재구축해도 된다
+        p = self._build(
+            p["dates"][:i] + [date_str] + p["dates"][i:],
+            np.insert(p["qty0"], i, 0),
+            np.insert(p["qty1"], i, 0),
+        )
+        self._products[name] = p
+        return p
+
+    @staticmethod
+    def _shift_range(p: Dict[str, Any], from_date: str, to_date: str) -> Tuple[int, int, int]:
+        """from→to 이동 시 누적 여유가 변하는 구간 [lo, hi)와 부호"""
+        f = bisect_left(p["dates"], from_date)
+        t = bisect_left(p["dates"], to_date)
+        if f < t:
+            return f, t, -1  # 연기: from~to 직전까지 누적 생산 감소
+        if t < f:
+            return t, f, 1  # 당김: to~from 직전까지 누적 생산 증가
+        return 0, 0, 0
+
+    def check_move(self, item_name: str, from_date: str, to_date: str, qty_move: int) -> Tuple[bool, Optional[str]]:
+        """이동을 적용했을 때 품목별 누적 납기(cumsum1>=cumsum0)가 모든 날짜에서 유지되는지 검증"""
+        p = self._own(item_name)  # 검증도 트리를 잠시 변경하므로 공유 중이면 복사
+        if p is None:
+            return True, None
+
+        qty_move = int(qty_move)
+        i_from = p["pos"].get(from_date)
+        src = int(p["qty1"][i_from]) if i_from is not None else 0
+        # 음수 생산량은 불가 (같은 날짜 타라인 이송은 일자 합계가 그대로라 해당 없음)
+        if from_date != to_date and src - qty_move < 0:
+            return False, from_date
+
+        lo, hi, sign = self._shift_range(p, from_date, to_date)
+        tree: _RangeMinTree = p["tree"]
+        tree.add(lo, hi, sign * qty_move)
+        bad = tree.first_below(0)
+        tree.add(lo, hi, -sign * qty_move)
+        if bad is None:
+            return True, None
+        return False, p["dates"][bad]
+
+    def apply_move(self, item_name: str, from_date: str, to_date: str, qty_move: int) -> None:
+        """승인된 이동을 원장에 누적 반영"""
+        p = self._own(item_name)
+        if p is None:
+            return
+        p = self._ensure_date(item_name, from_date)
+        p = self._ensure_date(item_name, to_date)
+
+        qty_move = int(qty_move)
+        lo, hi, sign = self._shift_range(p, from_date, to_date)
+        p["tree"].add(lo, hi, sign * qty_move)
+        p["qty1"][p["pos"][from_date]] -= qty_move
+        p["qty1"][p["pos"][to_date]] += qty_move
+
+
+# ========================================================================
+# CAPA 원장 (날짜×라인 슬롯별 잔여 CAPA)
+# ========================================================================
+
+class CapaLedger:
+    """날짜×라인 슬롯별 CAPA 원장 (step3에서 구축 → step6/폴백/이벤트 재계산이 공유).
+    - 슬롯은 정수 인덱스(추가 순서 유지), (날짜, 라인) → 인덱스 조회는 slot()으로 1회
+    - current/max/remaining은 NumPy 배열, reserve/release는 O(1)
+    - fork(): 배열을 공유하다가 어느 한쪽이 처음 쓸 때 복사 (copy-on-write)
+    - snapshot()/rollback(): 변경 기록(undo log)을 되감아 시뮬레이션 이전 상태로 복원
+    remaining 등 배열은 읽기 전용으로 쓰고, 변경은 반드시 메서드로 한다 (기록/복사 보장).
+    """
+
+    def __init__(self, slots: Optional[List[Tuple[str, str, int, int]]] = None):
+        """slots: (날짜, 라인, 현재 생산량, CAPA 상한) 목록"""
+        slots = slots or []
+        self.dates: List[str] = [s[0] for s in slots]
+        self.lines: List[str] = [s[1] for s in slots]
+        self._index: Dict[Tuple[str, str], int] = {(d, l): i for i, (d, l, _, _) in enumerate(slots)}
+        self.current = np.array([int(s[2]) for s in slots], dtype=np.int64)
+        self.max = np.array([int(s[3]) for s in slots], dtype=np.int64)
+        self.remaining = self.max - self.current
+        # 가동률은 구축 시점 기준 (이벤트로 늘어난 CAPA는 반영하지 않음)
+        self.usage_rate = np.divide(
+            self.current * 100.0, self.max, out=np.zeros(len(slots)), where=self.max != 0
+        )
+        self._shared = False
+        self._log: List[Tuple[str, int, int]] = []  # (종류, 슬롯, 변화량)
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def slot(self, date_str: str, line: str) -> Optional[int]:
+        return self._index.get((date_str, line))
+
+    def key(self, i: int) -> str:
+        """보고/메시지용 'YYYY-MM-DD_라인' 표기"""
+        return f"{self.dates[i]}_{self.lines[i]}"
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """보고서/프롬프트용 슬롯 목록 (추가 순서)"""
+        return [
+            {
+                "date": self.dates[i],
+                "line": self.lines[i],
+                "current": int(self.current[i]),
+                "remaining": int(self.remaining[i]),
+                "max": int(self.max[i]),
+                "usage_rate": float(self.usage_rate[i]),
+            }
+            for i in range(len(self.dates))
+        ]
+
+    # ---------------- copy-on-write ----------------
+    def fork(self) -> "CapaLedger":
+        """현재 상태의 독립 사본 (배열은 첫 쓰기 때 복사, 변경 기록은 새로 시작)"""
+        other = CapaLedger.__new__(CapaLedger)
+        other.__dict__.update(self.__dict__)
+        other._log = []
+        self._shared = other._shared = True
+        return other
+
+    def _own(self) -> None:
+        if self._shared:
+            self.dates = list(self.dates)
+            self.lines = list(self.lines)
+            self._index = dict(self._index)
+            self.current = self.current.copy()
+            self.max = self.max.copy()
+            self.remaining = self.remaining.copy()
+            self.usage_rate = self.usage_rate.copy()
+            self._shared = False
+
+    # ---------------- 변경 ----------------
+    def reserve(self, i: int, qty: int) -> None:
+        self._own()
+        self.remaining[i] -= int(qty)
+        self._log.append(("remaining", i, -int(qty)))
+
+    def release(self, i: int, qty: int) -> None:
+        self._own()
+        self.remaining[i] += int(qty)
+        self._log.append(("remaining", i, int(qty)))
+
+    def add_capacity(self, i: int, inc: int) -> None:
+        """잔업/특근 등으로 유효 CAPA 증가 (max/remaining 함께)"""
+        self._own()
+        self.max[i] += int(inc)
+        self.remaining[i] += int(inc)
+        self._log.append(("capacity", i, int(inc)))
+
+    def add_slot(self, date_str: str, line: str, current: int, max_capa: int) -> int:
+        i = self.slot(date_str, line)
+        if i is not None:
+            return i
+        self._own()
+        i = len(self.dates)
+        self.dates.append(date_str)
+        self.lines.append(line)
+        self._index[(date_str, line)] = i
+        self.current = np.append(self.current, int(current))
+        self.max = np.append(self.max, int(max_capa))
+        self.remaining = np.append(self.remaining, int(max_capa) - int(current))
+        self.usage_rate = np.append(self.usage_rate, (current * 100.0 / max_capa) if max_capa else 0.0)
+        self._log.append(("slot", i, 0))
+        return i
+
+    # ---------------- 스냅샷/롤백 ----------------
+    def snapshot(self) -> int:
+        return len(self._log)
+
+    def rollback(self, token: int) -> None:
+        """snapshot() 이후의 변경을 역순으로 되돌림"""
+        if len(self._log) <= token:
+            return
+        self._own()
+        while len(self._log) > token:
+            kind, i, delta = self._log.pop()
+            if kind == "remaining":
+                self.remaining[i] -= delta
+            elif kind == "capacity":
+                self.max[i] -= delta
+                self.remaining[i] -= delta
+            else:
+                del self._index[(self.dates[i], self.lines[i])]
+                self.dates.pop()
+                self.lines.pop()
+                self.current = self.current[:i]
+                self.max = self.max[:i]
+                self.remaining = self.remaining[:i]
+                self.usage_rate = self.usage_rate[:i]
+
+
+# ========================================================================
+# 엔진 컨텍스트 (요청 단위, 불변)
+# ========================================================================
+
+# 진입점에서 today/capa_limits를 넘기지 않았을 때의 기준값 (EngineContext.for_request에서만 적용)
+DEFAULT_TODAY = date(2026, 1, 5)
+DEFAULT_CAPA_LIMITS: Mapping[str, int] = MappingProxyType({"조립1": 3300, "조립2": 3700, "조립3": 3600})
+
+
+@dataclass(frozen=True)
+class EngineContext:
+    """요청 1건의 기준값 묶음 (today, CAPA 상한, 인덱스, 달력).
+    - 모듈 전역 대신 각 단계에 명시적으로 전달 → 여러 스레드/프로세스에서 동시에 실행해도 서로 덮어쓰지 않음
+    - capa_limits는 읽기 전용 매핑. plan_index/calendar는 스냅샷 단위로 공유되는 객체를 그대로 참조
+      (level_capa_month처럼 인덱스에 이동을 반영하는 쪽은 전용 인덱스로 별도 컨텍스트를 만든다)
+    - today가 None이면 TODAY 이전/당일 제한을 적용하지 않음
+    """
+
+    today: Optional[date]
+    capa_limits: Mapping[str, int]
+    plan_index: PlanIndex
+    calendar: WorkdayCalendar
+
+    def __post_init__(self):
+        if not isinstance(self.capa_limits, MappingProxyType):
+            object.__setattr__(self, "capa_limits", MappingProxyType(dict(self.capa_limits)))
+
+    def __reduce__(self):
+        return (EngineContext, (self.today, dict(self.capa_limits), self.plan_index, self.calendar))
+
+    @property
+    def today_str(self) -> Optional[str]:
+        return self.today.strftime("%Y-%m-%d") if self.today else None
+
+    @classmethod
+    def build(
+        cls,
+        plan_df: pd.DataFrame,
+        today: Optional[date] = None,
+        capa_limits: Optional[Mapping[str, int]] = None,
+        plan_index: Optional[PlanIndex] = None,
+        calendar: Optional[WorkdayCalendar] = None,
+    ) -> "EngineContext":
+        return cls(
+            today=today,
+            capa_limits=capa_limits or {},
+            plan_index=plan_index if plan_index is not None else PlanIndex(plan_df),
+            calendar=calendar if calendar is not None else WorkdayCalendar(plan_df),
+        )
+
+    @classmethod
+    def for_request(
+        cls,
+        plan_df: pd.DataFrame,
+        today: Optional[date] = None,
+        capa_limits: Optional[Mapping[str, int]] = None,
+        plan_index: Optional[PlanIndex] = None,
+        calendar: Optional[WorkdayCalendar] = None,
+    ) -> "EngineContext":
+        """진입점용 build: today/capa_limits가 None이면 DEFAULT_TODAY/DEFAULT_CAPA_LIMITS"""
+        return cls.build(
+            plan_df,
+            today=DEFAULT_TODAY if today is None else today,
+            capa_limits=DEFAULT_CAPA_LIMITS if capa_limits is None else capa_limits,
+            plan_index=plan_index,
+            calendar=calendar,
+        )
+
+
+def _resolve_context(
+    ctx: Optional[EngineContext],
+    plan_df: pd.DataFrame,
+    plan_index: Optional[PlanIndex] = None,
+    calendar: Optional[WorkdayCalendar] = None,
+) -> EngineContext:
+    """단계 함수 공통: ctx가 없으면(단독 호출) plan_df로 구축, 명시한 plan_index/calendar가 있으면 그것을 우선"""
+    if ctx is None:
+        return EngineContext.build(plan_df, plan_index=plan_index, calendar=calendar)
+    if (plan_index is not None and plan_index is not ctx.plan_index) or (calendar is not None and calendar is not ctx.calendar):
+        return replace(
+            ctx,
+            plan_index=plan_index if plan_index is not None else ctx.plan_index,
+            calendar=calendar if calendar is not None else ctx.calendar,
+        )
+    return ctx
+
+
 def is_workday_in_db(plan_df: pd.DataFrame, date_str: str) -> bool:
-    """특정 날짜가 가동일인지 확인 (is_workday 컬럼 사용)"""
-    if plan_df.empty or "is_workday" not in plan_df.columns:
-        # is_workday가 없으면 "가동일 체크 불가"로 보고 True 처리(운영 정책에 따라 False로 바꿔도 됨)
-        return True
+    """특정 날짜가 가동일인지 확인 (is_workday 컬럼 사용)
+    - 반복 호출 시에는 WorkdayCalendar를 한 번 만들어 is_workday()를 쓸 것
+    """
+    return WorkdayCalendar(plan_df).is_workday(date_str)
 
-    date_info = plan_df[plan_df["plan_date"] == date_str]
-    if date_info.empty:
-        return False
-    return _coerce_is_workday(date_info.iloc[0]["is_workday"])
-def get_workdays_from_db(plan_df: pd.DataFrame, start_date_str: str, direction="future", days_count=10) -> List[str]:
-    """DB의 is_workday 기반으로 가동일 리스트 반환"""
-    if plan_df.empty or "is_workday" not in plan_df.columns:
-        return []
 
-    db_dates = plan_df[["plan_date", "is_workday"]].drop_duplicates().sort_values("plan_date").copy()
-    db_dates["__workday"] = db_dates["is_workday"].apply(_coerce_is_workday)
+def get_workdays_from_db(plan_df: pd.DataFrame, start_date_str: str, direction="future", days_count=10, today=None) -> List[str]:
+    """DB의 is_workday 기반으로 가동일 리스트 반환
+    - 과거: today 이후만 (고정기간/정책에 맞게 조정 가능)
+    """
+    return WorkdayCalendar(plan_df).workdays(start_date_str, direction=direction, days_count=days_count, today=today)
 
-    if direction == "future":
-        available = db_dates[(db_dates["plan_date"] >= start_date_str) & (db_dates["__workday"] == True)]
-        return available["plan_date"].head(days_count).tolist()
 
-    # 과거: TODAY 이후만 (고정기간/정책에 맞게 조정 가능)
-    today_str = TODAY.strftime("%Y-%m-%d") if TODAY else "1900-01-01"
-    available = db_dates[
-        (db_dates["plan_date"] < start_date_str)
-        & (db_dates["plan_date"] > today_str)
-        & (db_dates["__workday"] == True)
-    ]
-    return available["plan_date"].tail(days_count).tolist()
 def _normalize_line_guess(question: str) -> Optional[str]:
     if "조립1" in question:
         return "조립1"
@@ -129,6 +845,7 @@ def _suggest_capa_events_auto(
     shortfall_qty: int,
     plt_base: int,
     max_days: int = 2,
+    calendar: Optional[WorkdayCalendar] = None,
 ) -> List[Dict[str, Any]]:
     """달성률이 너무 낮고(CAPA 부족) 미달이 남을 때, 잔업/특근 CAPA 상향을 자동으로 제안.
     - 이벤트는 '추가 생산'이 아니라 '수용 CAPA 증가'로만 처리(Δ 표에 넣지 않음).
@@ -136,7 +853,10 @@ def _suggest_capa_events_auto(
     if shortfall_qty <= 0:
         return []
 
-    workdays = get_workdays_from_db(plan_df, start_date_str=question_date, direction="future", days_count=50)
+    if calendar is None:
+        calendar = WorkdayCalendar(plan_df)
+
+    workdays = calendar.next_workdays(question_date, days_count=50)
     candidates = [d for d in workdays if d > question_date][: max_days]
     if not candidates:
         return []
@@ -157,8 +877,68 @@ def _suggest_capa_events_auto(
         events.append({"date": candidates[1], "line": target_line, "type": "잔업", "delta_capa": second})
     return events
 
+EVENT_SEARCH_LIMIT = 24  # 평가할 이벤트 조합 수 상한
+EVENT_SEARCH_DAYS = 3  # 후보일: 질문일 이후 가동일 N일
+EVENT_SEARCH_STEPS = 4  # 물량 단계: 부족분의 1/N 단위 (PLT 올림)
+EVENT_SEARCH_WORKERS = 4  # 조합 병렬 평가 스레드 수 (PlanIndex/달력/기준 원장은 읽기 전용 공유)
+EVENT_SEARCH_MIN_PARALLEL = 6  # 후보가 이보다 적으면 스레드 없이 순차 평가
+
+
+def _capa_event_candidates(
+    plan_df: pd.DataFrame,
+    question_date: str,
+    target_line: str,
+    shortfall_qty: int,
+    plt_base: int,
+    calendar: Optional[WorkdayCalendar] = None,
+    limit: int = EVENT_SEARCH_LIMIT,
+    max_days: int = EVENT_SEARCH_DAYS,
+    steps: int = EVENT_SEARCH_STEPS,
+) -> List[List[Dict[str, Any]]]:
+    """잔업/특근 조합 후보 (날짜, 종류, 물량) 목록.
+    - 1일 단독 또는 2일 분할, 물량은 부족분(PLT 올림)의 1/steps 단위, 2일 분할은 합계가 부족분 이하인 조합만
+    - 종류는 기본 제안과 같이 앞 날짜 특근, 뒤 날짜 잔업
+    - 기본 제안(_suggest_capa_events_auto)을 맨 앞에, 나머지는 합계가 부족분에 가까운 순 → 이벤트 수 적은 순으로 limit개
+    """
+    if shortfall_qty <= 0 or limit <= 0:
+        return []
+    if calendar is None:
+        calendar = WorkdayCalendar(plan_df)
+
+    days = [d for d in calendar.next_workdays(question_date, days_count=50) if d > question_date][: max(1, max_days)]
+    if not days:
+        return []
+
+    plt_base = max(plt_base, 1)
+    need = _round_up_to_multiple(int(shortfall_qty), plt_base)
+    levels = sorted({_round_up_to_multiple(need * k // steps, plt_base) for k in range(1, steps + 1)} - {0})
+
+    def ev(d: str, kind: str, qty: int) -> Dict[str, Any]:
+        return {"date": d, "line": target_line, "type": kind, "delta_capa": qty}
+
+    combos: List[List[Dict[str, Any]]] = [[ev(d, "특근", q)] for d in days for q in levels]
+    for i, d1 in enumerate(days):
+        for d2 in days[i + 1:]:
+            combos.extend(
+                [ev(d1, "특근", q1), ev(d2, "잔업", q2)] for q1 in levels for q2 in levels if q1 + q2 <= need
+            )
+    combos.sort(key=lambda c: (abs(sum(e["delta_capa"] for e in c) - need), len(c)))
+
+    out: List[List[Dict[str, Any]]] = []
+    seen = set()
+    default = _suggest_capa_events_auto(plan_df, question_date, target_line, shortfall_qty, plt_base, calendar=calendar)
+    for combo in ([default] if default else []) + combos:
+        sig = tuple((e["date"], e["type"], e["delta_capa"]) for e in combo)
+        if sig in seen:
+            continue
+        seen.add(sig)
+        out.append(combo)
+        if len(out) >= limit:
+            break
+    return out
+
 def _apply_capa_events_to_status(
-    capa_status: Dict[str, Dict[str, Any]],
+    capa_status: CapaLedger,
     events: List[Dict[str, Any]],
     capa_limits: Dict[str, int],
 ):
@@ -169,12 +949,23 @@ def _apply_capa_events_to_status(
         inc = int(ev.get("delta_capa", 0) or 0)
         if inc <= 0:
             continue
-        key = f"{d}_{ln}"
-        if key not in capa_status:
-            base = int(capa_limits.get(ln, 0) or 0)
-            capa_status[key] = {"max": base, "remaining": base}
-        capa_status[key]["max"] = int(capa_status[key].get("max", 0) or 0) + inc
-        capa_status[key]["remaining"] = int(capa_status[key].get("remaining", 0) or 0) + inc
+        i = capa_status.slot(d, ln)
+        if i is None:
+            i = capa_status.add_slot(d, ln, 0, int(capa_limits.get(ln, 0) or 0))
+        capa_status.add_capacity(i, inc)
+
+def _format_capa_event_options_md(options: List[Dict[str, Any]], chosen: List[Dict[str, Any]]) -> str:
+    """search_capa_events 결과(Pareto 목록) → 보고서 표"""
+    if not options:
+        return ""
+    out = ["### 잔업/특근 조합 대안 (달성률 ↑ · 추가 CAPA ↓ 기준 최선)"]
+    out.append("| 선택 | 추가 CAPA | 달성률 | 이벤트 |")
+    out.append("|---|---:|---:|---|")
+    for opt in options:
+        mark = "✅" if opt["events"] == chosen else ""
+        evs = ", ".join(f"{e['date']} {e['type']} +{int(e['delta_capa']):,}" for e in opt["events"])
+        out.append(f"| {mark} | +{opt['extra_capa']:,} | {opt['achievement']:.1f}% | {evs} |")
+    return "\n".join(out) + "\n\n"
 
 def _format_capa_events_md(events: List[Dict[str, Any]]) -> str:
     if not events:
@@ -208,7 +999,7 @@ def _infer_target_line(question: str, plan_df: pd.DataFrame, question_date: str)
 
     # 그 외: 당일 qty_1차 합이 가장 큰 라인
     if "qty_1차" in date_data.columns:
-        line_qty = date_data.groupby("line")["qty_1차"].sum()
+        line_qty = date_data.groupby("line", observed=True)["qty_1차"].sum()
         if not line_qty.empty:
             return str(line_qty.idxmax())
 
@@ -219,37 +1010,41 @@ def _infer_target_line(question: str, plan_df: pd.DataFrame, question_date: str)
 # 1~3단계: 데이터 수사
 # ========================================================================
 
-def step1_list_current_stock(plan_df: pd.DataFrame, target_date: str, target_line: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
-    current = plan_df[(plan_df["plan_date"] == target_date) & (plan_df["line"] == target_line)].copy()
-    if current.empty:
+def step1_list_current_stock(
+    plan_df: pd.DataFrame,
+    target_date: str,
+    target_line: str,
+    plan_index: Optional[PlanIndex] = None,
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    if plan_index is None:
+        plan_index = PlanIndex(plan_df)
+
+    current = plan_index.rows(target_date, target_line)
+    if not current:
         return None, "해당 날짜/라인에 생산 계획이 없습니다."
 
-    if "qty_1차" not in current.columns or "plt" not in current.columns:
+    if "qty_1차" not in plan_index.columns or "plt" not in plan_index.columns:
         return None, "plan_df에 qty_1차 또는 plt 컬럼이 없습니다."
 
-    total = int(current["qty_1차"].sum())
-    items = []
-    for _, row in current.iterrows():
-        q = int(row.get("qty_1차", 0) or 0)
-        if q <= 0:
-            continue
-        items.append(
-            {
-                "name": row.get("product_name", ""),
-                "qty_1차": q,
-                "plt": int(row.get("plt", 1) or 1),
-            }
-        )
+    total = plan_index.slot_qty(target_date, target_line)
+    items = [dict(row) for row in current if row["qty_1차"] > 0]
 
     return {"date": target_date, "line": target_line, "total": total, "items": items}, None
 
 
-def step2_calculate_cumulative_slack(plan_df: pd.DataFrame, stock_result: Dict[str, Any]) -> List[Dict[str, Any]]:
+def step2_calculate_cumulative_slack(
+    plan_df: pd.DataFrame,
+    stock_result: Dict[str, Any],
+    plan_index: Optional[PlanIndex] = None,
+) -> List[Dict[str, Any]]:
     """
     각 품목의 누적 납기 여유 계산
     - cumsum 기준: qty_0차 vs qty_1차
     - 이동가능 max_movable 산출
     """
+    if plan_index is None:
+        plan_index = PlanIndex(plan_df)
+
     items_with_slack = []
     target_date = stock_result["date"]
 
@@ -274,7 +1069,7 @@ def step2_calculate_cumulative_slack(plan_df: pd.DataFrame, stock_result: Dict[s
 
     for item in stock_result["items"]:
         name = item["name"]
-        series = plan_df[plan_df["product_name"] == name].sort_values("plan_date").copy()
+        series = plan_index.product_rows(name).sort_values("plan_date").copy()
         if series.empty:
             continue
 
@@ -335,45 +1130,32 @@ def step3_analyze_destination_capacity(
     target_date: str,
     target_line: str,
     capa_limits: Dict[str, int],
-) -> Dict[str, Dict[str, Any]]:
+    plan_index: Optional[PlanIndex] = None,
+    calendar: Optional[WorkdayCalendar] = None,
+    ctx: Optional[EngineContext] = None,
+) -> CapaLedger:
     """
     CAPA 현황:
     - ✅ 같은날: 조립1/2/3 모두 (target_line 포함)
     - ✅ 동일라인 미래 가동일(최대 N개)  (단, 전체 납기/데이터 범위 밖으로는 확장하지 않음)
     - ✅ (옵션) 동일라인 과거 가동일(소수)  (단, TODAY(질문일) 이전/당일은 금지)
     """
-    capa_status: Dict[str, Dict[str, Any]] = {}
+    ctx = _resolve_context(ctx, plan_df, plan_index, calendar)
+    plan_index, calendar = ctx.plan_index, ctx.calendar
+
+    slots: List[Tuple[str, str, int, int]] = []
 
     # -------------------------------
     # (A) 데이터 기반 "미래 확장 상한" = 마지막 납기일(=qty_0차가 있는 마지막 날짜)
     #     - qty_0차가 없다면, plan_date 최대값을 상한으로 사용
     # -------------------------------
-    horizon_end = None
-    if (not plan_df.empty) and ("plan_date" in plan_df.columns):
-        if "qty_0차" in plan_df.columns:
-            tmp = plan_df.copy()
-            tmp["qty_0차"] = pd.to_numeric(tmp["qty_0차"], errors="coerce").fillna(0)
-            due_df = tmp[tmp["qty_0차"] > 0]
-            if not due_df.empty:
-                horizon_end = str(due_df["plan_date"].max())[:10]
-        if not horizon_end:
-            horizon_end = str(plan_df["plan_date"].max())[:10]
+    horizon_end = plan_index.horizon_end
 
     # -------------------------------
     # (B) 같은날 CAPA: 모든 라인 포함
     # -------------------------------
     for line in ["조립1", "조립2", "조립3"]:
-        cur = plan_df[(plan_df["plan_date"] == target_date) & (plan_df["line"] == line)]["qty_1차"].sum()
-        cur = int(cur) if pd.notna(cur) else 0
-        remaining = int(capa_limits[line] - cur)
-        capa_status[f"{target_date}_{line}"] = {
-            "date": target_date,
-            "line": line,
-            "current": cur,
-            "remaining": remaining,
-            "max": capa_limits[line],
-            "usage_rate": (cur / capa_limits[line] * 100) if capa_limits[line] else 0,
-        }
+        slots.append((target_date, line, plan_index.slot_qty(target_date, line), capa_limits[line]))
 
     # -------------------------------
     # (C) 동일라인 미래 가동일 후보
@@ -385,7 +1167,7 @@ def step3_analyze_destination_capacity(
 
     # DB is_workday 기준으로 horizon_end까지 가능한 미래 가동일을 넉넉히 모은 뒤
     # max_future_workdays개까지만 사용
-    future_candidates = get_workdays_from_db(plan_df, target_date, direction="future", days_count=400)
+    future_candidates = calendar.next_workdays(target_date, days_count=400)
     future_candidates = [d for d in future_candidates if str(d)[:10] != target_date]
     if horizon_end:
         future_candidates = [d for d in future_candidates if str(d)[:10] <= horizon_end]
@@ -398,62 +1180,45 @@ def step3_analyze_destination_capacity(
             d = (base + timedelta(days=i)).strftime("%Y-%m-%d")
             if horizon_end and d > horizon_end:
                 break
-            if is_workday_in_db(plan_df, d):
+            if calendar.is_workday(d):
                 future_workdays.append(d)
             if len(future_workdays) >= max_future_workdays:
                 break
 
     for d in future_workdays:
-        cur = plan_df[(plan_df["plan_date"] == d) & (plan_df["line"] == target_line)]["qty_1차"].sum()
-        cur = int(cur) if pd.notna(cur) else 0
-        remaining = int(capa_limits[target_line] - cur)
-        capa_status[f"{d}_{target_line}"] = {
-            "date": d,
-            "line": target_line,
-            "current": cur,
-            "remaining": remaining,
-            "max": capa_limits[target_line],
-            "usage_rate": (cur / capa_limits[target_line] * 100) if capa_limits[target_line] else 0,
-        }
+        slots.append((d, target_line, plan_index.slot_qty(d, target_line), capa_limits[target_line]))
 
     # -------------------------------
     # (D) 동일라인 과거 가동일 후보 (선행 생산)
     #     - 너무 많이 당기는 것을 방지: 5개 가동일만
-    #     - get_workdays_from_db가 "TODAY 이후만" 보장 (plan_date > today_str)
+    #     - prev_workdays가 "TODAY 이후만" 보장 (plan_date > today_str)
     # -------------------------------
-    past_workdays = get_workdays_from_db(plan_df, target_date, direction="past", days_count=5)
+    past_workdays = calendar.prev_workdays(target_date, days_count=5, today=ctx.today)
 
     for d in past_workdays:
         # 안전: target_date보다 과거만
         if str(d)[:10] >= target_date:
             continue
+        slots.append((d, target_line, plan_index.slot_qty(d, target_line), capa_limits[target_line]))
 
-        cur = plan_df[(plan_df["plan_date"] == d) & (plan_df["line"] == target_line)]["qty_1차"].sum()
-        cur = int(cur) if pd.notna(cur) else 0
-        remaining = int(capa_limits[target_line] - cur)
-        capa_status[f"{d}_{target_line}"] = {
-            "date": d,
-            "line": target_line,
-            "current": cur,
-            "remaining": remaining,
-            "max": capa_limits[target_line],
-            "usage_rate": (cur / capa_limits[target_line] * 100) if capa_limits[target_line] else 0,
-        }
-
-    return capa_status
+    return CapaLedger(slots)
 # ========================================================================
 # 4단계: 물리 제약 정리
 # ========================================================================
 
-def step4_prepare_constraint_info(items_with_slack: List[Dict[str, Any]], target_line: str) -> List[Dict[str, Any]]:
+def step4_prepare_constraint_info(
+    items_with_slack: List[Dict[str, Any]],
+    target_line: str,
+    plan_index: Optional[PlanIndex] = None,
+) -> List[Dict[str, Any]]:
     constraint_info = []
+    flags_of = plan_index.flags if plan_index is not None else product_flags
     for item in items_with_slack:
         if not item.get("movable"):
             continue
 
         name = item["name"]
-        is_t6 = "T6" in str(name).upper()
-        is_a2xx = "A2XX" in str(name).upper()
+        is_t6, is_a2xx = flags_of(name)
 
         if is_t6:
             possible_lines = [l for l in ["조립1", "조립2", "조립3"] if l != target_line]
@@ -491,7 +1256,7 @@ def step4_prepare_constraint_info(items_with_slack: List[Dict[str, Any]], target
 
 def build_ai_fact_report(
     constraint_info: List[Dict[str, Any]],
-    capa_status: Dict[str, Dict[str, Any]],
+    capa_status: CapaLedger,
     target_date: str,
     target_line: str,
     operation_mode: str,
@@ -512,7 +1277,7 @@ def build_ai_fact_report(
 
     fact.append("")
     fact.append("**목적지/출발지 CAPA 현황:**")
-    for _, st in capa_status.items():
+    for st in capa_status.rows():
         fact.append(f"- {st['date']} {st['line']}: 잔여 {st['remaining']:,}개 (가동률 {st['usage_rate']:.1f}%)")
 
     return "\n".join(fact)
@@ -532,6 +1297,21 @@ def _extract_json_from_text(text: str) -> Optional[Dict[str, Any]]:
         return None
 
 
+# LLM 호출 규약: (프롬프트, 타임아웃 초 또는 None) → 응답 텍스트. 실패는 예외로 알린다
+LLMCall = Callable[[str, Optional[float]], str]
+
+
+def _gemini_generate(prompt: str, timeout_sec: Optional[float], genai_key: str) -> str:
+    """기본 LLMCall: Gemini(AI_MODEL_NAME) 호출"""
+    genai.configure(api_key=genai_key)
+    model = genai.GenerativeModel(AI_MODEL_NAME)
+    if timeout_sec:
+        resp = model.generate_content(prompt, request_options={"timeout": timeout_sec})
+    else:
+        resp = model.generate_content(prompt)
+    return resp.text or ""
+
+
 def step5_ask_ai_strategy(
     fact_report: str,
     operation_mode: str,
@@ -541,11 +1321,20 @@ def step5_ask_ai_strategy(
     today_str: str,
     capa_target_pct: int,
     genai_key: str,
+    llm_cache: Optional[LLMCache] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    timeout_sec: Optional[float] = None,
+    llm: Optional[LLMCall] = None,
 ) -> Tuple[Optional[Dict[str, Any]], Optional[str], str]:
     """
     Returns: (ai_strategy or None, error or None, strategy_source)
+    - llm_cache: (모델, 프롬프트)가 같으면 저장된 응답을 재사용 (파싱 성공한 응답만 저장)
+      캐시 응답도 호출 측 step6에서 현재 CAPA 기준으로 다시 검증된다
+    - breaker: 열려 있으면(연속 실패 쿨다운 중) 캐시 미스 시 LLM을 호출하지 않고 AI_SOURCE_BLOCKED 반환
+      (결과 기록은 시간 초과까지 아는 호출 측에서 수행)
+    - timeout_sec: Gemini 요청 타임아웃 (호출 측 대기 예산과 같은 값)
+    - llm: LLM 호출 함수 (없으면 genai_key로 Gemini 호출). 지연/오류를 주입하는 가짜 LLM으로 교체 가능
     """
-    genai.configure(api_key=genai_key)
 
     if operation_mode == "reduce":
         operation_desc = "감축"
@@ -600,149 +1389,197 @@ def step5_ask_ai_strategy(
 {strategy_hint}
 """
 
+    if llm_cache is not None:
+        cached = llm_cache.get(AI_MODEL_NAME, prompt)
+        parsed = _extract_json_from_text(cached) if cached else None
+        if parsed:
+            return parsed, None, f"{AI_STRATEGY_SOURCE} · 캐시"
+
+    if breaker is not None and not breaker.allow():
+        return None, f"AI 호출 차단 (연속 실패로 쿨다운 중, {breaker.retry_in():.0f}초 후 재시도)", AI_SOURCE_BLOCKED
+
+    if llm is None:
+        llm = partial(_gemini_generate, genai_key=genai_key)
+
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash-exp")
-        resp = model.generate_content(prompt)
-        raw = (resp.text or "").strip()
+        raw = (llm(prompt, timeout_sec) or "").strip()
         parsed = _extract_json_from_text(raw)
         if not parsed:
-            return None, "AI 응답에서 JSON 파싱 실패", "AI 실패"
-        return parsed, None, "AI 하이브리드 전략 (Gemini 2.0 Flash)"
+            return None, "AI 응답에서 JSON 파싱 실패", AI_SOURCE_FAILED
+        if llm_cache is not None:
+            llm_cache.put(AI_MODEL_NAME, prompt, raw)
+        return parsed, None, AI_STRATEGY_SOURCE
     except Exception as e:
-        return None, f"AI 오류: {str(e)}", "AI 실패"
+        return None, f"AI 오류: {str(e)}", AI_SOURCE_FAILED
 
 
 # ========================================================================
 # 6단계: Python 검증 (AI moves를 안전하게 필터/조정)
 # ========================================================================
 
+def _split_loc(loc: str) -> Tuple[str, str]:
+    """'YYYY-MM-DD_라인' → (날짜, 라인), 형식이 아니면 ("", "")"""
+    if "_" not in loc:
+        return "", ""
+    d, l = loc.split("_", 1)
+    return d.strip(), l.strip()
+
+
+def _parse_moves(moves: List[Dict[str, Any]], name_to_item: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """AI moves → 검증용 열 배열 (품목 속성은 constraint_info에서 조인, 목록에 없는 품목은 기본값)"""
+    names = [str(m.get("item", "") or "") for m in moves]
+    items = [name_to_item.get(nm) if nm else None for nm in names]
+    to_locs = [str(m.get("to", "") or "") for m in moves]
+    from_locs = [str(m.get("from", "") or "") for m in moves]
+    to_parts = [_split_loc(x) for x in to_locs]
+    from_parts = [_split_loc(x) for x in from_locs]
+    return {
+        "moves": moves,
+        "names": names,
+        "items": items,
+        "to_locs": to_locs,
+        "from_locs": from_locs,
+        "qty": np.array([int(m.get("qty", 0) or 0) for m in moves], dtype=np.int64),
+        "known": np.array([it is not None for it in items], dtype=bool),
+        "plt": np.array([int(it["plt"]) if it else 1 for it in items], dtype=np.int64),
+        "max_movable": np.array([int(it["max_movable"]) if it else 0 for it in items], dtype=np.int64),
+        "is_t6": np.array([bool(it.get("is_t6")) if it else False for it in items], dtype=bool),
+        "is_a2xx": np.array([bool(it["is_a2xx"]) if it else False for it in items], dtype=bool),
+        "has_to": np.array(["_" in x for x in to_locs], dtype=bool),
+        "to_date": np.array([p[0] for p in to_parts], dtype=object),
+        "to_line": np.array([p[1] for p in to_parts], dtype=object),
+        "from_date": np.array([p[0] for p in from_parts], dtype=object),
+        "from_line": np.array([p[1] for p in from_parts], dtype=object),
+    }
+
+
+def _check_moves(
+    mv: Dict[str, Any],
+    target_line: str,
+    plan_index: PlanIndex,
+    calendar: WorkdayCalendar,
+    today_str: Optional[str],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, List[Optional[str]]]:
+    """순서와 무관한 step6 검증을 move 전체에 대해 한 번에 판정.
+    Returns: (pre_fail, t6_sameday, qty_eff, post_fail, src_qty, last_due)
+    - pre_fail: T6 같은날 캡 이전 검증의 첫 실패 코드 (0=통과, 1 품목없음, 2 qty<=0, 3 여유초과, 4 PLT, 5 목적지형식, 6 no-op)
+    - qty_eff: T6 같은날 타라인 이송은 5PLT 캡 적용 수량
+    - post_fail: 캡 이후 검증의 첫 실패 코드 (0=통과, 1 A2XX 조립3, 2 전용 타라인, 3 휴무일, 4 TODAY 이전, 5 납기 이후, 6 출발지 부족)
+    날짜/품목별 조회(가동일, 마지막 납기, 출발지 수량)는 pre_fail 통과분의 고유값만 1회씩 수행
+    """
+    n = len(mv["moves"])
+    qty, plt = mv["qty"], mv["plt"]
+    to_date, to_line = mv["to_date"], mv["to_line"]
+    from_date, from_line = mv["from_date"], mv["from_line"]
+    has_from = (from_date != "") & (from_line != "")
+
+    noop = has_from & (from_date == to_date) & (from_line == to_line)
+    pre_fail = np.select(
+        [~mv["known"], qty <= 0, qty > mv["max_movable"], qty % np.maximum(plt, 1) != 0, ~mv["has_to"], noop],
+        [1, 2, 3, 4, 5, 6],
+        default=0,
+    )
+
+    t6_sameday = mv["is_t6"] & has_from & (from_date == to_date) & (from_line != to_line)
+    qty_eff = np.where(t6_sameday, np.minimum(qty, int(MAX_T6_SAMEDAY_SHIFT_PLTS) * plt), qty)
+
+    live = np.flatnonzero(pre_fail == 0)
+    workday = {d: calendar.is_workday(d) for d in set(to_date[live])}
+    due_of = {nm: plan_index.last_due(nm) for nm in {mv["names"][k] for k in live}}
+
+    holiday = np.zeros(n, dtype=bool)
+    after_due = np.zeros(n, dtype=bool)
+    src_qty = np.zeros(n, dtype=np.int64)
+    last_due: List[Optional[str]] = [None] * n
+    for k in live:
+        holiday[k] = not workday[to_date[k]]
+        last_due[k] = due_of[mv["names"][k]]
+        after_due[k] = bool(last_due[k]) and to_date[k] > last_due[k]
+        if has_from[k]:
+            src_qty[k] = plan_index.item_qty(from_date[k], from_line[k], mv["names"][k])
+    before_today = (to_date <= today_str) if today_str else np.zeros(n, dtype=bool)
+
+    post_fail = np.select(
+        [
+            mv["is_a2xx"] & (to_line == "조립3"),
+            ~mv["is_t6"] & ~mv["is_a2xx"] & (to_line != target_line),
+            holiday,
+            before_today,
+            after_due,
+            has_from & (src_qty < qty_eff),
+        ],
+        [1, 2, 3, 4, 5, 6],
+        default=0,
+    )
+    return pre_fail, t6_sameday, qty_eff, post_fail, src_qty, last_due
+
+
 def step6_validate_ai_strategy(
     ai_strategy: Dict[str, Any],
     constraint_info: List[Dict[str, Any]],
-    capa_status: Dict[str, Dict[str, Any]],
+    capa_status: CapaLedger,
     plan_df: pd.DataFrame,
     target_line: str,
+    plan_index: Optional[PlanIndex] = None,
+    calendar: Optional[WorkdayCalendar] = None,
+    due_ledger: Optional[DueLedger] = None,
+    ctx: Optional[EngineContext] = None,
 ) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    - due_ledger: 같은 capa_status로 이어서 검증할 때 공유하는 누적 납기 원장
+      (이미 승인된 이동이 다음 이동의 누적 납기 검증에 반영됨)
+    - ctx: today/인덱스/달력 (없으면 plan_df로 구축, today 제한 없음)
+    """
     if not ai_strategy or "moves" not in ai_strategy:
         return [], ["❌ AI 전략 형식 오류: 'moves' 키가 없습니다."]
 
+    ctx = _resolve_context(ctx, plan_df, plan_index, calendar)
+    plan_index, calendar = ctx.plan_index, ctx.calendar
+    if due_ledger is None:
+        due_ledger = DueLedger(plan_index)
+
     name_to_item = {x["name"]: x for x in constraint_info}
     validated: List[Dict[str, Any]] = []
     violations: List[str] = []
 
     t6_sameday_shift_used = False  # T6 같은날 타라인 이송은 1회만 허용
 
-    today_str = TODAY.strftime("%Y-%m-%d") if TODAY else None
-
-    def _get_item_last_due(item_name: str) -> Optional[str]:
-        if plan_df.empty or ("qty_0차" not in plan_df.columns):
-            return None
-        df = plan_df[plan_df["product_name"] == item_name].copy()
-        if df.empty:
-            return None
-        df["qty_0차"] = pd.to_numeric(df["qty_0차"], errors="coerce").fillna(0)
-        due = df[df["qty_0차"] > 0]["plan_date"]
-        if due.empty:
-            return None
-        return str(due.max())[:10]
-
-    def _check_due_cumsum_after_move(item_name: str, from_date: str, to_date: str, qty_move: int) -> Tuple[bool, Optional[str]]:
-        """이동을 적용했을 때 품목별 누적 납기(cumsum1>=cumsum0)가 모든 날짜에서 유지되는지 검증"""
-        needed = {"product_name", "plan_date", "qty_0차", "qty_1차"}
-        if plan_df.empty or not needed.issubset(set(plan_df.columns)):
-            return True, None
-
-        df = plan_df[plan_df["product_name"] == item_name].copy()
-        if df.empty:
-            return True, None
-
-        daily = (
-            df.groupby("plan_date")[["qty_0차", "qty_1차"]]
-            .sum()
-            .reset_index()
-            .copy()
-        )
-        daily["qty_0차"] = pd.to_numeric(daily["qty_0차"], errors="coerce").fillna(0).astype(int)
-        daily["qty_1차"] = pd.to_numeric(daily["qty_1차"], errors="coerce").fillna(0).astype(int)
-
-        # from/to 날짜가 daily에 없을 수 있으니 보강
-        for d in [from_date, to_date]:
-            if d not in set(daily["plan_date"].astype(str).str[:10].tolist()):
-                daily = pd.concat([daily, pd.DataFrame([{"plan_date": d, "qty_0차": 0, "qty_1차": 0}])], ignore_index=True)
-
-        # plan_date 정규화
-        daily["plan_date"] = daily["plan_date"].astype(str).str[:10]
-        daily = daily.sort_values("plan_date").reset_index(drop=True)
-
-        # 이동 적용 (생산량만 이동, 수요(qty_0차)는 그대로)
-        # from에서 빼기
-        idx_from = daily.index[daily["plan_date"] == from_date]
-        idx_to = daily.index[daily["plan_date"] == to_date]
-        if len(idx_from) == 0 or len(idx_to) == 0:
-            return True, None
-
-        f = int(idx_from[0]); t = int(idx_to[0])
-
-        daily.loc[f, "qty_1차"] -= int(qty_move)
-        daily.loc[t, "qty_1차"] += int(qty_move)
-
-        # 음수 생산량은 불가
-        if daily.loc[f, "qty_1차"] < 0:
-            return False, from_date
+    today_str = ctx.today_str
 
-        daily["c0"] = daily["qty_0차"].cumsum()
-        daily["c1"] = daily["qty_1차"].cumsum()
-        bad = daily[daily["c1"] < daily["c0"]]
-        if bad.empty:
-            return True, None
-        return False, str(bad.iloc[0]["plan_date"])
+    # 순서와 무관한 검증은 전체 move를 배열로 만든 뒤 한 번에 판정 → 순서 의존(T6 1회/CAPA/누적 납기)만 순차 처리
+    mv = _parse_moves(ai_strategy.get("moves", []), name_to_item)
+    pre_fail, t6_sameday, qty_eff, post_fail, src_qty, last_due = _check_moves(
+        mv, target_line, plan_index, calendar, today_str
+    )
 
-    for idx, move in enumerate(ai_strategy.get("moves", []), 1):
-        item_name = str(move.get("item", "") or "")
-        qty = int(move.get("qty", 0) or 0)
-        to_loc = str(move.get("to", "") or "")
-        from_loc = str(move.get("from", "") or "")
+    for k, move in enumerate(mv["moves"]):
+        idx = k + 1
+        item_name = mv["names"][k]
+        item = mv["items"][k]
+        qty = int(mv["qty"][k])
+        to_loc, from_loc = mv["to_locs"][k], mv["from_locs"][k]
+        to_date, to_line = mv["to_date"][k], mv["to_line"][k]
+        from_date = mv["from_date"][k]
         reason = str(move.get("reason", "미지정") or "미지정")
 
-        if not item_name or item_name not in name_to_item:
+        code = int(pre_fail[k])
+        if code == 1:
             violations.append(f"❌ [{idx}] {item_name}: 이동 가능 품목 목록에 없음")
             continue
-
-        item = name_to_item[item_name]
-
-        if qty <= 0:
+        if code == 2:
             violations.append(f"❌ [{idx}] {item_name}: qty가 0 이하")
             continue
-
-        # 누적 납기 여유 기준 검증: qty는 max_movable 이하
-        if qty > int(item["max_movable"]):
+        if code == 3:
             violations.append(f"❌ [{idx}] {item_name}: 누적 여유 초과 (요청 {qty:,} > 최대 {item['max_movable']:,})")
             continue
-
-        # PLT 단위
-        if qty % int(item["plt"]) != 0:
+        if code == 4:
             violations.append(f"❌ [{idx}] {item_name}: PLT 단위 아님 (qty {qty:,}, plt {item['plt']})")
             continue
-
-        # 목적지 파싱
-        if "_" not in to_loc:
+        if code == 5:
             violations.append(f"❌ [{idx}] {item_name}: 목적지 형식 오류 (to='{to_loc}')")
             continue
-        to_date = to_loc.split("_", 1)[0].strip()
-        to_line = to_loc.split("_", 1)[1].strip()
-
-        # 출발지 파싱(가능하면 수량 존재 검증에 사용)
-        from_date = None
-        from_line = None
-        if "_" in from_loc:
-            from_date = from_loc.split("_", 1)[0].strip()
-            from_line = from_loc.split("_", 1)[1].strip()
-
-        # -----------------------
-        # (0) no-op 이동 방지 (같은 날짜/같은 라인으로의 이동은 의미 없음)
-        # - 이런 move가 들어오면 Δ 표에는 변화가 없는데, 감축량/달성률 집계가 왜곡될 수 있음
-        # -----------------------
-        if from_date and from_line and (from_date == to_date) and (from_line == to_line):
+        if code == 6:
+            # no-op 이동 방지 (같은 날짜/같은 라인으로의 이동은 Δ 표 변화 없이 감축량/달성률만 왜곡)
             violations.append(f"❌ [{idx}] {item_name}: 같은 날짜/라인({to_date}_{to_line})로 이동(no-op) 불가")
             continue
 
@@ -750,102 +1587,76 @@ def step6_validate_ai_strategy(
         # (0.5) 사람 같은 분산: T6 같은날 타라인 이송은 1회만, 최대 5PLT까지만 우선 허용
         # - 과대 이동(예: 6PLT, 1,050개)을 막고, 남는 감축은 다른 품목/날짜 이동을 우선 시도
         # -----------------------
-        if item.get("is_t6") and from_date and from_line and (from_date == to_date) and (from_line != to_line):
+        if t6_sameday[k]:
             if t6_sameday_shift_used:
                 violations.append(f"❌ [{idx}] {item_name}: T6 같은날 타라인 이송은 1회만 허용(사람 같은 분산)")
                 continue
-            max_qty = int(MAX_T6_SAMEDAY_SHIFT_PLTS) * int(item["plt"])
-            if qty > max_qty:
+            if qty > int(qty_eff[k]):
                 # qty/plt 정합성은 유지되도록 5PLT로 캡
                 original_qty = qty
-                qty = max_qty
+                qty = int(qty_eff[k])
                 move["qty"] = qty
                 violations.append(f"ℹ️ [{idx}] {item_name}: T6 과대 이동 방지(원본 {original_qty:,} → {qty:,}, {MAX_T6_SAMEDAY_SHIFT_PLTS}PLT 캡)")
 
-        # -----------------------
-        # (1) 물리 제약
-        # -----------------------
-        if item["is_a2xx"] and to_line == "조립3":
+        # (1) 물리 제약 ~ (5) 출발지 수량 (캡 반영 수량 기준으로 미리 판정)
+        code = int(post_fail[k])
+        if code == 1:
             violations.append(f"❌ [{idx}] {item_name}: A2XX는 조립3 이동 불가")
             continue
-
-        if (not item["is_t6"]) and (not item["is_a2xx"]) and to_line != target_line:
+        if code == 2:
             violations.append(f"❌ [{idx}] {item_name}: 전용 모델은 타라인 이동 불가 (요청 {to_line})")
             continue
-
-        # -----------------------
-        # (2) 가동일 (휴무일이면 즉시 컷)
-        # -----------------------
-        if not is_workday_in_db(plan_df, to_date):
+        if code == 3:
             violations.append(f"❌ [{idx}] {item_name}: {to_date}는 휴무일")
             continue
-
-        # -----------------------
-        # (3) TODAY(질문일) 이전/당일 선행생산 금지
-        #     - '과거로 당기기'는 오늘 이후만 허용 (TODAY+1 ~ target_date-1)
-        # -----------------------
-        if today_str and to_date <= today_str:
+        if code == 4:
             violations.append(f"❌ [{idx}] {item_name}: 목적지 날짜({to_date})가 오늘({today_str}) 이전/당일이라 선행생산 금지")
             continue
-
-        # -----------------------
-        # (4) 납기(=qty_0차) 기반 상한: last_due 이후로는 이동 금지
-        # -----------------------
-        last_due = _get_item_last_due(item_name)
-        if last_due and to_date > last_due:
-            violations.append(f"❌ [{idx}] {item_name}: 납기 이후 날짜로 이동 불가 (to {to_date} > last_due {last_due})")
+        if code == 5:
+            violations.append(f"❌ [{idx}] {item_name}: 납기 이후 날짜로 이동 불가 (to {to_date} > last_due {last_due[k]})")
+            continue
+        if code == 6:
+            violations.append(f"❌ [{idx}] {item_name}: 출발지 수량 부족 (from {from_loc} 보유 {int(src_qty[k]):,} < 요청 {qty:,})")
             continue
-
-        # -----------------------
-        # (5) 출발지 수량 존재 검증 (가능한 경우)
-        # -----------------------
-        if from_date and from_line:
-            src_qty = plan_df[
-                (plan_df["plan_date"] == from_date)
-                & (plan_df["line"] == from_line)
-                & (plan_df["product_name"] == item_name)
-            ]["qty_1차"].sum()
-            src_qty = int(src_qty) if pd.notna(src_qty) else 0
-            if src_qty < qty:
-                violations.append(f"❌ [{idx}] {item_name}: 출발지 수량 부족 (from {from_loc} 보유 {src_qty:,} < 요청 {qty:,})")
-                continue
 
         # -----------------------
         # (6) 목적지 CAPA 확인/조정
         # -----------------------
-        capa_key = f"{to_date}_{to_line}"
-        if capa_key not in capa_status:
-            violations.append(f"⚠️ [{idx}] {item_name}: 목적지 CAPA 정보 없음 ({capa_key})")
+        dest = capa_status.slot(to_date, to_line)
+        if dest is None:
+            violations.append(f"⚠️ [{idx}] {item_name}: 목적지 CAPA 정보 없음 ({to_date}_{to_line})")
             continue
 
-        dest = capa_status[capa_key]
+        dest_remaining = int(capa_status.remaining[dest])
         final_qty = qty
         adjusted = False
         original_qty = None
 
-        if final_qty > int(dest["remaining"]):
+        if final_qty > dest_remaining:
             # 남은 CAPA 내에서 PLT 정수배로 줄여서라도 반영
-            if int(dest["remaining"]) >= int(item["plt"]):
-                adj_plts = int(dest["remaining"]) // int(item["plt"])
+            if dest_remaining >= int(item["plt"]):
+                adj_plts = dest_remaining // int(item["plt"])
                 adj_qty = adj_plts * int(item["plt"])
                 final_qty = adj_qty
                 adjusted = True
                 original_qty = qty
             else:
-                violations.append(f"❌ [{idx}] {item_name}: CAPA 부족 및 조정 불가 (남은 {dest['remaining']:,})")
+                violations.append(f"❌ [{idx}] {item_name}: CAPA 부족 및 조정 불가 (남은 {dest_remaining:,})")
                 continue
 
         # -----------------------
         # (7) 이동 적용 시 '누적 납기' 위반 여부 최종 검증
         # -----------------------
         if from_date:
-            ok, bad_date = _check_due_cumsum_after_move(item_name, from_date, to_date, final_qty)
+            ok, bad_date = due_ledger.check_move(item_name, from_date, to_date, final_qty)
             if not ok:
                 violations.append(f"❌ [{idx}] {item_name}: 납기 누적 위반(이동 후 {bad_date}까지 생산 부족) → 이동 불가")
                 continue
 
-        # ✅ 모든 검증 통과 후에만 CAPA 차감
-        capa_status[capa_key]["remaining"] -= final_qty
+        # ✅ 모든 검증 통과 후에만 CAPA 차감 (+ 누적 납기 원장 반영)
+        capa_status.reserve(dest, final_qty)
+        if from_date:
+            due_ledger.apply_move(item_name, from_date, to_date, final_qty)
 
         validated.append(
             {
@@ -860,8 +1671,7 @@ def step6_validate_ai_strategy(
             }
         )
 
-
-        if item.get('is_t6') and from_date and from_line and (from_date == to_date) and (from_line != to_line):
+        if t6_sameday[k]:
             t6_sameday_shift_used = True
         if adjusted:
             violations.append(f"✅ [{idx}] {item_name}: CAPA 부족으로 자동 조정 ({qty:,} → {final_qty:,})")
@@ -880,11 +1690,13 @@ def _pick_qty_plts(qty: int, plt: int) -> int:
 def python_fallback_reduce(
     plan_df: pd.DataFrame,
     constraint_info: List[Dict[str, Any]],
-    capa_status: Dict[str, Dict[str, Any]],
+    capa_status: CapaLedger,
     question_date: str,
     target_line: str,
     need_reduce: int,
     t6_sameday_already_used: bool = False,
+    calendar: Optional[WorkdayCalendar] = None,
+    ctx: Optional[EngineContext] = None,
 ) -> Tuple[List[Dict[str, Any]], List[str]]:
     """
     감축 폴백 (사람 같은 분산 우선순위):
@@ -901,22 +1713,16 @@ def python_fallback_reduce(
     if remain <= 0:
         return [], []
 
+    ctx = _resolve_context(ctx, plan_df, calendar=calendar)
+    calendar = ctx.calendar
+
     # buffer_days 큰 순(납기 여유가 큰 품목 우선)
     candidates = sorted(constraint_info, key=lambda x: x.get("buffer_days", 0), reverse=True)
 
     # -------------------------------
     # (0) 미래 확장 상한(horizon_end) 계산 (qty_0차 > 0인 마지막 납기일)
     # -------------------------------
-    horizon_end = None
-    if (not plan_df.empty) and ("plan_date" in plan_df.columns) and ("qty_0차" in plan_df.columns):
-        try:
-            tmp = plan_df.copy()
-            tmp["qty_0차"] = pd.to_numeric(tmp["qty_0차"], errors="coerce").fillna(0)
-            due = tmp[tmp["qty_0차"] > 0]["plan_date"]
-            if not due.empty:
-                horizon_end = str(due.max())[:10]
-        except Exception:
-            horizon_end = None
+    horizon_end = ctx.plan_index.last_due_date
 
     # ======================================================
     # [1] 같은날 타라인 이송 (T6는 1회/5PLT 상한)
@@ -949,9 +1755,9 @@ def python_fallback_reduce(
         # 목적지 후보(같은날)
         dests = []
         for dl in possible_lines:
-            key = f"{question_date}_{dl}"
-            if key in capa_status and int(capa_status[key]["remaining"]) > 0:
-                dests.append((dl, int(capa_status[key]["remaining"])))
+            i = capa_status.slot(question_date, dl)
+            if i is not None and int(capa_status.remaining[i]) > 0:
+                dests.append((dl, int(capa_status.remaining[i])))
         dests.sort(key=lambda x: x[1], reverse=True)
         if not dests:
             continue
@@ -973,12 +1779,10 @@ def python_fallback_reduce(
                 continue
 
             # 가동일 체크
-            if not is_workday_in_db(plan_df, question_date):
-                continue
-            if not is_workday_in_db(plan_df, question_date):
+            if not calendar.is_workday(question_date):
                 continue
 
-            capa_status[f"{question_date}_{dl}"]["remaining"] -= take
+            capa_status.reserve(capa_status.slot(question_date, dl), take)
             remain -= take
             moves.append(
                 {
@@ -1001,7 +1805,7 @@ def python_fallback_reduce(
     if remain > 0:
         max_future_days = 10
 
-        future_candidates = get_workdays_from_db(plan_df, question_date, direction="future", days_count=400)
+        future_candidates = calendar.next_workdays(question_date, days_count=400)
         future_candidates = [d for d in future_candidates if str(d)[:10] != question_date]
         if horizon_end:
             future_candidates = [d for d in future_candidates if str(d)[:10] <= horizon_end]
@@ -1024,10 +1828,10 @@ def python_fallback_reduce(
                 for d in future_days:
                     if remain <= 0:
                         break
-                    key = f"{d}_{target_line}"
-                    if key not in capa_status:
+                    i = capa_status.slot(d, target_line)
+                    if i is None:
                         continue
-                    rem_capa = int(capa_status[key]["remaining"])
+                    rem_capa = int(capa_status.remaining[i])
                     if rem_capa < plt:
                         continue
 
@@ -1036,7 +1840,7 @@ def python_fallback_reduce(
                     if take <= 0:
                         continue
 
-                    capa_status[key]["remaining"] -= take
+                    capa_status.reserve(i, take)
                     remain -= take
                     moves.append(
                         {
@@ -1065,10 +1869,10 @@ def python_fallback_reduce(
                     for d in future_days:
                         if remain <= 0:
                             break
-                        key = f"{d}_{target_line}"
-                        if key not in capa_status:
+                        i = capa_status.slot(d, target_line)
+                        if i is None:
                             continue
-                        rem_capa = int(capa_status[key]["remaining"])
+                        rem_capa = int(capa_status.remaining[i])
                         if rem_capa < plt:
                             continue
 
@@ -1077,7 +1881,7 @@ def python_fallback_reduce(
                         if take <= 0:
                             continue
 
-                        capa_status[key]["remaining"] -= take
+                        capa_status.reserve(i, take)
                         remain -= take
                         moves.append(
                             {
@@ -1095,7 +1899,7 @@ def python_fallback_reduce(
     # [3] 과거(선행생산)로 당기기 (마지막 수단)
     # ======================================================
     if remain > 0:
-        past_days = get_workdays_from_db(plan_df, question_date, direction="past", days_count=5)
+        past_days = calendar.prev_workdays(question_date, days_count=5, today=ctx.today)
 
         for item in candidates:
             if remain <= 0:
@@ -1110,10 +1914,10 @@ def python_fallback_reduce(
             for d in past_days:
                 if remain <= 0:
                     break
-                key = f"{d}_{target_line}"
-                if key not in capa_status:
+                i = capa_status.slot(d, target_line)
+                if i is None:
                     continue
-                rem_capa = int(capa_status[key]["remaining"])
+                rem_capa = int(capa_status.remaining[i])
                 if rem_capa < plt:
                     continue
 
@@ -1122,7 +1926,7 @@ def python_fallback_reduce(
                 if take <= 0:
                     continue
 
-                capa_status[key]["remaining"] -= take
+                capa_status.reserve(i, take)
                 remain -= take
                 moves.append(
                     {
@@ -1138,110 +1942,435 @@ def python_fallback_reduce(
 
     return moves, notes
 
-def python_fallback_increase(
+# ========================================================================
+# 최적화 감축 (최소비용 유량) — python_fallback_reduce의 대안
+# ========================================================================
+
+FLOW_TIME_BUDGET_SEC = 2.0
+FLOW_COST_T6_DEFER = 50  # T6 동일라인 연기는 비 T6 연기보다 후순위
+FLOW_COST_PULL = 100  # 과거(선행생산) 당기기는 마지막 수단
+
+
+class _MinCostFlow:
+    """최소비용 유량 (successive shortest path, SPFA). 노드/간선 수가 작은 이동 계획 전용."""
+
+    def __init__(self, n: int):
+        self.n = n
+        self.to: List[int] = []
+        self.cap: List[int] = []
+        self.cost: List[int] = []
+        self.adj: List[List[int]] = [[] for _ in range(n)]
+
+    def add_edge(self, u: int, v: int, cap: int, cost: int) -> int:
+        """u→v 간선 추가, 정방향 간선 번호 반환 (역방향은 번호^1)"""
+        e = len(self.to)
+        self.to += [v, u]
+        self.cap += [int(cap), 0]
+        self.cost += [int(cost), -int(cost)]
+        self.adj[u].append(e)
+        self.adj[v].append(e + 1)
+        return e
+
+    def flow(self, s: int, t: int, max_flow: int, deadline: Optional[float] = None) -> Tuple[int, int, bool]:
+        """s→t로 최대 max_flow 만큼 최소비용 유량. (유량, 비용, 시간초과 여부)"""
+        total_flow, total_cost = 0, 0
+        while total_flow < max_flow:
+            if deadline is not None and time.monotonic() > deadline:
+                return total_flow, total_cost, True
+            dist = [None] * self.n
+            prev_edge = [-1] * self.n
+            in_queue = [False] * self.n
+            dist[s] = 0
+            q = deque([s])
+            while q:
+                u = q.popleft()
+                in_queue[u] = False
+                for e in self.adj[u]:
+                    if self.cap[e] <= 0:
+                        continue
+                    v = self.to[e]
+                    nd = dist[u] + self.cost[e]
+                    if dist[v] is None or nd < dist[v]:
+                        dist[v] = nd
+                        prev_edge[v] = e
+                        if not in_queue[v]:
+                            in_queue[v] = True
+                            q.append(v)
+            if dist[t] is None:
+                break
+
+            push = max_flow - total_flow
+            v = t
+            while v != s:
+                e = prev_edge[v]
+                push = min(push, self.cap[e])
+                v = self.to[e ^ 1]
+            v = t
+            while v != s:
+                e = prev_edge[v]
+                self.cap[e] -= push
+                self.cap[e ^ 1] += push
+                v = self.to[e ^ 1]
+            total_flow += push
+            total_cost += push * dist[t]
+        return total_flow, total_cost, False
+
+
+def _max_due_safe_qty(due_ledger: DueLedger, name: str, from_date: str, to_date: str, cap: int, plt: int) -> int:
+    """cap 이하 PLT 배수 중 누적 납기를 지키는 최대 수량 (이동량에 대해 단조 → 이분 탐색)"""
+    lo, hi = 0, cap // plt
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if due_ledger.check_move(name, from_date, to_date, mid * plt)[0]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo * plt
+
+
+def python_optimize_reduce(
     plan_df: pd.DataFrame,
     constraint_info: List[Dict[str, Any]],
-    capa_status: Dict[str, Dict[str, Any]],
+    capa_status: CapaLedger,
     question_date: str,
     target_line: str,
-    need_increase: int,
+    need_reduce: int,
+    t6_sameday_already_used: bool = False,
+    plan_index: Optional[PlanIndex] = None,
+    calendar: Optional[WorkdayCalendar] = None,
+    due_ledger: Optional[DueLedger] = None,
+    time_budget_sec: float = FLOW_TIME_BUDGET_SEC,
+    ctx: Optional[EngineContext] = None,
 ) -> Tuple[List[Dict[str, Any]], List[str]]:
     """
-    증량 폴백:
-    1) 같은날 타라인에서 가져오기 (T6만)
-    2) 같은라인 미래 날짜에서 당기기
+    감축 최적화 (python_fallback_reduce 대안, 재시도 없이 1회 풀이):
+    - 품목(공급: min(max_movable, 당일 수량)) → 날짜×라인 CAPA 슬롯(수요: remaining) 최소비용 유량
+    - 간선은 T6/A2XX/전용 라인 규칙, 가동일, TODAY, 품목별 마지막 납기, 누적 납기(due_ledger)로 제한
+    - 비용 = 이동 일수 (같은날 타라인 0 < 비 T6 연기 < T6 연기 < 과거 당기기), 동순위는 buffer_days 큰 품목 우선
+    - T6 같은날 타라인 이송(1회/5PLT)은 분기별로 풀어 최선 해를 선택
+    - 유량은 PLT 배수로 내림 후, 남은 CAPA를 PLT 단위로 다시 채워 보정
+    capa_status는 python_fallback_reduce와 동일하게 채택분만큼 차감한다.
     """
-    moves = []
-    notes = []
-
-    remain = need_increase
-    if remain <= 0:
+    deadline = time.monotonic() + max(0.0, float(time_budget_sec))
+    need = int(need_reduce or 0)
+    if need <= 0:
         return [], []
 
-    # [1] 같은날 타라인 -> target_line (T6만)
-    date_df = plan_df[plan_df["plan_date"] == question_date].copy()
-    if not date_df.empty:
-        for src_line in ["조립1", "조립2", "조립3"]:
-            if src_line == target_line:
+    ctx = _resolve_context(ctx, plan_df, plan_index, calendar)
+    plan_index, calendar = ctx.plan_index, ctx.calendar
+    if due_ledger is None:
+        due_ledger = DueLedger(plan_index)
+
+    today_str = ctx.today_str
+    candidates = sorted(constraint_info, key=lambda x: x.get("buffer_days", 0), reverse=True)
+
+    # ------------------------------------------------------
+    # 슬롯: capa_status에 있는 (날짜, 라인) 중 remaining > 0
+    # ------------------------------------------------------
+    own_slot = capa_status.slot(question_date, target_line)
+    slots: List[int] = [k for k in range(len(capa_status)) if int(capa_status.remaining[k]) > 0 and k != own_slot]
+    future = [capa_status.dates[k] for k in slots if capa_status.lines[k] == target_line and capa_status.dates[k] > question_date]
+    past = [capa_status.dates[k] for k in slots if capa_status.lines[k] == target_line and capa_status.dates[k] < question_date]
+    future_rank = {d: i + 1 for i, d in enumerate(sorted(future))}
+    past_rank = {d: i + 1 for i, d in enumerate(sorted(past, reverse=True))}
+
+    # ------------------------------------------------------
+    # 간선: (품목, 슬롯, 상한, 비용)
+    # ------------------------------------------------------
+    tie = len(candidates) + 1
+    supply: Dict[str, int] = {}
+    arcs: List[Dict[str, Any]] = []
+    for rank, item in enumerate(candidates):
+        name = item["name"]
+        plt = int(item["plt"])
+        if plt <= 0:
+            continue
+        cap_item = min(int(item["max_movable"]), plan_index.item_qty(question_date, target_line, name))
+        cap_item = _pick_qty_plts(cap_item, plt)
+        if cap_item <= 0:
+            continue
+        supply[name] = cap_item
+
+        is_t6 = bool(item.get("is_t6"))
+        is_a2xx = bool(item.get("is_a2xx"))
+        last_due = plan_index.last_due(name)
+
+        for key in slots:
+            d, line = capa_status.dates[key], capa_status.lines[key]
+            if today_str and d <= today_str:
                 continue
-            src = date_df[(date_df["line"] == src_line) & (date_df["qty_1차"] > 0)]
-            if src.empty:
+            if last_due and d > last_due:
+                continue
+            if not calendar.is_workday(d):
                 continue
 
-            for _, row in src.iterrows():
-                if remain <= 0:
-                    break
-                name = str(row.get("product_name", ""))
-                if "T6" not in name.upper():
-                    continue
-                plt = int(row.get("plt", 1) or 1)
-                src_qty = int(row.get("qty_1차", 0) or 0)
-
-                take = min(remain, src_qty)
-                take = _pick_qty_plts(take, plt)
-                if take <= 0:
+            if d == question_date:
+                if is_t6:
+                    kind, base = "t6_sameday", 0
+                elif is_a2xx and line != "조립3":
+                    kind, base = "sameday", 0
+                else:
                     continue
+                cap = min(cap_item, int(MAX_T6_SAMEDAY_SHIFT_PLTS) * plt) if is_t6 else cap_item
+            elif line != target_line:
+                continue
+            elif d > question_date:
+                kind = "defer"
+                base = future_rank[d] + (FLOW_COST_T6_DEFER if is_t6 else 0)
+                cap = cap_item
+            else:
+                kind = "pull"
+                base = FLOW_COST_PULL + past_rank[d]
+                cap = cap_item
 
-                remain -= take
-                moves.append(
-                    {
-                        "item": name,
-                        "qty": take,
-                        "plt": take // plt,
-                        "from": f"{question_date}_{src_line}",
-                        "to": f"{question_date}_{target_line}",
-                        "reason": f"[폴백] 같은날 타라인({src_line})에서 T6 가져오기",
-                    }
-                )
-
-    # [2] 미래 동일라인에서 당기기
-    if remain > 0:
-        base = _safe_date(question_date)
-        for i in range(1, 11):
+            cap = _max_due_safe_qty(due_ledger, name, question_date, d, _pick_qty_plts(cap, plt), plt)
+            if cap <= 0:
+                continue
+            arcs.append({"item": name, "plt": plt, "slot": key, "date": d, "line": line, "kind": kind, "cap": cap, "cost": base * tie + rank})
+
+    if not arcs:
+        return [], ["⚠️ [최적화] 이동 가능한 품목×CAPA 슬롯 조합이 없습니다."]
+
+    # ------------------------------------------------------
+    # T6 같은날 타라인 이송 분기: 없음 / T6 간선 하나만 허용
+    # ------------------------------------------------------
+    t6_arcs = [i for i, a in enumerate(arcs) if a["kind"] == "t6_sameday"]
+    branches: List[Optional[int]] = [None] if t6_sameday_already_used else [None] + t6_arcs
+
+    def _solve(allowed_t6: Optional[int]) -> Tuple[int, int, List[Tuple[int, int]], bool]:
+        use = [i for i, a in enumerate(arcs) if a["kind"] != "t6_sameday" or i == allowed_t6]
+        item_ids = {n: i for i, n in enumerate(supply)}
+        slot_ids = {k: i for i, k in enumerate(slots)}
+        s, t = 0, 1
+        item_base = 2
+        slot_base = item_base + len(item_ids)
+        g = _MinCostFlow(slot_base + len(slot_ids))
+        for n, i in item_ids.items():
+            g.add_edge(s, item_base + i, supply[n], 0)
+        for k, i in slot_ids.items():
+            g.add_edge(slot_base + i, t, int(capa_status.remaining[k]), 0)
+        edge_of = {i: g.add_edge(item_base + item_ids[arcs[i]["item"]], slot_base + slot_ids[arcs[i]["slot"]], arcs[i]["cap"], arcs[i]["cost"]) for i in use}
+        _, _, timed_out = g.flow(s, t, need, deadline)
+
+        # PLT 배수 내림 → 누적 납기 재검증(원장에 임시 반영) → 남은 여유 PLT 단위 보정
+        item_left = dict(supply)
+        slot_left = {k: int(capa_status.remaining[k]) for k in slots}
+        alloc: Dict[int, int] = {}
+        applied: List[Tuple[str, str, int]] = []
+        remain = need
+
+        def _take(i: int, want: int) -> int:
+            a = arcs[i]
+            q = _pick_qty_plts(min(want, remain, item_left[a["item"]], slot_left[a["slot"]], a["cap"] - alloc.get(i, 0)), a["plt"])
+            if q <= 0:
+                return 0
+            q = _max_due_safe_qty(due_ledger, a["item"], question_date, a["date"], q, a["plt"])
+            if q <= 0:
+                return 0
+            due_ledger.apply_move(a["item"], question_date, a["date"], q)
+            applied.append((a["item"], a["date"], q))
+            item_left[a["item"]] -= q
+            slot_left[a["slot"]] -= q
+            alloc[i] = alloc.get(i, 0) + q
+            return q
+
+        order = sorted(use, key=lambda i: arcs[i]["cost"])
+        for i in order:
+            remain -= _take(i, g.cap[edge_of[i] ^ 1])
+        for i in order:
             if remain <= 0:
                 break
-            d = (base + timedelta(days=i)).strftime("%Y-%m-%d")
-            if not is_workday_in_db(plan_df, d):
-                continue
+            remain -= _take(i, remain)
+
+        for name, d, q in reversed(applied):
+            due_ledger.apply_move(name, d, question_date, q)
+        cost = sum(q * arcs[i]["cost"] for i, q in alloc.items())
+        return need - remain, cost, sorted(alloc.items(), key=lambda x: arcs[x[0]]["cost"]), timed_out
+
+    best = None
+    explored = 0
+    timed_out = False
+    for branch in branches:
+        if explored and time.monotonic() > deadline:
+            timed_out = True
+            break
+        done, cost, alloc, hit = _solve(branch)
+        explored += 1
+        timed_out = timed_out or hit
+        if best is None or (done, -cost) > (best[0], -best[1]):
+            best = (done, cost, alloc)
 
-            future = plan_df[
-                (plan_df["plan_date"] == d)
-                & (plan_df["line"] == target_line)
-                & (plan_df["qty_1차"] > 0)
-            ]
-            if future.empty:
-                continue
+    moves: List[Dict[str, Any]] = []
+    notes: List[str] = [
+        f"ℹ️ [최적화] 최소비용 유량: 품목 {len(supply)}개 × 슬롯 {len(slots)}개, T6 분기 {explored}/{len(branches)}개 탐색"
+    ]
+    if timed_out:
+        notes.append(f"⚠️ [최적화] 시간 예산({time_budget_sec:g}초) 초과 → 탐색한 해 중 최선안 사용")
+
+    reasons = {
+        "t6_sameday": "[최적화] 타라인 이송으로 감축 ({line} 잔여 활용)",
+        "sameday": "[최적화] 타라인 이송으로 감축 ({line} 잔여 활용)",
+        "defer": "[최적화] 동일라인 미래 연기로 감축 ({date})",
+        "pull": "[최적화] 과거 선행생산으로 당기기 ({date})",
+    }
+    for i, q in best[2]:
+        a = arcs[i]
+        capa_status.reserve(a["slot"], q)
+        moves.append(
+            {
+                "item": a["item"],
+                "qty": q,
+                "plt": q // a["plt"],
+                "from": f"{question_date}_{target_line}",
+                "to": f"{a['date']}_{a['line']}",
+                "reason": reasons[a["kind"]].format(line=a["line"], date=a["date"]),
+            }
+        )
 
-            movable_map = {x["name"]: x for x in constraint_info}
-            for _, row in future.iterrows():
-                if remain <= 0:
-                    break
+    if best[0] < need:
+        notes.append(f"⚠️ [최적화] 감축 미달: 추가로 {need - best[0]:,}개 더 감축 필요")
+    return moves, notes
 
-                name = str(row.get("product_name", ""))
-                if name not in movable_map:
-                    continue
-                item = movable_map[name]
-                plt = int(item["plt"])
-                max_movable = int(item["max_movable"])
 
-                src_qty = int(row.get("qty_1차", 0) or 0)
-                take = min(remain, src_qty, max_movable)
-                take = _pick_qty_plts(take, plt)
-                if take <= 0:
+INCREASE_PULL_DAYS = 10  # 증량 폴백: 질문일 이후 N일(달력 기준) 안의 동일라인 물량만 당김
+
+
+def python_fallback_increase(
+    plan_df: pd.DataFrame,
+    constraint_info: List[Dict[str, Any]],
+    capa_status: CapaLedger,
+    question_date: str,
+    target_line: str,
+    need_increase: int,
+    plan_index: Optional[PlanIndex] = None,
+    calendar: Optional[WorkdayCalendar] = None,
+    ctx: Optional[EngineContext] = None,
+    due_ledger: Optional[DueLedger] = None,
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    증량 폴백 (인덱스 기반 당기기):
+    0) 목표 슬롯 CAPA 잔여 안에서만 증량 (당긴 수량은 capa_status 목표 슬롯에 차감)
+    1) 같은날 타라인에서 가져오기 (T6만, step6 규칙대로 1회·최대 5PLT)
+    2) 같은라인 미래 날짜(INCREASE_PULL_DAYS일 이내 가동일)에서 당기기
+       - 출발 슬롯 CAPA 여유가 적은(과부하) 날부터, 같으면 가까운 날부터
+       - (날짜, 품목) 후보 상한/정렬은 배열로 한 번에 계산하고, 순서대로 배분하면서
+         품목별 남은 max_movable(여러 날짜에서 당겨도 합계 기준)과 누적 납기(due_ledger)를 지키는 PLT 배수만 채택
+    후보는 이동 가능 품목(constraint_info) 중 A2XX→조립3, 납기 이후 당기기를 미리 제외한다.
+    → 폴백이 제안한 이동은 step6 검증에서 탈락하지 않는다 (due_ledger는 제안 후 원상 복구).
+    """
+    moves = []
+    notes = []
+
+    remain = need_increase
+    if remain <= 0:
+        return [], []
+
+    ctx = _resolve_context(ctx, plan_df, plan_index, calendar)
+    plan_index, calendar = ctx.plan_index, ctx.calendar
+    if due_ledger is None:
+        due_ledger = DueLedger(plan_index)
+
+    target = capa_status.slot(question_date, target_line)
+    capa_left = max(0, int(capa_status.remaining[target])) if target is not None else 0
+    if capa_left < remain:
+        notes.append(f"ℹ️ [폴백] 목표 슬롯({question_date}_{target_line}) CAPA 잔여 {capa_left:,}개까지만 증량")
+    budget = min(remain, capa_left)
+
+    name_to_item = {x["name"]: x for x in constraint_info}
+    item_left = {x["name"]: max(int(x["max_movable"]), 0) for x in constraint_info}
+
+    def pullable(name: str) -> bool:
+        if name not in name_to_item:
+            return False
+        if target_line == "조립3" and plan_index.flags(name)[1]:
+            return False
+        last_due = plan_index.last_due(name)
+        return not (last_due and question_date > last_due)
+
+    def add_move(name: str, qty: int, plt: int, from_loc: str, reason: str) -> None:
+        moves.append(
+            {
+                "item": name,
+                "qty": qty,
+                "plt": qty // plt,
+                "from": from_loc,
+                "to": f"{question_date}_{target_line}",
+                "reason": reason,
+            }
+        )
+        capa_status.reserve(target, qty)
+        item_left[name] -= qty
+
+    # [1] 같은날 타라인 -> target_line (T6만): 가장 많이 가져올 수 있는 1건
+    best = None
+    for src_line in ["조립1", "조립2", "조립3"]:
+        if src_line == target_line or budget <= 0:
+            continue
+        for name, src_qty in plan_index.slot_items(question_date, src_line).items():
+            if src_qty <= 0 or not plan_index.flags(name)[0] or not pullable(name):
+                continue
+            item = name_to_item[name]
+            plt = max(int(item["plt"]), 1)
+            take = _pick_qty_plts(min(budget, src_qty, item_left[name], MAX_T6_SAMEDAY_SHIFT_PLTS * plt), plt)
+            if take > 0 and (best is None or take > best[1]):
+                best = (name, take, plt, src_line)
+    if best is not None:
+        name, take, plt, src_line = best
+        add_move(name, take, plt, f"{question_date}_{src_line}", f"[폴백] 같은날 타라인({src_line})에서 T6 가져오기")
+        budget -= take
+
+    # [2] 미래 동일라인에서 당기기
+    if budget > 0:
+        horizon = (_safe_date(question_date) + timedelta(days=INCREASE_PULL_DAYS)).strftime("%Y-%m-%d")
+        all_dates = plan_index.dates()
+        days = [
+            d
+            for d in all_dates[bisect_right(all_dates, question_date):bisect_right(all_dates, horizon)]
+            if calendar.is_workday(d)
+        ]
+
+        names: List[str] = []
+        src: List[int] = []
+        day_pos: List[int] = []
+        for k, d in enumerate(days):
+            for name, q in plan_index.slot_items(d, target_line).items():
+                if q > 0 and pullable(name):
+                    names.append(name)
+                    src.append(q)
+                    day_pos.append(k)
+
+        if names:
+            plt = np.array([max(int(name_to_item[nm]["plt"]), 1) for nm in names], dtype=np.int64)
+            max_movable = np.array([item_left[nm] for nm in names], dtype=np.int64)
+            cap = np.minimum(np.array(src, dtype=np.int64), max_movable) // plt * plt
+            slot_left = []
+            for d in days:
+                i = capa_status.slot(d, target_line)
+                slot_left.append(int(capa_status.remaining[i]) if i is not None else 0)
+            pos = np.array(day_pos, dtype=np.int64)
+            order = np.lexsort((np.arange(len(names)), pos, np.array(slot_left, dtype=np.int64)[pos]))
+
+            # 정렬 순서대로 배분: 행별 상한(cap) + 품목별 남은 max_movable + 누적 납기를 지키는 PLT 배수
+            applied: List[Tuple[str, str, int]] = []
+            for k in order[cap[order] > 0].tolist():
+                if budget <= 0:
+                    break
+                name, d, p = names[k], days[day_pos[k]], int(plt[k])
+                q = _pick_qty_plts(min(budget, int(cap[k]), item_left[name]), p)
+                if q > 0:
+                    q = _max_due_safe_qty(due_ledger, name, d, question_date, q, p)
+                if q <= 0:
                     continue
+                due_ledger.apply_move(name, d, question_date, q)
+                applied.append((name, d, q))
+                add_move(name, q, p, f"{d}_{target_line}", f"[폴백] 미래({d}) 동일라인 물량 당기기")
+                budget -= q
 
-                remain -= take
-                moves.append(
-                    {
-                        "item": name,
-                        "qty": take,
-                        "plt": take // plt,
-                        "from": f"{d}_{target_line}",
-                        "to": f"{question_date}_{target_line}",
-                        "reason": f"[폴백] 미래({d}) 동일라인 물량 당기기",
-                    }
-                )
+            # 제안만 하고 원장 반영은 step6 검증이 한다
+            for name, d, q in reversed(applied):
+                due_ledger.apply_move(name, question_date, d, q)
 
+    remain = need_increase - _sum_qty(moves)
     if remain > 0:
         notes.append(f"⚠️ [폴백] 증량 미달: 추가로 {remain:,}개 더 필요")
 
@@ -1255,7 +2384,7 @@ def python_fallback_increase(
 def generate_full_report(
     stock_result: Dict[str, Any],
     items_with_slack: List[Dict[str, Any]],
-    capa_status: Dict[str, Dict[str, Any]],
+    capa_status: CapaLedger,
     constraint_info: List[Dict[str, Any]],
     ai_strategy: Dict[str, Any],
     final_moves: List[Dict[str, Any]],
@@ -1358,7 +2487,7 @@ def generate_full_report(
     report.append("")
 
     report.append("## 🎯 [3단계] CAPA 현황")
-    for _, st in list(capa_status.items())[:12]:
+    for st in capa_status.rows()[:12]:
         report.append(f"- {st['date']} {st['line']}: 잔여 {st['remaining']:,}개 (가동률 {st['usage_rate']:.1f}%)")
     report.append("")
 
@@ -1421,142 +2550,330 @@ def generate_full_report(
 # 메인 엔진 (app (3).py 호환)
 # ========================================================================
 
-def ask_professional_scheduler(
-    question: str,
+def _prepare_stages(
     plan_df: pd.DataFrame,
-    hist_df: pd.DataFrame,
-    product_map: Dict[str, Any],
-    plt_map: Dict[str, Any],
     question_date: str,
-    mode: str = "hybrid",
-    today=None,
-    capa_limits: Optional[Dict[str, int]] = None,
-    genai_key: str = "",
-) -> Tuple[str, bool, List[Any], str, List[Dict[str, Any]]]:
-    """
-    Returns: (report, success, charts, status, validated_moves)_message)
+    target_line: str,
+    ctx: EngineContext,
+) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple[str, str]]]:
+    """1~4단계 (목표치와 무관: plan 스냅샷 + 날짜 + 라인 + ctx의 today/CAPA에만 의존)
+    Returns: (stages, None) 또는 (None, (오류 메시지, status))
     """
-    if today is None:
-        today = datetime(2026, 1, 5).date()
-    if capa_limits is None:
-        capa_limits = {"조립1": 3300, "조립2": 3700, "조립3": 3600}
-
-    initialize_globals(today, capa_limits)
-    today_str = today.strftime("%Y-%m-%d")
-
-    # 0) 대상 라인 탐색
-    target_line = _infer_target_line(question, plan_df, question_date)
-    if not target_line:
-        return (
-            "❌ 질문에서 대상 라인을 찾을 수 없습니다. (예: '조립1/조립2/조립3' 또는 품목 키워드 포함)",
-            False,
-            [],
-            "[ERROR] 라인 미지정",
-            [],
-        )
-
+    plan_index = ctx.plan_index
     # 1) stock
-    stock_res, err = step1_list_current_stock(plan_df, question_date, target_line)
+    stock_res, err = step1_list_current_stock(plan_df, question_date, target_line, plan_index=plan_index)
     if err:
-        return f"❌ [1단계 실패] {err}", False, [], "[ERROR] 품목 조회 실패", []
+        return None, (f"❌ [1단계 실패] {err}", "[ERROR] 품목 조회 실패")
 
     # 2) slack
-    items_with_slack = step2_calculate_cumulative_slack(plan_df, stock_res)
+    items_with_slack = step2_calculate_cumulative_slack(plan_df, stock_res, plan_index=plan_index)
     if not items_with_slack:
-        return "❌ [2단계 실패] 이동 가능한 품목이 없습니다.", False, [], "[ERROR] 품목 분석 실패", []
+        return None, ("❌ [2단계 실패] 이동 가능한 품목이 없습니다.", "[ERROR] 품목 분석 실패")
 
     # 3) capa
-    capa_status = step3_analyze_destination_capacity(plan_df, question_date, target_line, capa_limits)
+    capa_status = step3_analyze_destination_capacity(plan_df, question_date, target_line, ctx.capa_limits, ctx=ctx)
 
     # 4) constraint
-    constraint_info = step4_prepare_constraint_info(items_with_slack, target_line)
+    constraint_info = step4_prepare_constraint_info(items_with_slack, target_line, plan_index=plan_index)
     if not constraint_info:
-        return "❌ [4단계 실패] 이동 가능한 품목(1PLT 이상)이 없습니다.", False, [], "[ERROR] 제약정보 없음", []
+        return None, ("❌ [4단계 실패] 이동 가능한 품목(1PLT 이상)이 없습니다.", "[ERROR] 제약정보 없음")
 
-    # 5) 목표치 파싱: % or 샘플/추가 N
+    return {
+        "stock_res": stock_res,
+        "items_with_slack": items_with_slack,
+        "capa_status": capa_status,
+        "constraint_info": constraint_info,
+    }, None
+
+
+# ========================================================================
+# 1~4단계 캐시 (plan 스냅샷 단위)
+# ========================================================================
+
+STAGE_CACHE_SIZE = 64
+STAGE_CACHE_SNAPSHOTS = 4
+
+
+def plan_snapshot_key(plan_df: pd.DataFrame) -> str:
+    """plan_df 스냅샷 키 = 내용 해시 (앞에 plan_df.attrs["snapshot_key"]가 있으면 접두어로).
+    attrs는 슬라이스/필터 결과에도 그대로 전파되므로 그것만으로는 같은 행 수의 다른 부분 프레임과
+    구분되지 않는다 → 항상 내용 해시를 함께 넣는다 (수천 행 기준 수 ms)
+    """
+    if plan_df.empty:
+        h = "empty"
+    else:
+        digest = pd.util.hash_pandas_object(plan_df, index=False).sum()
+        h = f"{len(plan_df)}:{'|'.join(map(str, plan_df.columns))}:{int(digest) & 0xFFFFFFFFFFFFFFFF:x}"
+    key = plan_df.attrs.get("snapshot_key")
+    return f"{key}:{h}" if key else h
+
+
+class StageCache:
+    """목표치와 무관한 1~4단계(재고/누적여유/CAPA/제약) 결과 LRU 캐시.
+    - 키: (plan 스냅샷 키, question_date, target_line, capa_limits, today)
+    - 스냅샷별 PlanIndex/달력도 함께 보관 (최근 max_snapshots개). 스냅샷이 밀려나면 그 단계 결과도 함께 폐기
+      → 데이터가 바뀌면(새 스냅샷 키) 이전 항목은 다시 조회되지 않고 LRU로 정리된다
+    - capa_status(CapaLedger)는 검증에서 차감되므로 꺼낼 때마다 fork()를 돌려준다 (copy-on-write)
+    """
+
+    def __init__(self, maxsize: int = STAGE_CACHE_SIZE, max_snapshots: int = STAGE_CACHE_SNAPSHOTS):
+        self.maxsize = maxsize
+        self.max_snapshots = max_snapshots
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._contexts: "OrderedDict[str, Tuple[PlanIndex, WorkdayCalendar]]" = OrderedDict()
+        self._stages: "OrderedDict[Tuple[Any, ...], Tuple[Optional[Dict[str, Any]], Optional[Tuple[str, str]]]]" = OrderedDict()
+
+    def _drop_snapshot(self, snapshot_key: str) -> None:
+        # lock 보유 상태에서 호출
+        self._contexts.pop(snapshot_key, None)
+        for key in [k for k in self._stages if k[0] == snapshot_key]:
+            del self._stages[key]
+
+    def context(self, snapshot_key: str, plan_df: pd.DataFrame) -> Tuple[PlanIndex, WorkdayCalendar]:
+        """스냅샷당 PlanIndex/WorkdayCalendar 1회 구축"""
+        with self._lock:
+            ctx = self._contexts.get(snapshot_key)
+            if ctx is not None:
+                self._contexts.move_to_end(snapshot_key)
+                return ctx
+        ctx = (PlanIndex(plan_df), WorkdayCalendar(plan_df))
+        with self._lock:
+            ctx = self._contexts.setdefault(snapshot_key, ctx)
+            while len(self._contexts) > self.max_snapshots:
+                self._drop_snapshot(next(iter(self._contexts)))
+        return ctx
+
+    def stages(
+        self,
+        snapshot_key: str,
+        question_date: str,
+        target_line: str,
+        ctx: EngineContext,
+        build,
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[Tuple[str, str]]]:
+        """캐시된 1~4단계 결과 (없으면 build() 실행 후 저장)"""
+        key = (snapshot_key, question_date, target_line, tuple(sorted(ctx.capa_limits.items())), ctx.today_str)
+        with self._lock:
+            value = self._stages.get(key)
+            if value is not None:
+                self._stages.move_to_end(key)
+                self.hits += 1
+        if value is None:
+            value = build()
+            with self._lock:
+                self.misses += 1
+                self._stages[key] = value
+                while len(self._stages) > self.maxsize:
+                    self._stages.popitem(last=False)
+
+        stages, err = value
+        if stages is None:
+            return None, err
+        return {**stages, "capa_status": stages["capa_status"].fork()}, None
+
+    def invalidate(self, snapshot_key: Optional[str] = None) -> None:
+        """특정 스냅샷(없으면 전체) 폐기"""
+        with self._lock:
+            if snapshot_key is None:
+                self._contexts.clear()
+                self._stages.clear()
+            else:
+                self._drop_snapshot(snapshot_key)
+
+
+def _target_rule(question: str) -> Tuple[Optional[int], float]:
+    """목표치 규칙: 샘플/추가 N이면 (N, 0), 아니면 (None, CAPA 비율: % 또는 기본 75%)"""
     capa_match = re.search(r"(\d+)\s*%", question)
     sample_match = re.search(r"샘플\s*(\d+)", question)
     add_match = re.search(r"추가\s*(\d+)", question) or re.search(r"(\d+)\s*추가", question)
 
-    current_total = int(stock_res["total"])
     if sample_match or add_match:
-        add_qty = int((sample_match or add_match).group(1))
-        target_qty = current_total + add_qty
-        diff = target_qty - current_total  # +면 증량
-        capa_target = target_qty / int(capa_limits[target_line])
-    elif capa_match:
-        capa_target = int(capa_match.group(1)) / 100
-        target_qty = int(int(capa_limits[target_line]) * capa_target)
-        diff = target_qty - current_total
-    else:
-        # 기본 75% (기존 정책 유지)
-        capa_target = 0.75
-        target_qty = int(int(capa_limits[target_line]) * capa_target)
-        diff = target_qty - current_total
+        return int((sample_match or add_match).group(1)), 0.0
+    if capa_match:
+        return None, int(capa_match.group(1)) / 100
+    # 기본 75% (기존 정책 유지)
+    return None, 0.75
 
-    if diff == 0:
-        return "✅ 이미 목표 생산량과 동일합니다. 조치 불필요.", True, [], "[OK] 조치 불필요", []
 
-    operation_mode = "increase" if diff > 0 else "reduce"
-    operation_qty = abs(diff)
+def _parse_target(question: str, current_total: int, capa_limit: int) -> Tuple[int, float]:
+    """목표치 파싱: % or 샘플/추가 N → (target_qty, capa_target)"""
+    add_qty, capa_target = _target_rule(question)
+    if add_qty is not None:
+        target_qty = current_total + add_qty
+        capa_target = target_qty / int(capa_limit)
+    else:
+        target_qty = int(int(capa_limit) * capa_target)
+
+    return target_qty, capa_target
+
+
+# LLM 호출 전용 executor (선행 폴백 계산과 병렬로 Gemini 호출)
+# 시간 초과로 버린 호출도 끝날 때까지 스레드를 점유하므로, 진행 중(대기 포함) 호출을 AI_WORKERS건으로 제한하고
+# 자리가 없으면 큐에 쌓지 않고 바로 폴백한다
+AI_WORKERS = 4
+_AI_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_AI_SLOTS: Optional[threading.BoundedSemaphore] = None
+_AI_EXECUTOR_PID: Optional[int] = None
+_AI_EXECUTOR_LOCK = threading.Lock()
+
+
+def _ai_executor() -> Tuple[ThreadPoolExecutor, threading.BoundedSemaphore]:
+    # fork된 배치 워커는 부모의 executor 객체만 물려받고 스레드는 없음 → pid가 바뀌면 새로 생성
+    global _AI_EXECUTOR, _AI_SLOTS, _AI_EXECUTOR_PID
+    with _AI_EXECUTOR_LOCK:
+        if _AI_EXECUTOR is None or _AI_EXECUTOR_PID != os.getpid():
+            _AI_EXECUTOR = ThreadPoolExecutor(max_workers=AI_WORKERS, thread_name_prefix="gemini")
+            _AI_SLOTS = threading.BoundedSemaphore(AI_WORKERS)
+            _AI_EXECUTOR_PID = os.getpid()
+        return _AI_EXECUTOR, _AI_SLOTS
+
+
+def _run_ai(ask_ai, deadline: Optional[float]):
+    """executor 스레드에서 실행: 남은 예산을 요청 타임아웃으로 넘겨 대기 측과 같은 마감 시각을 쓴다"""
+    if deadline is None:
+        return ask_ai(timeout_sec=None)
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return None, "AI 응답 시간 초과 (호출 전 예산 소진)", AI_SOURCE_TIMEOUT
+    return ask_ai(timeout_sec=remaining)
+
+
+def _submit_ai(ask_ai, deadline: Optional[float]) -> Optional[Future]:
+    """진행 중 호출이 AI_WORKERS건이면 제출하지 않고 None (호출 측은 AI_SOURCE_BUSY로 폴백)"""
+    executor, slots = _ai_executor()
+    if not slots.acquire(blocking=False):
+        return None
+    try:
+        future = executor.submit(_run_ai, ask_ai, deadline)
+    except BaseException:
+        slots.release()
+        raise
+    # 끝나거나(버려진 호출 포함) 시작 전에 취소되면 자리 반환
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+# AI 미사용 사유별 폴백 표기 (보고서 "전략 수립"/5단계에 어떤 경로였는지 남김)
+_AI_FALLBACK_REASONS = {
+    AI_SOURCE_FAILED: ("Python 폴백 (AI 오류)", "AI 오류로 기본 로직 적용"),
+    AI_SOURCE_TIMEOUT: ("Python 폴백 (AI 응답 시간 초과)", "AI 응답 예산 초과로 기본 로직 적용"),
+    AI_SOURCE_BLOCKED: ("Python 폴백 (AI 차단: 연속 실패 쿨다운)", "연속 실패로 AI 호출을 건너뛰고 기본 로직 적용"),
+    AI_SOURCE_BUSY: ("Python 폴백 (AI 동시 호출 한도 초과)", "진행 중인 AI 호출이 한도에 달해 기본 로직 적용"),
+}
+
+
+def _await_ai(
+    ai_future: Optional[Future],
+    deadline: Optional[float],
+    timeout_sec: Optional[float],
+    breaker: Optional[CircuitBreaker],
+) -> Tuple[Optional[Dict[str, Any]], Optional[str], str]:
+    """LLM future를 마감 시각(제출 시점 + timeout_sec)까지만 기다리고 서킷 브레이커에 결과 기록.
+    시간 초과면 future를 버린다 (실행 중인 호출은 강제 종료 불가 → 늦게 온 응답은 무시, 기록도 안 함).
+    캐시 적중/차단/포화는 LLM 상태와 무관하므로 기록하지 않음.
+    """
+    if ai_future is None:
+        return None, f"AI 호출 생략 (동시 호출 {AI_WORKERS}건 진행 중)", AI_SOURCE_BUSY
+    try:
+        wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+        ai_strategy, ai_err, source = ai_future.result(timeout=wait)
+    except FuturesTimeoutError:
+        ai_future.cancel()
+        source = AI_SOURCE_TIMEOUT
+    if source == AI_SOURCE_TIMEOUT:
+        if breaker is not None:
+            breaker.record_failure()
+        return None, f"AI 응답 시간 초과 (예산 {timeout_sec:.1f}초)", AI_SOURCE_TIMEOUT
 
-    # 5) AI 전략
-    ai_failed = False
-    ai_error_msg = ""
-    extra_notes: List[str] = []
-    report_prefix: str = ""
+    if breaker is not None:
+        if source == AI_STRATEGY_SOURCE:
+            breaker.record_success()
+        elif source == AI_SOURCE_FAILED:
+            breaker.record_failure()
+    return ai_strategy, ai_err, source
 
-    fact_report = build_ai_fact_report(
-        constraint_info=constraint_info,
-        capa_status=capa_status,
-        target_date=question_date,
-        target_line=target_line,
-        operation_mode=operation_mode,
-        operation_qty=operation_qty,
-    )
 
-    ai_strategy, ai_err, strategy_source = step5_ask_ai_strategy(
-        fact_report=fact_report,
-        operation_mode=operation_mode,
-        operation_qty=operation_qty,
-        target_line=target_line,
-        target_date=question_date,
-        today_str=today_str,
-        capa_target_pct=int(capa_target * 100),
-        genai_key=genai_key,
-    )
+def _sum_qty(moves: List[Dict[str, Any]]) -> int:
+    return sum(int(m.get("qty", 0) or 0) for m in (moves or []))
 
-    if ai_strategy is None:
-        ai_failed = True
-        ai_error_msg = ai_err or "AI 전략 수립 실패"
-        ai_strategy = {"strategy": "AI 실패 → Python 폴백", "explanation": "AI 오류로 기본 로직 적용", "moves": []}
-        strategy_source = "Python 폴백 (AI 오류)"
 
-    # 6) 검증
+def _validate_and_fill(
+    ai_strategy: Dict[str, Any],
+    plan_df: pd.DataFrame,
+    constraint_info: List[Dict[str, Any]],
+    capa_status: CapaLedger,
+    question_date: str,
+    target_line: str,
+    operation_mode: str,
+    operation_qty: int,
+    ctx: EngineContext,
+    due_ledger: DueLedger,
+    reduce_solver: str = DEFAULT_REDUCE_SOLVER,
+) -> Tuple[List[Dict[str, Any]], List[str], List[str], int]:
+    """
+    6단계 검증 + 6.5) AI가 부족하면 Python 폴백으로 채우기
+    Returns: (final_moves, violations, 폴백 notes, remaining)
+    """
     final_moves, violations = step6_validate_ai_strategy(
         ai_strategy=ai_strategy,
         constraint_info=constraint_info,
         capa_status=capa_status,
         plan_df=plan_df,
         target_line=target_line,
+        ctx=ctx,
+        due_ledger=due_ledger,
     )
+    fb_notes_all, remaining = _fill_with_fallback(
+        final_moves=final_moves,
+        violations=violations,
+        plan_df=plan_df,
+        constraint_info=constraint_info,
+        capa_status=capa_status,
+        question_date=question_date,
+        target_line=target_line,
+        operation_mode=operation_mode,
+        operation_qty=operation_qty,
+        ctx=ctx,
+        due_ledger=due_ledger,
+        reduce_solver=reduce_solver,
+    )
+    return final_moves, violations, fb_notes_all, remaining
 
-    # 6.5) AI가 부족하면 Python 폴백으로 채우기
-    # - 폴백은 capa_status를 직접 깎지 않고(deepcopy로 시뮬레이션), 검증 통과분만 원본 capa_status에 반영
-    # - 검증 후 remaining을 다시 계산하여 최대 2회까지 재시도
-    def _sum_qty(moves: List[Dict[str, Any]]) -> int:
-        return sum(int(m.get("qty", 0) or 0) for m in (moves or []))
-
-    op_kr = "증량" if operation_mode == "increase" else "감축"
 
+def _fill_with_fallback(
+    final_moves: List[Dict[str, Any]],
+    violations: List[str],
+    plan_df: pd.DataFrame,
+    constraint_info: List[Dict[str, Any]],
+    capa_status: CapaLedger,
+    question_date: str,
+    target_line: str,
+    operation_mode: str,
+    operation_qty: int,
+    ctx: EngineContext,
+    due_ledger: DueLedger,
+    reduce_solver: str = DEFAULT_REDUCE_SOLVER,
+) -> Tuple[List[str], int]:
+    """
+    6.5) 이미 승인된 final_moves 기준 부족분을 Python 폴백으로 채움 (final_moves/violations에 이어 붙임)
+    - 폴백은 capa_status에서 시뮬레이션한 뒤 rollback으로 되돌리고, 검증 통과분만 다시 차감
+    - 검증 후 remaining을 다시 계산하여 최대 2회까지 재시도 (reduce_solver="flow"도 동일: 1회차 검증 후 남은 품목 수량으로 다시 풀어
+      같은날 타라인 이송 등 greedy 재시도가 채우는 분을 놓치지 않음)
+    Returns: (폴백 notes, remaining)
+    """
     remaining = max(0, operation_qty - _sum_qty(final_moves))
     fb_notes_all: List[str] = []
 
+    use_flow = operation_mode == "reduce" and reduce_solver == "flow"
+    max_fb_attempts = 2
+
     fb_attempts = 0
-    while remaining > 0 and fb_attempts < 2:
+    while remaining > 0 and fb_attempts < max_fb_attempts:
         fb_attempts += 1
 
-        sim_capa = deepcopy(capa_status)
+        sim_token = capa_status.snapshot()
 
         if operation_mode == "reduce":
             t6_sameday_used_now = any(
@@ -1566,28 +2883,57 @@ def ask_professional_scheduler(
                 and (str(x.get('to','')).split('_',1)[1] != target_line)
                 for x in final_moves
             )
-            fb_moves, fb_notes = python_fallback_reduce(
-                plan_df=plan_df,
-                constraint_info=constraint_info,
-                capa_status=sim_capa,
-                question_date=question_date,
-                target_line=target_line,
-                need_reduce=remaining,
-                t6_sameday_already_used=t6_sameday_used_now,
-            )
+            if use_flow:
+                fb_moves, fb_notes = python_optimize_reduce(
+                    plan_df=plan_df,
+                    constraint_info=constraint_info,
+                    capa_status=capa_status,
+                    question_date=question_date,
+                    target_line=target_line,
+                    need_reduce=remaining,
+                    t6_sameday_already_used=t6_sameday_used_now,
+                    ctx=ctx,
+                    due_ledger=due_ledger,
+                )
+            else:
+                fb_moves, fb_notes = python_fallback_reduce(
+                    plan_df=plan_df,
+                    constraint_info=constraint_info,
+                    capa_status=capa_status,
+                    question_date=question_date,
+                    target_line=target_line,
+                    need_reduce=remaining,
+                    t6_sameday_already_used=t6_sameday_used_now,
+                    ctx=ctx,
+                )
         else:
+            # 품목별 max_movable은 이미 승인된 이동(AI/앞 회차 폴백)만큼 뺀 잔여로 넘김 (품목 합계 기준 상한)
+            used: Dict[str, int] = {}
+            for m in final_moves:
+                used[str(m.get("item"))] = used.get(str(m.get("item")), 0) + int(m.get("qty", 0) or 0)
             fb_moves, fb_notes = python_fallback_increase(
                 plan_df=plan_df,
-                constraint_info=constraint_info,
-                capa_status=sim_capa,
+                constraint_info=[{**x, "max_movable": max(int(x["max_movable"]) - used.get(x["name"], 0), 0)} for x in constraint_info],
+                capa_status=capa_status,
                 question_date=question_date,
                 target_line=target_line,
                 need_increase=remaining,
+                ctx=ctx,
+                due_ledger=due_ledger,
             )
 
+        capa_status.rollback(sim_token)
+
         # 폴백 내부의 "미달" 숫자는 검증 탈락/재시도 때문에 어긋날 수 있으므로,
         # 여기서는 "미달" 문구는 버리고 최종 remaining 기준으로 마지막에 1번만 출력한다.
-        fb_notes_all.extend([n for n in (fb_notes or []) if "미달" not in n])
+        # 목표 슬롯 CAPA 잔여 / 최소비용 유량 요약도 재시도마다 (앞 회차 차감 후) 숫자가 달라지므로 첫 회차 것만 남긴다.
+        fb_notes_all.extend(
+            [
+                n for n in (fb_notes or [])
+                if "미달" not in n
+                and not any(k in n and any(k in x for x in fb_notes_all) for k in ("CAPA 잔여", "최소비용 유량"))
+            ]
+        )
 
         if fb_moves:
             fb_strategy = {"strategy": "Python 폴백 채움", "explanation": "AI 부족분을 기본 로직으로 보완", "moves": fb_moves}
@@ -1597,6 +2943,8 @@ def ask_professional_scheduler(
                 capa_status=capa_status,
                 plan_df=plan_df,
                 target_line=target_line,
+                ctx=ctx,
+                due_ledger=due_ledger,
             )
             final_moves.extend(fb_valid)
             violations.extend([f"[폴백검증] {x}" for x in fb_viol])
@@ -1605,97 +2953,356 @@ def ask_professional_scheduler(
 
         remaining = max(0, operation_qty - _sum_qty(final_moves))
 
+    return fb_notes_all, remaining
+
+
+class CapaEventWhatIf:
+    """CAPA 이벤트(잔업/특근) what-if 평가기 (감축 미달 시 6.6 단계).
+    - 기준: 검증 전 CapaLedger/DueLedger와 검증할 전략(AI 전략 또는 빈 폴백 전략)
+    - evaluate(events): 기준 원장을 fork()해 이벤트 CAPA만 더한 뒤 같은 전략으로 6단계 검증 + 폴백 채움
+      → 같은 이벤트를 반영한 원장에서 처음부터 푼 결과와 같다
+        (폴백 채움은 앞선 승인 순서에 따라 달라지므로 기준 결과 위에 덧붙이지 않음)
+    - step3 원장 재구축 없이 copy-on-write 사본만 만들고 AI 응답도 재사용
+    - 기준 원장은 바뀌지 않으므로 같은 기준으로 여러 이벤트 변형을 이어서 평가할 수 있다
+    """
+
+    def __init__(
+        self,
+        plan_df: pd.DataFrame,
+        constraint_info: List[Dict[str, Any]],
+        ai_strategy: Dict[str, Any],
+        capa_status: CapaLedger,
+        due_ledger: DueLedger,
+        question_date: str,
+        target_line: str,
+        operation_mode: str,
+        operation_qty: int,
+        ctx: EngineContext,
+        reduce_solver: str = DEFAULT_REDUCE_SOLVER,
+    ):
+        self.plan_df = plan_df
+        self.constraint_info = constraint_info
+        self.ai_strategy = ai_strategy
+        self.capa_status = capa_status.fork()
+        self.due_ledger = due_ledger.fork()
+        self.question_date = question_date
+        self.target_line = target_line
+        self.operation_mode = operation_mode
+        self.operation_qty = operation_qty
+        self.ctx = ctx
+        self.reduce_solver = reduce_solver
+        self._fork_lock = threading.Lock()  # fork()는 기준 원장의 공유 표시를 갱신 → 동시 평가 시 직렬화
+
+    def evaluate(self, events: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """events 적용 결과: final_moves/violations/notes/remaining/achievement와 이 변형의 capa_status/due_ledger
+        여러 스레드에서 동시에 호출해도 된다 (기준 원장은 fork만 하고 직접 바꾸지 않음)
+        """
+        with self._fork_lock:
+            capa_status, due_ledger = self.capa_status.fork(), self.due_ledger.fork()
+        _apply_capa_events_to_status(capa_status, events, self.ctx.capa_limits)
+
+        final_moves, violations, notes, remaining = _validate_and_fill(
+            ai_strategy=self.ai_strategy,
+            plan_df=self.plan_df,
+            constraint_info=self.constraint_info,
+            capa_status=capa_status,
+            question_date=self.question_date,
+            target_line=self.target_line,
+            operation_mode=self.operation_mode,
+            operation_qty=self.operation_qty,
+            ctx=self.ctx,
+            due_ledger=due_ledger,
+            reduce_solver=self.reduce_solver,
+        )
+        done = _sum_qty(final_moves)
+        return {
+            "events": events,
+            "final_moves": final_moves,
+            "violations": violations,
+            "notes": notes,
+            "remaining": remaining,
+            "achievement": (done / self.operation_qty * 100) if self.operation_qty else 0,
+            "capa_status": capa_status,
+            "due_ledger": due_ledger,
+        }
+
+
+def _event_search_eval(whatif: CapaEventWhatIf, events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """이벤트 조합 1건 점수 (달성률, 추가 CAPA) + 평가 결과(result: whatif.evaluate 반환값)"""
+    res = whatif.evaluate(events)
+    return {
+        "events": events,
+        "achievement": float(res["achievement"]),
+        "moved_qty": _sum_qty(res["final_moves"]),
+        "extra_capa": sum(int(e.get("delta_capa", 0) or 0) for e in events),
+        "result": res,
+    }
+
+
+def search_capa_events(
+    whatif: CapaEventWhatIf,
+    candidates: List[List[Dict[str, Any]]],
+    max_workers: int = EVENT_SEARCH_WORKERS,
+) -> List[Dict[str, Any]]:
+    """잔업/특근 조합 후보를 평가해 Pareto 최선(달성률 ↑, 추가 CAPA ↓) 목록을 추가 CAPA 오름차순으로 반환.
+    - 후보별 평가는 스레드 풀에서 병렬 수행: PlanIndex/WorkdayCalendar와 기준 원장은 읽기 전용으로 공유하고
+      후보마다 CapaLedger/DueLedger를 fork (plan을 프로세스로 복사하지 않음)
+    - 후보가 EVENT_SEARCH_MIN_PARALLEL개 미만이거나 max_workers <= 1이면 순차 평가 (결과 동일)
+    - 각 항목의 "result"에 평가 결과를 담아 두므로 호출 측은 고른 조합을 다시 평가하지 않는다
+    - 점수가 같으면 앞선 후보(기본 제안 우선)를 남김
+    """
+    evaluate = partial(_event_search_eval, whatif)
+    if max_workers <= 1 or len(candidates) < EVENT_SEARCH_MIN_PARALLEL:
+        scored = [evaluate(events) for events in candidates]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="capa-event") as ex:
+            scored = list(ex.map(evaluate, candidates))  # 후보 순서 유지
+
+    front: List[Dict[str, Any]] = []
+    for opt in sorted(scored, key=lambda o: (o["extra_capa"], -o["achievement"])):
+        if not front or opt["achievement"] > front[-1]["achievement"] + 1e-9:
+            front.append(opt)
+    return front
+
+
+def _solve_target(
+    plan_df: pd.DataFrame,
+    stages: Dict[str, Any],
+    question_date: str,
+    target_line: str,
+    target_qty: int,
+    capa_target: float,
+    ctx: EngineContext,
+    genai_key: str = "",
+    reduce_solver: str = DEFAULT_REDUCE_SOLVER,
+    use_ai: bool = True,
+    due_ledger: Optional[DueLedger] = None,
+    suggest_events: bool = True,
+    llm_cache: Optional[LLMCache] = None,
+    speculative_fallback: bool = True,
+    ai_timeout_sec: Optional[float] = LLM_TIMEOUT_SEC,
+    breaker: Optional[CircuitBreaker] = None,
+    event_search_limit: int = 0,
+    llm: Optional[LLMCall] = None,
+) -> Dict[str, Any]:
+    """5~6단계 + 폴백 + (감축 미달 시) CAPA 이벤트 재계산.
+    stages["capa_status"](CapaLedger)는 검증 과정에서 차감되므로, 재사용하려면 호출 측에서 fork()를 넘긴다.
+    - due_ledger: 여러 슬롯을 이어서 조정할 때 공유하는 누적 납기 원장 (없으면 새로 구축)
+    - suggest_events: False면 잔업/특근 CAPA 이벤트 재계산을 생략
+    - speculative_fallback: LLM 호출과 동시에 폴백 단독 계획을 복사본에서 계산
+      → 폴백만으로 목표 달성(잔량 < 최소 PLT)이면 LLM을 기다리지 않고 반환, 아니면 AI 경로 결과와 비교해 더 많이 달성한 쪽 채택
+      (공유 due_ledger를 받은 경우에는 원장 분기가 불가하므로 사용하지 않음)
+    - ai_timeout_sec: LLM 응답 대기 예산(초). 제출 시점에 정한 마감 시각 하나를 대기와 요청 타임아웃이 함께 쓴다
+      (선행 폴백 계산 시간 포함, 동시 호출이 AI_WORKERS건이면 호출 없이 폴백). 넘기면 Python 폴백으로 전환
+    - breaker: 연속 실패/시간 초과 시 쿨다운 동안 LLM 호출을 건너뛰는 서킷 브레이커
+    - llm: LLM 호출 함수 (없으면 Gemini, step5_ask_ai_strategy 참고)
+    - event_search_limit: >0이면 CAPA 이벤트를 기본 제안 1건 대신 최대 N개 조합으로 탐색(search_capa_events)해
+      최고 달성률 조합을 적용하고 Pareto 대안 표를 보고서에 추가 (0 = 기본 제안만)
+    """
+    stock_res = stages["stock_res"]
+    capa_status = stages["capa_status"]
+    constraint_info = stages["constraint_info"]
+    diff = target_qty - int(stock_res["total"])  # +면 증량
+    operation_mode = "increase" if diff > 0 else "reduce"
+    operation_qty = abs(diff)
+
+    # 5) AI 전략
+    ai_failed = False
+    ai_error_msg = ""
+    extra_notes: List[str] = []
+    report_prefix: str = ""
+
+    fact_report = build_ai_fact_report(
+        constraint_info=constraint_info,
+        capa_status=capa_status,
+        target_date=question_date,
+        target_line=target_line,
+        operation_mode=operation_mode,
+        operation_qty=operation_qty,
+    )
+
+    spec: Optional[Dict[str, Any]] = None
+    if use_ai:
+        ask_ai = partial(
+            step5_ask_ai_strategy,
+            fact_report=fact_report,
+            operation_mode=operation_mode,
+            operation_qty=operation_qty,
+            target_line=target_line,
+            target_date=question_date,
+            today_str=ctx.today_str,
+            capa_target_pct=int(capa_target * 100),
+            genai_key=genai_key,
+            llm_cache=llm_cache,
+            breaker=breaker,
+            llm=llm,
+        )
+        # 대기 예산과 Gemini 요청 타임아웃이 같은 마감 시각을 쓴다 (선행 폴백 계산 중에도 시계는 흐름)
+        ai_deadline = time.monotonic() + ai_timeout_sec if ai_timeout_sec else None
+        ai_future = _submit_ai(ask_ai, ai_deadline)
+        if speculative_fallback and due_ledger is None:
+            # LLM 응답을 기다리는 동안 Python 폴백 단독 계획을 CAPA/원장 복사본에서 미리 계산
+            spec_capa, spec_ledger = capa_status.fork(), DueLedger(ctx.plan_index)
+            spec_strategy = {"strategy": "Python 폴백", "explanation": "선행 계산", "moves": []}
+            spec_moves, spec_viol, spec_notes, spec_remaining = _validate_and_fill(
+                ai_strategy=spec_strategy,
+                plan_df=plan_df,
+                constraint_info=constraint_info,
+                capa_status=spec_capa,
+                question_date=question_date,
+                target_line=target_line,
+                operation_mode=operation_mode,
+                operation_qty=operation_qty,
+                ctx=ctx,
+                due_ledger=spec_ledger,
+                reduce_solver=reduce_solver,
+            )
+            # PLT 단위 이동이라 최소 PLT 미만의 잔량은 폴백으로 못 채움 → 그 이하면 목표 달성으로 본다
+            # (목표량 자체가 최소 PLT 미만이라 폴백 이동이 없으면 AI 결과를 기다린다)
+            min_plt = min((int(x["plt"]) for x in constraint_info if int(x["plt"]) > 0), default=1)
+            spec = {
+                "done": bool(spec_moves) and spec_remaining < min_plt,
+                "strategy": spec_strategy,
+                "capa_status": spec_capa,
+                "due_ledger": spec_ledger,
+                "final_moves": spec_moves,
+                "violations": spec_viol,
+                "notes": spec_notes,
+                "remaining": spec_remaining,
+            }
+            if spec["done"]:
+                # 폴백만으로 목표 달성 → LLM 응답은 기다리지 않음 (미시작이면 취소, 진행 중이면 결과 무시)
+                if ai_future is not None:
+                    ai_future.cancel()
+                ai_strategy = {"strategy": "Python 폴백", "explanation": "선행 계산한 폴백 계획으로 목표 달성 (AI 응답 대기 생략)", "moves": []}
+                ai_err, strategy_source = None, "Python 폴백 (선행 계산으로 목표 달성, AI 대기 생략)"
+            else:
+                ai_strategy, ai_err, strategy_source = _await_ai(ai_future, ai_deadline, ai_timeout_sec, breaker)
+        else:
+            ai_strategy, ai_err, strategy_source = _await_ai(ai_future, ai_deadline, ai_timeout_sec, breaker)
+    else:
+        ai_strategy = {"strategy": "Python 폴백", "explanation": "AI 단계 생략", "moves": []}
+        ai_err, strategy_source = None, "Python 폴백 (AI 미사용)"
+
+    if ai_strategy is None:
+        ai_failed = True
+        ai_error_msg = ai_err or "AI 전략 수립 실패"
+        strategy_source, explanation = _AI_FALLBACK_REASONS.get(strategy_source, _AI_FALLBACK_REASONS[AI_SOURCE_FAILED])
+        ai_strategy = {"strategy": "AI 실패 → Python 폴백", "explanation": explanation, "moves": []}
+
+    # 6) 검증 + 6.5) 폴백 채움 (누적 납기 원장은 capa_status와 함께 이어서 사용)
+    if due_ledger is None:
+        due_ledger = DueLedger(ctx.plan_index)
+    fill = partial(
+        _validate_and_fill,
+        plan_df=plan_df,
+        constraint_info=constraint_info,
+        question_date=question_date,
+        target_line=target_line,
+        operation_mode=operation_mode,
+        operation_qty=operation_qty,
+        ctx=ctx,
+        reduce_solver=reduce_solver,
+    )
+    # CAPA 이벤트 what-if 기준: 검증 전 원장 사본 + 채택한 결과의 전략 (감축에서만 쓰므로 그때만 fork)
+    event_base = (capa_status.fork(), due_ledger.fork()) if suggest_events and operation_mode == "reduce" else None
+    event_strategy = ai_strategy
+    if spec is not None and (spec["done"] or ai_failed):
+        # 목표 달성 또는 AI 실패(빈 전략 → 폴백 단독과 같은 계산) → 선행 계산 결과 그대로 사용
+        capa_status, due_ledger = spec["capa_status"], spec["due_ledger"]
+        final_moves, violations, fb_notes_all, remaining = spec["final_moves"], spec["violations"], spec["notes"], spec["remaining"]
+        event_strategy = spec["strategy"]
+    else:
+        final_moves, violations, fb_notes_all, remaining = fill(ai_strategy=ai_strategy, capa_status=capa_status, due_ledger=due_ledger)
+        if spec is not None and _sum_qty(spec["final_moves"]) > _sum_qty(final_moves):
+            # AI 계획(+채움)보다 선행 계산한 폴백 단독 계획이 더 많이 달성 → 폴백 계획 채택
+            extra_notes.append(
+                f"ℹ️ AI 검증 결과({_sum_qty(final_moves):,}개)보다 선행 Python 폴백({_sum_qty(spec['final_moves']):,}개)이 더 많아 폴백 계획 채택"
+            )
+            strategy_source = f"{strategy_source} → 선행 Python 폴백 채택"
+            capa_status, due_ledger = spec["capa_status"], spec["due_ledger"]
+            final_moves, violations, fb_notes_all, remaining = spec["final_moves"], spec["violations"], spec["notes"], spec["remaining"]
+            event_strategy = spec["strategy"]
+
+    op_kr = "증량" if operation_mode == "increase" else "감축"
     extra_notes.extend(fb_notes_all)
     if remaining > 0:
         extra_notes.append(f"⚠️ [폴백] {op_kr} 미달: 추가로 {remaining:,}개 더 {op_kr} 필요")
 
     # 6.6) (데모용) 달성률이 너무 낮고, 실패 원인이 CAPA 부족일 때 '잔업/특근'으로 CAPA를 상향한 개선안을 한 번 더 시뮬레이션
+    #      → step3 재구축 대신 검증 전 원장 사본에 이벤트 CAPA만 얹어 같은 전략으로 재검증 (CapaEventWhatIf)
     baseline_done = _sum_qty(final_moves)
     baseline_achievement = (baseline_done / operation_qty * 100) if operation_qty else 0
     baseline_shortfall = max(0, operation_qty - baseline_done)
 
     auto_threshold = 85.0  # 데모용: 달성률이 낮으면(기본 85% 미만) 운영 대안(잔업/특근) 시뮬레이션
-    if operation_mode == "reduce" and baseline_shortfall > 0 and baseline_achievement < auto_threshold:
+    event_options: List[Dict[str, Any]] = []
+    if suggest_events and operation_mode == "reduce" and baseline_shortfall > 0 and baseline_achievement < auto_threshold:
         capa_related_fail = any(("CAPA 부족" in v or "조정 불가" in v) for v in violations)
         if capa_related_fail:
             plts = [int(it.get("plt", 0) or 0) for it in stock_res.get("items", []) if int(it.get("plt", 0) or 0) > 0]
             plt_base = min(plts) if plts else 1
 
-            capa_events = _suggest_capa_events_auto(
+            whatif = CapaEventWhatIf(
                 plan_df=plan_df,
+                constraint_info=constraint_info,
+                ai_strategy=event_strategy,
+                capa_status=event_base[0],
+                due_ledger=event_base[1],
                 question_date=question_date,
                 target_line=target_line,
-                shortfall_qty=baseline_shortfall,
-                plt_base=plt_base,
-                max_days=2,
+                operation_mode=operation_mode,
+                operation_qty=operation_qty,
+                ctx=ctx,
+                reduce_solver=reduce_solver,
             )
-
-            if capa_events:
-                capa_status2 = step3_analyze_destination_capacity(plan_df, question_date, target_line, capa_limits)
-                _apply_capa_events_to_status(capa_status2, capa_events, capa_limits)
-
-                final2, viol2 = step6_validate_ai_strategy(
-                    ai_strategy=ai_strategy,
-                    constraint_info=constraint_info,
-                    capa_status=capa_status2,
+            if event_search_limit > 0:
+                candidates = _capa_event_candidates(
                     plan_df=plan_df,
+                    question_date=question_date,
                     target_line=target_line,
+                    shortfall_qty=baseline_shortfall,
+                    plt_base=plt_base,
+                    calendar=ctx.calendar,
+                    limit=event_search_limit,
+                )
+                event_options = [
+                    o for o in search_capa_events(whatif, candidates)
+                    if o["achievement"] > baseline_achievement + 0.1
+                ]
+                # Pareto 목록의 마지막 = 최고 달성률 중 추가 CAPA 최소 (평가 결과 재사용)
+                capa_events = event_options[-1]["events"] if event_options else []
+                ev_res = event_options[-1].pop("result") if event_options else None
+                for o in event_options:
+                    o.pop("result", None)  # 반환값에 원장 사본을 남기지 않음
+            else:
+                ev_res = None
+                capa_events = _suggest_capa_events_auto(
+                    plan_df=plan_df,
+                    question_date=question_date,
+                    target_line=target_line,
+                    shortfall_qty=baseline_shortfall,
+                    plt_base=plt_base,
+                    max_days=2,
+                    calendar=ctx.calendar,
                 )
 
-                remaining2 = max(0, operation_qty - _sum_qty(final2))
-                fb_notes2: List[str] = []
-                fb_attempts2 = 0
-                while remaining2 > 0 and fb_attempts2 < 2:
-                    fb_attempts2 += 1
-                    sim2 = deepcopy(capa_status2)
-
-                    t6_sameday_used_now2 = any(
-                        (str(x.get('item')) == 'T6 (P703) 수원(U725)')
-                        and (str(x.get('from','')) == f"{question_date}_{target_line}")
-                        and str(x.get('to','')).startswith(f"{question_date}_")
-                        and (str(x.get('to','')).split('_',1)[1] != target_line)
-                        for x in final2
-                    )
-                    fb_moves2, fb_notes_tmp = python_fallback_reduce(
-                        plan_df=plan_df,
-                        constraint_info=constraint_info,
-                        capa_status=sim2,
-                        question_date=question_date,
-                        target_line=target_line,
-                        need_reduce=remaining2,
-                        t6_sameday_already_used=t6_sameday_used_now2,
-                    )
-
-                    fb_notes2.extend([n for n in (fb_notes_tmp or []) if "미달" not in n])
-
-                    if fb_moves2:
-                        fb_strategy2 = {"strategy": "Python 폴백 채움", "explanation": "AI 부족분을 기본 로직으로 보완", "moves": fb_moves2}
-                        fb_valid2, fb_viol2 = step6_validate_ai_strategy(
-                            ai_strategy=fb_strategy2,
-                            constraint_info=constraint_info,
-                            capa_status=capa_status2,
-                            plan_df=plan_df,
-                            target_line=target_line,
-                        )
-                        final2.extend(fb_valid2)
-                        viol2.extend([f"[폴백검증] {x}" for x in fb_viol2])
-                    else:
-                        break
-
-                    remaining2 = max(0, operation_qty - _sum_qty(final2))
-
-                done2 = _sum_qty(final2)
-                ach2 = (done2 / operation_qty * 100) if operation_qty else 0
+            if capa_events:
+                if ev_res is None:
+                    ev_res = whatif.evaluate(capa_events)
+                final2, viol2, fb_notes2, remaining2 = ev_res["final_moves"], ev_res["violations"], ev_res["notes"], ev_res["remaining"]
+                capa_status2, ach2 = ev_res["capa_status"], ev_res["achievement"]
 
                 if ach2 > baseline_achievement + 0.1:
                     report_prefix = _format_capa_events_md(capa_events)
+                    report_prefix += _format_capa_event_options_md(event_options, capa_events)
                     report_prefix += f"### 이벤트 적용 전 결과\n- 달성률: **{baseline_achievement:.1f}%** (미달 **{baseline_shortfall:,}개**)\n\n"
                     report_prefix += f"### 이벤트 적용 후 결과(재계산)\n- 달성률: **{ach2:.1f}%**\n\n"
 
                     final_moves = final2
                     violations = viol2
                     capa_status = capa_status2
-                    extra_notes = fb_notes2[:]
+                    extra_notes = [n for n in extra_notes if "미달" not in n] + fb_notes2
                     if remaining2 > 0:
                         extra_notes.append(f"⚠️ [폴백] 감축 미달: 추가로 {remaining2:,}개 더 감축 필요")
     # 최종 달성률 기반 success/status
@@ -1709,26 +3316,651 @@ def ask_professional_scheduler(
         status = f"[WARN] 조치 완료(미달) - 달성률 {achievement:.1f}%"
         success = False
 
+    return {
+        "target_qty": target_qty,
+        "capa_target": capa_target,
+        "operation_mode": operation_mode,
+        "operation_qty": operation_qty,
+        "ai_strategy": ai_strategy,
+        "strategy_source": strategy_source,
+        "ai_failed": ai_failed,
+        "ai_error": ai_error_msg,
+        "final_moves": final_moves,
+        "violations": violations,
+        "capa_status": capa_status,
+        "extra_notes": extra_notes,
+        "report_prefix": report_prefix,
+        "capa_event_options": event_options,
+        "moved_total": moved_total,
+        "achievement": achievement,
+        "success": success,
+        "status": status,
+    }
+
+
+def ask_professional_scheduler(
+    question: str,
+    plan_df: pd.DataFrame,
+    hist_df: Any,
+    product_map: Dict[str, Any],
+    plt_map: Dict[str, Any],
+    question_date: str,
+    mode: str = "hybrid",
+    today=None,
+    capa_limits: Optional[Dict[str, int]] = None,
+    genai_key: str = "",
+    plan_index: Optional[PlanIndex] = None,
+    calendar: Optional[WorkdayCalendar] = None,
+    reduce_solver: str = DEFAULT_REDUCE_SOLVER,
+    stage_cache: Optional[StageCache] = None,
+    llm_cache: Optional[LLMCache] = None,
+    speculative_fallback: bool = True,
+    ai_timeout_sec: Optional[float] = LLM_TIMEOUT_SEC,
+    breaker: Optional[CircuitBreaker] = None,
+    event_search_limit: int = 0,
+    llm: Optional[LLMCall] = None,
+) -> Tuple[str, bool, List[Any], str, List[Dict[str, Any]]]:
+    """
+    Returns: (report, success, charts, status, validated_moves)_message)
+    - hist_df: 이력 DataFrame 또는 지연 로딩 핸들(get(columns)로 필요할 때만 조회). 현재 파이프라인은 사용하지 않음
+    - plan_index/calendar: 같은 plan_df 스냅샷으로 여러 번 호출할 때 재사용 (없으면 1회 구축)
+    - reduce_solver: 감축 폴백 방식 ("greedy" = python_fallback_reduce, "flow" = python_optimize_reduce 최소비용 유량,
+      둘 다 검증 후 최대 2회 재시도, 기본값 DEFAULT_REDUCE_SOLVER)
+    - stage_cache: 같은 스냅샷/날짜/라인 질문의 1~4단계(및 인덱스/달력)를 재사용 → 5~6단계만 재실행
+    - llm_cache: 같은 프롬프트의 Gemini 응답 재사용 (검증은 매번 수행)
+    - speculative_fallback: Gemini 호출 중 Python 폴백 계획을 미리 계산 (폴백만으로 목표 달성이면 AI 대기 생략)
+    - ai_timeout_sec/breaker: Gemini 응답 대기 예산과 서킷 브레이커 (초과/차단 시 Python 폴백, 보고서에 경로 표기)
+    - llm: LLM 호출 함수 주입 (없으면 Gemini, 테스트용 가짜 LLM 등)
+    - event_search_limit: 감축 미달 시 잔업/특근 조합을 최대 N개 탐색 (0 = 기본 제안 1건)
+    """
+    snapshot_key = plan_snapshot_key(plan_df) if stage_cache is not None else None
+    if stage_cache is not None and (plan_index is None or calendar is None):
+        cached_index, cached_calendar = stage_cache.context(snapshot_key, plan_df)
+        plan_index = plan_index if plan_index is not None else cached_index
+        calendar = calendar if calendar is not None else cached_calendar
+    ctx = EngineContext.for_request(plan_df, today=today, capa_limits=capa_limits, plan_index=plan_index, calendar=calendar)
+    today_str = ctx.today_str
+
+    # 0) 대상 라인 탐색
+    target_line = _infer_target_line(question, plan_df, question_date)
+    if not target_line:
+        return (
+            "❌ 질문에서 대상 라인을 찾을 수 없습니다. (예: '조립1/조립2/조립3' 또는 품목 키워드 포함)",
+            False,
+            [],
+            "[ERROR] 라인 미지정",
+            [],
+        )
+
+    # 1~4) 목표치와 무관한 단계
+    if stage_cache is not None:
+        stages, err = stage_cache.stages(
+            snapshot_key,
+            question_date,
+            target_line,
+            ctx,
+            lambda: _prepare_stages(plan_df, question_date, target_line, ctx),
+        )
+    else:
+        stages, err = _prepare_stages(plan_df, question_date, target_line, ctx)
+    if err:
+        return err[0], False, [], err[1], []
+
+    # 5) 목표치 파싱: % or 샘플/추가 N
+    target_qty, capa_target = _parse_target(question, int(stages["stock_res"]["total"]), int(ctx.capa_limits[target_line]))
+    if target_qty == int(stages["stock_res"]["total"]):
+        return "✅ 이미 목표 생산량과 동일합니다. 조치 불필요.", True, [], "[OK] 조치 불필요", []
+
+    # 5~6) AI 전략 + 검증 + 폴백
+    res = _solve_target(
+        plan_df=plan_df,
+        stages=stages,
+        question_date=question_date,
+        target_line=target_line,
+        target_qty=target_qty,
+        capa_target=capa_target,
+        ctx=ctx,
+        genai_key=genai_key,
+        reduce_solver=reduce_solver,
+        llm_cache=llm_cache,
+        speculative_fallback=speculative_fallback,
+        ai_timeout_sec=ai_timeout_sec,
+        breaker=breaker,
+        event_search_limit=event_search_limit,
+        llm=llm,
+    )
+
     # 보고서
-    report = (report_prefix or "") + generate_full_report(
-        stock_result=stock_res,
-        items_with_slack=items_with_slack,
-        capa_status=capa_status,
-        constraint_info=constraint_info,
-        ai_strategy=ai_strategy,
-        final_moves=final_moves,
-        violations=violations,
+    report = (res["report_prefix"] or "") + generate_full_report(
+        stock_result=stages["stock_res"],
+        items_with_slack=stages["items_with_slack"],
+        capa_status=res["capa_status"],
+        constraint_info=stages["constraint_info"],
+        ai_strategy=res["ai_strategy"],
+        final_moves=res["final_moves"],
+        violations=res["violations"],
         target_qty=target_qty,
         capa_target=capa_target,
-        operation_mode=operation_mode,
-        operation_qty=operation_qty,
-        strategy_source=strategy_source,
-        ai_failed=ai_failed,
-        ai_error=ai_error_msg,
+        operation_mode=res["operation_mode"],
+        operation_qty=res["operation_qty"],
+        strategy_source=res["strategy_source"],
+        ai_failed=res["ai_failed"],
+        ai_error=res["ai_error"],
         today_str=today_str,
         question_date=question_date,
         target_line=target_line,
-        extra_notes=extra_notes,
+        extra_notes=res["extra_notes"],
     )
 
-    return report, success, [], status, final_moves
+    return report, res["success"], [], res["status"], res["final_moves"]
+
+
+# ========================================================================
+# 배치 시나리오 평가 (날짜 × 라인 × 목표% 여러 건을 한 번에)
+# ========================================================================
+
+BATCH_COLUMNS = [
+    "scenario",
+    "date",
+    "line",
+    "target_pct",
+    "current_qty",
+    "target_qty",
+    "operation_mode",
+    "operation_qty",
+    "moved_qty",
+    "achievement",
+    "success",
+    "status",
+    "strategy_source",
+    "moves_count",
+    "moves",
+    "error",
+]
+
+# 워커 프로세스별 컨텍스트 (initializer에서 1회 구축)
+_BATCH_CTX: Dict[str, Any] = {}
+
+
+def _batch_context(
+    plan_df: pd.DataFrame,
+    today,
+    capa_limits: Dict[str, int],
+    plan_index: Optional[PlanIndex] = None,
+    calendar: Optional[WorkdayCalendar] = None,
+) -> Dict[str, Any]:
+    return {
+        "plan_df": plan_df,
+        "engine": EngineContext.for_request(plan_df, today=today, capa_limits=capa_limits, plan_index=plan_index, calendar=calendar),
+    }
+
+
+def _batch_init(
+    plan_df: pd.DataFrame,
+    today,
+    capa_limits: Dict[str, int],
+    plan_index: Optional[PlanIndex] = None,
+    calendar: Optional[WorkdayCalendar] = None,
+) -> None:
+    """ProcessPoolExecutor initializer: 워커당 컨텍스트 1회 준비 (호출 측 인덱스/달력이 있으면 그 사본, 없으면 구축)"""
+    _BATCH_CTX.clear()
+    _BATCH_CTX.update(_batch_context(plan_df, today, capa_limits, plan_index=plan_index, calendar=calendar))
+
+
+def _normalize_scenario(sc: Any) -> Dict[str, Any]:
+    """(date, line, pct) 튜플 또는 {"date", "line", "target_pct" | "add_qty"} dict"""
+    if isinstance(sc, dict):
+        return {
+            "date": _safe_str_date(sc.get("date")),
+            "line": str(sc.get("line", "")),
+            "target_pct": sc.get("target_pct"),
+            "add_qty": sc.get("add_qty"),
+        }
+    d, line, pct = sc
+    return {"date": _safe_str_date(d), "line": str(line), "target_pct": pct, "add_qty": None}
+
+
+def _batch_eval_group(
+    question_date: str,
+    target_line: str,
+    scenarios: List[Tuple[int, Dict[str, Any]]],
+    use_ai: bool,
+    genai_key: str,
+    reduce_solver: str,
+    ctx: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """같은 (날짜, 라인) 시나리오 묶음: 1~4단계 1회 → 목표치별 5~6단계"""
+    ctx = ctx if ctx is not None else _BATCH_CTX
+    engine: EngineContext = ctx["engine"]
+    capa_limits = engine.capa_limits
+
+    stages, err = None, None
+    if target_line not in capa_limits:
+        err = (f"❌ 알 수 없는 라인: {target_line}", "[ERROR] 라인 미지정")
+    else:
+        stages, err = _prepare_stages(ctx["plan_df"], question_date, target_line, engine)
+
+    rows: List[Dict[str, Any]] = []
+    for i, sc in scenarios:
+        row = {c: None for c in BATCH_COLUMNS}
+        row.update(scenario=i, date=question_date, line=target_line, target_pct=sc["target_pct"], moves=[])
+        if err:
+            row.update(success=False, status=err[1], error=err[0])
+            rows.append(row)
+            continue
+
+        current = int(stages["stock_res"]["total"])
+        capa_limit = int(capa_limits[target_line])
+        if sc.get("add_qty") is not None:
+            target_qty = current + int(sc["add_qty"])
+            capa_target = target_qty / capa_limit
+        else:
+            pct = sc["target_pct"] if sc["target_pct"] is not None else 75
+            capa_target = float(pct) / 100
+            target_qty = int(capa_limit * capa_target)
+        row.update(current_qty=current, target_qty=target_qty, target_pct=round(capa_target * 100, 1))
+
+        if target_qty == current:
+            row.update(operation_qty=0, moved_qty=0, achievement=100.0, success=True, status="[OK] 조치 불필요", moves_count=0)
+            rows.append(row)
+            continue
+
+        res = _solve_target(
+            plan_df=ctx["plan_df"],
+            stages={**stages, "capa_status": stages["capa_status"].fork()},
+            question_date=question_date,
+            target_line=target_line,
+            target_qty=target_qty,
+            capa_target=capa_target,
+            ctx=engine,
+            genai_key=genai_key,
+            reduce_solver=reduce_solver,
+            use_ai=use_ai,
+        )
+        row.update(
+            operation_mode=res["operation_mode"],
+            operation_qty=res["operation_qty"],
+            moved_qty=res["moved_total"],
+            achievement=round(res["achievement"], 1),
+            success=res["success"],
+            status=res["status"],
+            strategy_source=res["strategy_source"],
+            moves_count=len(res["final_moves"]),
+            moves=res["final_moves"],
+        )
+        rows.append(row)
+    return rows
+
+
+def evaluate_scenarios(
+    plan_df: pd.DataFrame,
+    scenarios: List[Any],
+    today=None,
+    capa_limits: Optional[Dict[str, int]] = None,
+    use_ai: bool = False,
+    genai_key: str = "",
+    reduce_solver: str = DEFAULT_REDUCE_SOLVER,
+    max_workers: Optional[int] = None,
+    plan_index: Optional[PlanIndex] = None,
+    calendar: Optional[WorkdayCalendar] = None,
+) -> pd.DataFrame:
+    """
+    여러 시나리오를 한 번에 평가해 결과 표(BATCH_COLUMNS) 1개로 반환.
+    - scenarios: [(date, line, target_pct), ...] 또는 [{"date", "line", "target_pct" | "add_qty"}, ...]
+    - 같은 (date, line)은 1~4단계(재고/누적여유/CAPA/제약)를 1회만 계산하고 목표치별로 5~6단계만 수행
+    - (date, line) 묶음은 프로세스 풀로 병렬 평가, max_workers<=1이면 순차 (두 경로 결과 동일)
+    - plan_index/calendar: 이미 만든 인덱스/달력 재사용 (이동을 반영한 인덱스도 그대로 평가 기준이 됨).
+      프로세스 풀 워커에는 initializer로 사본을 1회 넘기고, 없으면 워커마다 plan_df로 구축
+    - use_ai=False(기본)면 LLM 단계를 건너뛰고 Python 폴백만 사용
+    """
+    groups: Dict[Tuple[str, str], List[Tuple[int, Dict[str, Any]]]] = {}
+    for i, sc in enumerate(scenarios):
+        norm = _normalize_scenario(sc)
+        groups.setdefault((norm["date"], norm["line"]), []).append((i, norm))
+    if not groups:
+        return pd.DataFrame(columns=BATCH_COLUMNS)
+
+    if max_workers is None:
+        max_workers = min(len(groups), os.cpu_count() or 1)
+
+    results: List[List[Dict[str, Any]]] = []
+    if max_workers > 1 and len(groups) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_batch_init,
+                                     initargs=(plan_df, today, capa_limits, plan_index, calendar)) as ex:
+                futures = [
+                    ex.submit(_batch_eval_group, d, line, scs, use_ai, genai_key, reduce_solver)
+                    for (d, line), scs in groups.items()
+                ]
+                results = [f.result() for f in futures]
+        except (BrokenProcessPool, OSError):
+            results = []  # 프로세스 풀을 못 쓰는 환경 → 아래 순차 평가
+
+    if not results:
+        ctx = _batch_context(plan_df, today, capa_limits, plan_index=plan_index, calendar=calendar)
+        results = [
+            _batch_eval_group(d, line, scs, use_ai, genai_key, reduce_solver, ctx=ctx)
+            for (d, line), scs in groups.items()
+        ]
+
+    rows = sorted((row for group in results for row in group), key=lambda r: r["scenario"])
+    return pd.DataFrame(rows, columns=BATCH_COLUMNS)
+
+
+# ========================================================================
+# 월 단위 CAPA 평준화 (과부하 슬롯 일괄 해소)
+# ========================================================================
+
+def capa_load_matrix(plan_index: PlanIndex, capa_limits: Dict[str, int], dates: Optional[List[str]] = None) -> pd.DataFrame:
+    """날짜 × 라인 부하(qty_1차 합) 표.
+    인덱스의 (날짜, 라인) 합계(slot_total, apply_move로 반영된 이동 포함)를 한 번에 펼친 뒤 dates × capa_limits로 맞춤
+    """
+    dates = plan_index.dates() if dates is None else dates
+    lines = list(capa_limits)
+    totals = pd.Series(plan_index.slot_total, dtype="int64")
+    if totals.empty:
+        load = pd.DataFrame(0, index=dates, columns=lines, dtype="int64")
+    else:
+        totals.index = totals.index.set_names(["plan_date", "line"])
+        load = totals.groupby(level=["plan_date", "line"]).sum().unstack("line")
+        load = load.reindex(index=dates, columns=lines).fillna(0).astype("int64")
+    load.index.name = "plan_date"
+    load.columns.name = None
+    return load
+
+
+def level_capa_month(
+    plan_df: pd.DataFrame,
+    today=None,
+    capa_limits: Optional[Dict[str, int]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    target_pct: int = 100,
+    use_ai: bool = False,
+    genai_key: str = "",
+    reduce_solver: str = DEFAULT_REDUCE_SOLVER,
+) -> Dict[str, Any]:
+    """
+    로드된 계획 전체의 날짜×라인 부하를 보고 CAPA(×target_pct%) 초과 슬롯을 날짜순으로 한 번에 해소.
+    - 슬롯마다 감축 파이프라인(1~6단계 + 폴백)을 돌리되, 승인된 이동은 공유 인덱스(= CAPA 원장)와
+      누적 납기 원장에 바로 반영 → 뒤 날짜 슬롯은 앞선 결정(연기분 유입 등)을 본 상태에서 계산
+    - 잔업/특근 이벤트 재계산은 하지 않음 (기존 CAPA 안에서의 이동만)
+    - use_ai=False(기본)면 LLM 호출 없이 Python 폴백만 사용
+    Returns: {"moves", "slots"(슬롯별 결과 표), "load_before", "load_after", "target_pct"(보고서 기준)}
+    """
+    # 이동을 누적 반영하므로 호출 측(캐시된) 인덱스와 분리된 전용 인덱스를 쓴다
+    ctx = EngineContext.for_request(plan_df, today=today, capa_limits=capa_limits)
+    capa_limits, today_str = ctx.capa_limits, ctx.today_str
+    plan_index, calendar = ctx.plan_index, ctx.calendar
+    due_ledger = DueLedger(plan_index)
+
+    dates = [
+        d
+        for d in plan_index.dates()
+        if d > today_str
+        and (not start_date or d >= start_date)
+        and (not end_date or d <= end_date)
+        and calendar.is_workday(d)
+    ]
+    load_before = capa_load_matrix(plan_index, capa_limits, dates)
+
+    moves: List[Dict[str, Any]] = []
+    slots: List[Dict[str, Any]] = []
+    for d in dates:
+        for line in capa_limits:
+            limit = int(int(capa_limits[line]) * target_pct / 100)
+            load = plan_index.slot_qty(d, line)
+            if load <= limit:
+                continue
+
+            row = {"date": d, "line": line, "load_before": load, "limit": limit, "moved_qty": 0, "load_after": load, "achievement": 0.0, "status": ""}
+            stages, err = _prepare_stages(plan_df, d, line, ctx)
+            if err:
+                row["status"] = err[1]
+                slots.append(row)
+                continue
+
+            res = _solve_target(
+                plan_df=plan_df,
+                stages=stages,
+                question_date=d,
+                target_line=line,
+                target_qty=limit,
+                capa_target=target_pct / 100,
+                ctx=ctx,
+                genai_key=genai_key,
+                reduce_solver=reduce_solver,
+                use_ai=use_ai,
+                due_ledger=due_ledger,
+                suggest_events=False,
+            )
+            for m in res["final_moves"]:
+                from_loc = m.get("from") if "_" in str(m.get("from") or "") else f"{d}_{line}"
+                plan_index.apply_move(m["item"], from_loc, m["to"], m["qty"])
+                moves.append({**m, "from": from_loc, "slot": f"{d}_{line}"})
+
+            row.update(
+                moved_qty=res["moved_total"],
+                load_after=plan_index.slot_qty(d, line),
+                achievement=round(res["achievement"], 1),
+                status=res["status"],
+            )
+            slots.append(row)
+
+    return {
+        "moves": moves,
+        "slots": pd.DataFrame(slots, columns=["date", "line", "load_before", "limit", "moved_qty", "load_after", "achievement", "status"]),
+        "load_before": load_before,
+        "load_after": capa_load_matrix(plan_index, capa_limits, dates),
+        "target_pct": target_pct,
+    }
+
+
+def format_leveling_report(result: Dict[str, Any]) -> str:
+    """level_capa_month 결과 → 보고서 markdown (앱의 '최종 조치 계획' 섹션 규칙과 동일)"""
+    slots: pd.DataFrame = result["slots"]
+    moves: List[Dict[str, Any]] = result["moves"]
+    unresolved = slots[slots["load_after"] > slots["limit"]] if not slots.empty else slots
+
+    report = ["# 📅 월간 CAPA 평준화", ""]
+    report.append("## 📌 요약")
+    report.append(f"- 기준: CAPA {result['target_pct']}% 이하")
+    report.append(f"- 과부하 슬롯: **{len(slots)}개** (해소 {len(slots) - len(unresolved)}개 / 미해소 {len(unresolved)}개)")
+    report.append(f"- 총 이동량: **{sum(int(m['qty']) for m in moves):,}개** ({len(moves)}건)")
+    report.append("")
+
+    report.append("## 🏭 슬롯별 결과")
+    if slots.empty:
+        report.append("✅ CAPA 초과 슬롯 없음")
+    else:
+        report.append("| 날짜 | 라인 | 조정 전 | 기준 | 이동 | 조정 후 | 달성률 |")
+        report.append("|---|---|---:|---:|---:|---:|---:|")
+        for r in slots.itertuples(index=False):
+            mark = "✅" if r.load_after <= r.limit else "⚠️"
+            report.append(
+                f"| {r.date} | {r.line} | {r.load_before:,} | {r.limit:,} | {r.moved_qty:,} | {mark} {r.load_after:,} | {r.achievement:.1f}% |"
+            )
+    report.append("")
+
+    report.extend(_format_action_plan(moves))
+    return "\n".join(report)
+
+
+def _format_action_plan(moves: List[Dict[str, Any]]) -> List[str]:
+    """일괄 처리 보고서 공통 '최종 조치 계획' 섹션 (앱 build_action_md가 이 제목으로 찾음)"""
+    out = [f"## 🧾 최종 조치 계획 ({len(moves)}개)"]
+    if moves:
+        for i, m in enumerate(moves, 1):
+            out.append(
+                f"{i}) {m['item']} | {int(m['qty']):+,}개({m.get('plt', '?')}PLT) | "
+                f"{m.get('from', '-')} → {m.get('to', '-')} | {m.get('reason', '-')}"
+            )
+    else:
+        out.append("❌ 승인된 조치 없음")
+    out.append("")
+    return out
+
+
+# ========================================================================
+# 기간 조정 ("1/19~1/23 조립2 80%": 여러 날짜를 한 번에)
+# ========================================================================
+
+RANGE_COLUMNS = ["date", "current_qty", "target_qty", "operation_mode", "operation_qty", "moved_qty", "qty_after", "achievement", "status"]
+
+
+def adjust_date_range(
+    question: str,
+    plan_df: pd.DataFrame,
+    start_date: str,
+    end_date: str,
+    today=None,
+    capa_limits: Optional[Dict[str, int]] = None,
+    genai_key: str = "",
+    reduce_solver: str = DEFAULT_REDUCE_SOLVER,
+    use_ai: bool = False,
+    stage_cache: Optional[StageCache] = None,
+) -> Dict[str, Any]:
+    """
+    기간 조정 요청을 한 번에 처리 (같은 라인, 날짜마다 같은 목표: % 또는 추가 N).
+    - 기간 안 가동일(오늘 이후)을 날짜순으로 돌며 현재량/목표량을 공유 인덱스의 현재 부하에서 산출
+      (추가 N은 앞 날짜 이동이 반영된 부하 + N, %는 CAPA × %)
+    - 조정이 필요한 날만 날짜순으로 1~6단계를 수행하고, 승인된 이동은 공유 인덱스(= CAPA 원장)와
+      누적 납기 원장에 바로 반영 → 뒤 날짜는 앞 날짜의 결정(연기분 유입 등)을 본 상태에서 계산
+      (1~4단계는 앞선 이동에 따라 바뀌므로 날짜마다 다시 구축, level_capa_month와 같은 방식)
+    - 잔업/특근 이벤트 재계산은 하지 않음, use_ai=False(기본)면 LLM 호출 없이 Python 폴백만 사용
+    - stage_cache: 스냅샷의 달력과, 아직 이동이 반영되기 전 날짜의 1~4단계를 단건 질문과 공유
+      (인덱스는 이동을 반영하므로 항상 전용, 이동 이후 날짜의 1~4단계는 바뀐 부하로 다시 구축)
+    Returns: {"line", "start_date", "end_date", "moves", "days"(날짜별 결과 표), "load_before", "load_after"}
+             라인을 못 찾으면 {"error"}
+    """
+    if end_date < start_date:
+        start_date, end_date = end_date, start_date
+
+    # 이동을 누적 반영하므로 호출 측(캐시된) 인덱스와 분리된 전용 인덱스를 쓴다 (달력은 읽기 전용이라 공유)
+    snapshot_key = plan_snapshot_key(plan_df) if stage_cache is not None else None
+    calendar = stage_cache.context(snapshot_key, plan_df)[1] if stage_cache is not None else None
+    ctx = EngineContext.for_request(plan_df, today=today, capa_limits=capa_limits, calendar=calendar)
+    plan_index, calendar, capa_limits = ctx.plan_index, ctx.calendar, ctx.capa_limits
+    due_ledger = DueLedger(plan_index)
+
+    all_dates = plan_index.dates()
+    dates = [
+        d
+        for d in all_dates[bisect_left(all_dates, start_date):bisect_right(all_dates, end_date)]
+        if d > ctx.today_str and calendar.is_workday(d)
+    ]
+    line = next((ln for ln in (_infer_target_line(question, plan_df, d) for d in dates) if ln), None)
+    if line is None or line not in capa_limits:
+        return {"error": "❌ 기간 안에서 대상 라인을 찾을 수 없습니다. (예: '1/19~1/23 조립2 80%')"}
+
+    load_before = capa_load_matrix(plan_index, capa_limits, dates)
+    limit = int(capa_limits[line])
+    add_qty, capa_target = _target_rule(question)
+
+    moves: List[Dict[str, Any]] = []
+    days: List[Dict[str, Any]] = []
+    for d in dates:
+        # 현재량·목표량 모두 앞 날짜 이동(연기분 유입 등)이 반영된 현재 인덱스 기준
+        cur = plan_index.slot_qty(d, line)
+        tgt = cur + add_qty if add_qty is not None else int(limit * capa_target)
+        row = {
+            "date": d,
+            "current_qty": cur,
+            "target_qty": int(tgt),
+            "operation_mode": "increase" if tgt > cur else "reduce",
+            "operation_qty": abs(int(tgt) - cur),
+            "moved_qty": 0,
+            "qty_after": cur,
+            "achievement": 100.0,
+            "status": "[OK] 조치 불필요",
+        }
+        if tgt == cur:
+            days.append(row)
+            continue
+
+        if stage_cache is not None and not moves:
+            # 아직 이동이 없으면 인덱스 = 스냅샷 → 단건 질문과 같은 1~4단계
+            stages, err = stage_cache.stages(
+                snapshot_key, d, line, ctx, lambda: _prepare_stages(plan_df, d, line, ctx)
+            )
+        else:
+            stages, err = _prepare_stages(plan_df, d, line, ctx)
+        if err:
+            row.update(achievement=0.0, status=err[1])
+            days.append(row)
+            continue
+
+        res = _solve_target(
+            plan_df=plan_df,
+            stages=stages,
+            question_date=d,
+            target_line=line,
+            target_qty=int(tgt),
+            capa_target=int(tgt) / limit if add_qty is not None else capa_target,
+            ctx=ctx,
+            genai_key=genai_key,
+            reduce_solver=reduce_solver,
+            use_ai=use_ai,
+            due_ledger=due_ledger,
+            suggest_events=False,
+        )
+        for m in res["final_moves"]:
+            from_loc = m.get("from") if "_" in str(m.get("from") or "") else f"{d}_{line}"
+            plan_index.apply_move(m["item"], from_loc, m["to"], m["qty"])
+            moves.append({**m, "from": from_loc, "slot": f"{d}_{line}"})
+
+        row.update(
+            moved_qty=res["moved_total"],
+            qty_after=plan_index.slot_qty(d, line),
+            achievement=round(res["achievement"], 1),
+            status=res["status"],
+        )
+        days.append(row)
+
+    return {
+        "line": line,
+        "start_date": start_date,
+        "end_date": end_date,
+        "target_pct": None if add_qty is not None else int(round(capa_target * 100)),
+        "add_qty": add_qty,
+        "moves": moves,
+        "days": pd.DataFrame(days, columns=RANGE_COLUMNS),
+        "load_before": load_before,
+        "load_after": capa_load_matrix(plan_index, capa_limits, dates),
+    }
+
+
+def format_range_report(result: Dict[str, Any]) -> str:
+    """adjust_date_range 결과 → 통합 보고서 markdown (앱의 '최종 조치 계획' 섹션 규칙과 동일)"""
+    if result.get("error"):
+        return result["error"]
+
+    days: pd.DataFrame = result["days"]
+    moves: List[Dict[str, Any]] = result["moves"]
+    acted = days[days["operation_qty"] > 0] if not days.empty else days
+    reached = acted[acted["achievement"] >= 90] if not acted.empty else acted
+    goal = f"추가 {result['add_qty']:,}개" if result.get("add_qty") is not None else f"CAPA {result['target_pct']}%"
+
+    report = [f"# 📆 기간 생산계획 조정 ({result['start_date']} ~ {result['end_date']} {result['line']})", ""]
+    report.append("## 📌 요약")
+    report.append(f"- 목표: 날짜별 {goal}")
+    report.append(f"- 대상 가동일: **{len(days)}일** (조정 {len(acted)}일 / 목표 90% 이상 달성 {len(reached)}일)")
+    report.append(f"- 총 이동량: **{sum(int(m['qty']) for m in moves):,}개** ({len(moves)}건)")
+    report.append("")
+
+    report.append("## 🏭 날짜별 결과")
+    if days.empty:
+        report.append("❌ 기간 안에 조정할 가동일이 없습니다.")
+    else:
+        report.append("| 날짜 | 현재 | 목표 | 조정 | 이동 | 조정 후 | 달성률 |")
+        report.append("|---|---:|---:|---:|---:|---:|---:|")
+        for r in days.itertuples(index=False):
+            op = "증량" if r.operation_mode == "increase" else "감축"
+            mark = "✅" if r.achievement >= 90 else "⚠️"
+            report.append(
+                f"| {r.date} | {r.current_qty:,} | {r.target_qty:,} | {op} {r.operation_qty:,} | {r.moved_qty:,} | {r.qty_after:,} | {mark} {r.achievement:.1f}% |"
+            )
+    report.append("")
+
+    report.extend(_format_action_plan(moves))
+    return "\n".join(report)
@@ -12,11 +12,25 @@ import json
 
 import requests
 
+from data_sync import PAGE_SIZE, PAGE_WORKERS, fetch_paginated, stale_while_revalidate
+
 # =============================================================================
 # 0) 파싱 / 유틸
 # =============================================================================
 
 LEGACY_DEFAULT_YEAR = "2025"
+LEGACY_SNAPSHOT_MAX_AGE_SEC = 600  # 디스크 스냅샷이 이보다 오래되면 백그라운드 재조회
+LEGACY_SNAPSHOT_PREFIX = "legacy_"
+LEGACY_SNAPSHOT_MAX_FILES = 200  # 질문별 조회 스냅샷은 최근 저장된 이 개수만 보관
+# 테이블별 유일 키 (페이지 조회의 마지막 정렬 기준). 스키마에서 확인된 테이블만 채울 것
+# - 없는 컬럼으로 정렬하면 PostgREST가 쿼리를 거부하므로 추정해서 넣지 않는다
+# - 키가 없으면 선택한 컬럼 전체로 정렬해 페이지 경계를 고정 (select("*")는 order_by만 사용)
+LEGACY_TABLE_KEYS = {
+    "production_data": (),
+    "monthly_production": (),
+    "daily_total_production": (),
+    "daily_capa": (),
+}
 
 def normalize_line_name(line_val):
     s = str(line_val).strip()
@@ -117,11 +131,70 @@ def extract_category(text: str):
         return "flange"
     return None
 
+class _CachedResult:
+    """supabase execute() 결과와 같은 모양(.data)으로 스냅샷 행을 돌려주기 위한 래퍼"""
+
+    def __init__(self, data):
+        self.data = data
+
+def _page_order(table, columns, order_by=()):
+    """페이지 조회 정렬 기준: order_by 뒤에 테이블 유일 키, 키가 없으면 나머지 선택 컬럼을 덧붙임"""
+    tail = LEGACY_TABLE_KEYS.get(table, ())
+    if not tail and columns.strip() != "*":
+        tail = tuple(c.strip() for c in columns.split(",") if c.strip())
+    order_by = tuple(order_by)
+    return order_by + tuple(c for c in tail if c not in order_by)
+
+def _execute(query_factory, snapshot_key: str, store=None, order_by=(), paginate=True,
+             page_size: int = PAGE_SIZE, max_workers: int = PAGE_WORKERS, freshness=None):
+    """query_factory()로 만든 쿼리 실행
+    - paginate=True: Range 페이지 병렬 조회 (응답 상한에 잘리지 않음). limit 쿼리는 paginate=False
+      order_by는 _page_order()로 만든 유일한 정렬 기준을 넘길 것
+    - store가 있으면 디스크 스냅샷 우선 + 백그라운드 재검증 (스냅샷 수는 LEGACY_SNAPSHOT_MAX_FILES로 제한)
+    - freshness: 리스트를 넘기면 LEGACY_SNAPSHOT_MAX_AGE_SEC보다 오래된 스냅샷으로 답한 경우
+      {"snapshot", "age_sec", "error"}를 모아 둠 (error = 마지막 백그라운드 재조회 실패)
+    """
+
+    def _fetch():
+        if paginate:
+            return fetch_paginated(query_factory, order_by, page_size, max_workers)
+        res = query_factory().execute()
+        return pd.DataFrame(res.data) if res.data else pd.DataFrame()
+
+    if store is None:
+        df = _fetch()
+    else:
+        status = {}
+        df = stale_while_revalidate(store, f"{LEGACY_SNAPSHOT_PREFIX}{snapshot_key}", _fetch, LEGACY_SNAPSHOT_MAX_AGE_SEC, status)
+        store.prune(LEGACY_SNAPSHOT_PREFIX, LEGACY_SNAPSHOT_MAX_FILES)
+        if freshness is not None and status["stale"]:
+            freshness.append({"snapshot": snapshot_key, "age_sec": status["age_sec"], "error": status["error"]})
+    if df.empty:
+        return _CachedResult([])
+    # NaN → None (원본 응답처럼 `or` 기본값 처리가 동작하도록)
+    return _CachedResult(df.astype(object).where(df.notna(), None).to_dict("records"))
+
+def format_freshness_note(freshness):
+    """오래된 스냅샷으로 답했을 때 답변 끝에 붙일 안내 (없으면 빈 문자열)"""
+    if not freshness:
+        return ""
+    oldest = max(freshness, key=lambda x: x["age_sec"])
+    age = oldest["age_sec"]
+    age_txt = "알 수 없음" if age == float("inf") else f"{age / 60:.0f}분 전"
+    errors = [x["error"] for x in freshness if x.get("error")]
+    if errors:
+        return f"\n\n⚠️ 저장된 스냅샷 기준 답변입니다 (조회 시점 {age_txt}, 최신 데이터 재조회 실패: {errors[0]})"
+    return f"\n\n⚠️ 저장된 스냅샷 기준 답변입니다 (조회 시점 {age_txt}, 백그라운드에서 최신 데이터로 갱신 중)"
+
 # =============================================================================
 # 1) Legacy DB 조회 (품목 간섭 기능 제거됨)
 # =============================================================================
 
-def fetch_db_data_legacy(user_input: str, supabase):
+def fetch_db_data_legacy(user_input: str, supabase, store=None,
+                         page_size: int = PAGE_SIZE, max_workers: int = PAGE_WORKERS, freshness=None):
+    """질문 유형별 legacy 테이블 조회 → Gemini에 넘길 컨텍스트 문자열
+    - freshness: 리스트를 넘기면 오래된 스냅샷으로 답한 조회를 모아 둠 (format_freshness_note로 안내 문구 생성)
+    """
     info = extract_date_info(user_input, LEGACY_DEFAULT_YEAR)
     target_date = info["date"]
     target_month = info["month"]
@@ -131,13 +204,21 @@ def fetch_db_data_legacy(user_input: str, supabase):
 
     context_log = ""
 
+    def _run(query_factory, snapshot_key, order_by=(), paginate=True):
+        return _execute(query_factory, snapshot_key, store, order_by, paginate, page_size, max_workers, freshness)
+
+    def _select(table, columns, filters, snapshot_key, order_by=()):
+        """table에서 columns를 filters(q → q)로 걸러 페이지 조회"""
+        return _run(lambda: filters(supabase.table(table).select(columns)), snapshot_key,
+                    order_by=_page_order(table, columns, order_by))
+
     try:
         # =====================================================================
         # 1) 제품 생산량 0차 최종 비교
         # =====================================================================
         if target_date and product_key and ("0차" in user_input and "최종" in user_input) and "비교" in user_input:
-            res_v0 = supabase.table("production_data").select("납기일, 품명, 생산량").eq("납기일", target_date).eq("버전", "0차").ilike("품명", f"%{product_key}%").execute()
-            res_final = supabase.table("production_data").select("생산일, 품명, 생산량").eq("생산일", target_date).eq("버전", "최종").ilike("품명", f"%{product_key}%").execute()
+            res_v0 = _select("production_data", "납기일, 품명, 생산량", lambda q: q.eq("납기일", target_date).eq("버전", "0차").ilike("품명", f"%{product_key}%"), f"production_data_v0_{target_date}_{product_key}", order_by=("납기일", "품명", "생산량"))
+            res_final = _select("production_data", "생산일, 품명, 생산량", lambda q: q.eq("생산일", target_date).eq("버전", "최종").ilike("품명", f"%{product_key}%"), f"production_data_final_{target_date}_{product_key}", order_by=("생산일", "품명", "생산량"))
 
             v0_qty = 0
             product_name = product_key
@@ -203,7 +284,7 @@ def fetch_db_data_legacy(user_input: str, supabase):
                 else:
                     query = query.ilike("최종_이슈분류", f"%{meta['db_text']}%")
 
-                response = query.limit(3).execute()
+                response = _run(lambda: query.limit(3), f"production_issue_analysis_8_11_{detected_code}", paginate=False)
 
                 if response.data:
                     context_log += f"[{detected_code} CASE FOUND]\n"
@@ -217,7 +298,7 @@ def fetch_db_data_legacy(user_input: str, supabase):
         # 3) 구분별 월 생산량 조회
         # =====================================================================
         if target_month and category and ("생산량" in user_input or "알려" in user_input):
-            res = supabase.table("production_data").select("월, 구분, 생산량").eq("월", target_month).eq("버전", target_version).ilike("구분", f"%{category}%").execute()
+            res = _select("production_data", "월, 구분, 생산량", lambda q: q.eq("월", target_month).eq("버전", target_version).ilike("구분", f"%{category}%"), f"production_data_category_{target_month}_{target_version}_{category}", order_by=("월", "구분", "생산량"))
 
             if res.data:
                 df = pd.DataFrame(res.data)
@@ -237,7 +318,7 @@ def fetch_db_data_legacy(user_input: str, supabase):
         found_months = sorted(list(set([int(m) for m in found_months])))
 
         if len(found_months) >= 2 and product_key is None and category is None:
-            res = supabase.table("monthly_production").select("월, 총_생산량").in_("월", found_months).eq("버전", target_version).execute()
+            res = _select("monthly_production", "월, 총_생산량", lambda q: q.in_("월", found_months).eq("버전", target_version), f"monthly_production_{'-'.join(map(str, found_months))}_{target_version}", order_by=("월", "총_생산량"))
 
             if res.data:
                 df = pd.DataFrame(res.data)
@@ -260,7 +341,7 @@ def fetch_db_data_legacy(user_input: str, supabase):
         # 5) 단일 월 생산량 조회
         # =====================================================================
         if target_month and ("생산량" in user_input or "알려" in user_input) and not target_date and not ("capa" in user_input.lower() or "카파" in user_input or "초과" in user_input) and not category:
-            res = supabase.table("daily_total_production").select("월, 라인, 총_생산량").eq("월", target_month).eq("버전", target_version).execute()
+            res = _select("daily_total_production", "월, 라인, 총_생산량", lambda q: q.eq("월", target_month).eq("버전", target_version), f"daily_total_production_month_{target_month}_{target_version}", order_by=("월", "라인", "총_생산량"))
 
             if res.data:
                 df = pd.DataFrame(res.data)
@@ -289,7 +370,7 @@ def fetch_db_data_legacy(user_input: str, supabase):
         # 6) CAPA 조회
         # =====================================================================
         if target_month and ("capa" in user_input.lower() or "카파" in user_input) and "초과" not in user_input:
-            res = supabase.table("daily_capa").select("*").eq("월", target_month).execute()
+            res = _select("daily_capa", "*", lambda q: q.eq("월", target_month), f"daily_capa_{target_month}", order_by=("라인",))
 
             if res.data:
                 df = pd.DataFrame(res.data)
@@ -320,7 +401,7 @@ def fetch_db_data_legacy(user_input: str, supabase):
         # 7) CAPA 초과 조회
         # =====================================================================
         if "초과" in user_input and target_month:
-            res = supabase.table("daily_total_production").select("날짜, 라인, 총_생산량, 월").eq("월", target_month).eq("버전", target_version).execute()
+            res = _select("daily_total_production", "날짜, 라인, 총_생산량, 월", lambda q: q.eq("월", target_month).eq("버전", target_version), f"daily_total_production_over_{target_month}_{target_version}", order_by=("날짜", "라인", "총_생산량", "월"))
 
             if not res.data:
                 return f"{target_month}월 {target_version} 데이터가 없습니다."
@@ -329,7 +410,7 @@ def fetch_db_data_legacy(user_input: str, supabase):
             df['라인'] = df['라인'].apply(normalize_line_name)
             df['날짜'] = df['날짜'].apply(normalize_date)
 
-            capa_res = supabase.table("daily_capa").select("*").eq("월", target_month).execute()
+            capa_res = _select("daily_capa", "*", lambda q: q.eq("월", target_month), f"daily_capa_{target_month}", order_by=("라인",))
 
             if not capa_res.data:
                 return f"{target_month}월 CAPA 데이터가 없습니다."
@@ -374,7 +455,7 @@ def fetch_db_data_legacy(user_input: str, supabase):
         # 8) 일별 생산량 조회
         # =====================================================================
         if target_date:
-            res = supabase.table("daily_total_production").select("날짜, 라인, 총_생산량").eq("날짜", target_date).eq("버전", target_version).execute()
+            res = _select("daily_total_production", "날짜, 라인, 총_생산량", lambda q: q.eq("날짜", target_date).eq("버전", target_version), f"daily_total_production_date_{target_date}_{target_version}", order_by=("날짜", "라인", "총_생산량"))
 
             if res.data:
                 df = pd.DataFrame(res.data)
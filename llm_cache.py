@@ -0,0 +1,132 @@
+"""
+llm_cache.py
+- LLM 응답 캐시 (content-addressed): 키 = sha256(모델명 + 프롬프트)
+- 메모리 LRU + TTL, 선택적으로 SQLite 파일 백엔드 → 같은 파일을 쓰는 여러 프로세스/레플리카가 공유
+- 원문 응답 텍스트만 보관 (파싱/검증은 호출 측에서 매번 수행)
+  → 캐시된 전략도 step6 검증을 현재 CAPA 기준으로 다시 통과해야 반영됨
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+LLM_CACHE_TTL_SEC = 6 * 3600
+LLM_CACHE_SIZE = 256
+
+
+def prompt_key(model: str, prompt: str) -> str:
+    """(모델명, 프롬프트) → 캐시 키"""
+    return hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """LLM 응답 텍스트 캐시.
+    - 메모리: 최근 maxsize개 LRU, ttl_sec 지나면 만료
+    - path가 있으면 SQLite에도 기록 (메모리 미스 시 조회, 만료/초과분은 쓰기 때 정리)
+    - SQLite 오류는 캐시 미스로 취급 (LLM 호출 경로를 막지 않음)
+    """
+
+    def __init__(self, ttl_sec: float = LLM_CACHE_TTL_SEC, maxsize: int = LLM_CACHE_SIZE, path: Optional[str] = None):
+        self.ttl_sec = ttl_sec
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._mem: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache ("
+                    " key TEXT PRIMARY KEY, model TEXT, response TEXT, created_at REAL, accessed_at REAL)"
+                )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # 호출마다 연결 (스레드/프로세스 간 공유 안전, 짧은 잠금 대기 허용), 블록 종료 시 commit 후 close
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, model: str, prompt: str) -> Optional[str]:
+        key = prompt_key(model, prompt)
+        now = time.time()
+
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl_sec:
+                    self._mem.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._mem[key]
+
+        value = None
+        if self.path:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        "SELECT response, created_at FROM llm_cache WHERE key = ? AND created_at >= ?",
+                        (key, now - self.ttl_sec),
+                    ).fetchone()
+                    if row:
+                        conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                        value = row[0]
+                        self._remember(key, row[1], value)
+            except sqlite3.Error:
+                value = None
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, model: str, prompt: str, response: str) -> None:
+        key = prompt_key(model, prompt)
+        now = time.time()
+        self._remember(key, now, response)
+
+        if self.path:
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO llm_cache (key, model, response, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                        (key, model, response, now, now),
+                    )
+                    conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_sec,))
+                    conn.execute(
+                        "DELETE FROM llm_cache WHERE key NOT IN (SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT ?)",
+                        (self.maxsize,),
+                    )
+            except sqlite3.Error:
+                pass
+
+    def _remember(self, key: str, created_at: float, response: str) -> None:
+        with self._lock:
+            self._mem[key] = (created_at, response)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.maxsize:
+                self._mem.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+        if self.path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM llm_cache")
+            except sqlite3.Error:
+                pass
@@ -0,0 +1,80 @@
+"""
+llm_guard.py
+- LLM 호출 서킷 브레이커: 연속 실패(오류/시간 초과/파싱 실패)가 쌓이면 쿨다운 동안 LLM 호출을 건너뜀
+- 쿨다운이 지나면 시험 호출 1건만 통과 → 성공하면 닫힘, 실패하면 다시 쿨다운
+- 응답 시간 예산(타임아웃) 자체는 호출 측(hybrid._solve_target)에서 적용
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+LLM_TIMEOUT_SEC = 20.0
+LLM_FAILURE_THRESHOLD = 3
+LLM_COOLDOWN_SEC = 60.0
+
+
+class CircuitBreaker:
+    """연속 실패 기반 서킷 브레이커 (스레드 안전).
+    - allow(): 지금 LLM을 호출해도 되는지 (열린 상태면 쿨다운마다 시험 호출 1건만 허용)
+    - record_success()/record_failure(): 호출 결과 기록
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = LLM_FAILURE_THRESHOLD,
+        cooldown_sec: float = LLM_COOLDOWN_SEC,
+        clock=time.monotonic,
+    ):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown_sec = cooldown_sec
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self.skipped = 0
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = self._clock()
+            if now - self._opened_at >= self.cooldown_sec:
+                # 시험 호출 1건 통과, 결과가 나오기 전(또는 결과 없이 버려져도) 다음 쿨다운까지는 차단
+                self._opened_at = now
+                return True
+            self.skipped += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+
+    def retry_in(self) -> float:
+        """열린 상태면 다음 시험 호출까지 남은 초 (닫혀 있으면 0)"""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.cooldown_sec - (self._clock() - self._opened_at))
+
+    def state(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "open": self._opened_at is not None,
+                "failures": self._failures,
+                "skipped": self.skipped,
+            }
@@ -0,0 +1,139 @@
+import os
+import random
+import sys
+from datetime import date
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeAPIError(Exception):
+    """postgrest.APIError 대역 (code/message 속성만 흉내)"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Query:
+    def __init__(self, client, table, columns):
+        self.client = client
+        self.table = table
+        self.columns = columns
+        self.filters = []
+        self.orders = []
+        self.bounds = None
+
+    def gt(self, col, value):
+        self.filters.append(lambda r: r.get(col) is not None and r[col] > value)
+        return self
+
+    def gte(self, col, value):
+        self.filters.append(lambda r: r.get(col) is not None and r[col] >= value)
+        return self
+
+    def eq(self, col, value):
+        self.filters.append(lambda r: r.get(col) == value)
+        return self
+
+    def in_(self, col, values):
+        self.filters.append(lambda r: r.get(col) in values)
+        return self
+
+    def ilike(self, col, pattern):
+        needle = pattern.strip("%").lower()
+        self.filters.append(lambda r: needle in str(r.get(col, "")).lower())
+        return self
+
+    def order(self, col):
+        self.orders.append(col)
+        return self
+
+    def range(self, lo, hi):
+        self.bounds = (lo, hi)
+        return self
+
+    def execute(self):
+        self.client.calls.append(self.table)
+        if self.table in self.client.errors:
+            raise self.client.errors[self.table]
+        if self.table not in self.client.tables:
+            raise FakeAPIError("42P01", f'relation "public.{self.table}" does not exist')
+        table_rows = self.client.tables[self.table]
+        self.client.orders.append((self.table, tuple(self.orders)))
+        for col in self.orders:
+            if table_rows and all(col not in r for r in table_rows):
+                raise FakeAPIError("42703", f"column {self.table}.{col} does not exist")
+        rows = [dict(r) for r in table_rows if all(f(r) for f in self.filters)]
+        for col in reversed(self.orders):
+            rows.sort(key=lambda r: r.get(col))
+        if self.bounds:
+            rows = rows[self.bounds[0]:self.bounds[1] + 1]
+        if self.columns != "*":
+            keep = [c.strip() for c in self.columns.split(",")]
+            rows = [{c: r.get(c) for c in keep} for r in rows]
+        return _Result(rows)
+
+
+class FakeClient:
+    """supabase-py 체이닝 인터페이스만 흉내 내는 로컬 PostgREST 대역
+    - tables: 테이블명 → 행(dict) 리스트 (테스트에서 직접 수정해 insert/update/delete 재현)
+    - errors: 테이블명 → execute 때 올릴 예외
+    """
+
+    def __init__(self, tables=None):
+        self.tables = tables if tables is not None else {}
+        self.errors = {}
+        self.calls = []
+        self.orders = []  # (테이블, 정렬 컬럼) 실행 기록
+
+    def table(self, name):
+        client = self
+
+        class _Table:
+            def select(self, columns="*"):
+                return _Query(client, name, columns)
+
+        return _Table()
+
+
+@pytest.fixture
+def fake_client():
+    return FakeClient()
+
+
+def build_plan(seed=1, n_products=30):
+    """2026년 1월 계획 샘플 (평일만 가동, 품목 절반 정도가 날마다 찍힘, 결정적)"""
+    rnd = random.Random(seed)
+    prods = []
+    for i in range(n_products):
+        kind = rnd.choice(["T6", "A2XX", "J9", "BERGSTROM", "X"])
+        line = rnd.choice(["조립1", "조립2", "조립3"]) if kind != "A2XX" else rnd.choice(["조립1", "조립2"])
+        name = f"{kind} (P{700 + i}) 품목{i}" if kind != "X" else f"전용품목{i}"
+        prods.append((name, line, rnd.choice([50, 100, 150, 175, 200])))
+    rows = []
+    for day in range(1, 32):
+        d = date(2026, 1, day)
+        ds = d.strftime("%Y-%m-%d")
+        for name, line, plt in prods:
+            if d.weekday() >= 5:
+                rows.append(dict(plan_date=ds, line=line, product_name=name, qty_0차=0, qty_1차=0, plt=plt, is_workday=False))
+                continue
+            if rnd.random() < 0.5:
+                q1 = plt * rnd.randint(0, 4)
+                q0 = max(0, q1 + plt * rnd.randint(-2, 1))
+                rows.append(dict(plan_date=ds, line=line, product_name=name, qty_0차=q0, qty_1차=q1, plt=plt, is_workday=True))
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def make_plan():
+    return build_plan
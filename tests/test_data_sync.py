@@ -0,0 +1,225 @@
+import logging
+import time
+
+import pandas as pd
+import pytest
+
+import data_sync
+from data_sync import DataSync, LazyTable, SnapshotStore, TableSync
+
+from conftest import FakeAPIError
+
+
+def _rows(df):
+    return sorted(df[["id", "qty"]].itertuples(index=False, name=None))
+
+
+@pytest.fixture
+def plan_rows():
+    # 같은 (plan_date, line, product_name) 행이 2개 있는 정상 데이터
+    return [
+        {"id": 1, "plan_date": "2026-01-05", "line": "조립1", "product_name": "A", "qty": 100, "updated_at": "2026-01-01T00:00:00"},
+        {"id": 2, "plan_date": "2026-01-05", "line": "조립1", "product_name": "A", "qty": 50, "updated_at": "2026-01-01T00:00:00"},
+        {"id": 3, "plan_date": "2026-01-06", "line": "조립2", "product_name": "B", "qty": 70, "updated_at": "2026-01-01T00:00:00"},
+    ]
+
+
+def test_incremental_insert_update_keeps_duplicate_business_keys(fake_client, plan_rows):
+    fake_client.tables["plan"] = plan_rows
+    sync = TableSync(fake_client, "plan", page_size=2)
+    assert sync.refresh()
+    assert sync.watermark_col == "updated_at"
+    assert _rows(sync.snapshot()) == [(1, 100), (2, 50), (3, 70)]
+
+    plan_rows[0].update(qty=120, updated_at="2026-01-02T00:00:00")
+    plan_rows.append({"id": 4, "plan_date": "2026-01-05", "line": "조립1", "product_name": "A", "qty": 10, "updated_at": "2026-01-02T00:00:00"})
+    version = sync.version
+    assert sync.refresh()
+    assert sync.version == version + 1
+    assert _rows(sync.snapshot()) == [(1, 120), (2, 50), (3, 70), (4, 10)]
+    assert sync.watermark == "2026-01-02T00:00:00"
+
+    # 변경 없음 → version 그대로
+    assert not sync.refresh()
+    assert sync.version == version + 1
+
+
+def test_incremental_picks_up_late_row_at_watermark(fake_client, plan_rows):
+    fake_client.tables["plan"] = plan_rows
+    sync = TableSync(fake_client, "plan", reconcile_sec=None)
+    assert sync.refresh()
+    mark = sync.watermark
+
+    # 워터마크와 같은 updated_at으로 늦게 커밋된 행
+    plan_rows.append({"id": 4, "plan_date": "2026-01-06", "line": "조립2", "product_name": "C", "qty": 30, "updated_at": mark})
+    version = sync.version
+    assert sync.refresh()
+    assert sync.version == version + 1
+    assert _rows(sync.snapshot()) == [(1, 100), (2, 50), (3, 70), (4, 30)]
+    assert sync.watermark == mark
+
+    # 경계 행을 다시 받아도 내용이 같으면 변경 없음
+    assert not sync.refresh()
+    assert sync.version == version + 1
+    assert len(sync.snapshot()) == 4
+
+
+def test_delete_is_picked_up_by_periodic_reconcile(fake_client, plan_rows):
+    fake_client.tables["plan"] = plan_rows
+    sync = TableSync(fake_client, "plan", reconcile_sec=None)
+    sync.refresh()
+    del plan_rows[1]
+    # 증분 조회로는 삭제가 보이지 않음
+    assert not sync.refresh()
+    assert len(sync.snapshot()) == 3
+
+    sync.reconcile_sec = 0  # 전체 대조 주기 도래
+    assert sync.refresh()
+    assert _rows(sync.snapshot()) == [(1, 100), (3, 70)]
+
+
+def test_without_updated_at_falls_back_to_full_fetch(fake_client):
+    rows = [{"id": 1, "qty": 10}, {"id": 2, "qty": 20}]
+    fake_client.tables["t"] = rows
+    sync = TableSync(fake_client, "t")
+    sync.refresh()
+    assert sync.watermark_col is None  # id는 워터마크로 쓰지 않음
+
+    rows[0]["qty"] = 11  # id가 그대로인 수정
+    del rows[1]
+    assert sync.refresh()
+    assert _rows(sync.snapshot()) == [(1, 11)]
+
+
+def test_warm_start_reconciles_before_incremental(fake_client, plan_rows, tmp_path):
+    fake_client.tables["plan"] = plan_rows
+    store = SnapshotStore(str(tmp_path))
+    TableSync(fake_client, "plan", store=store).refresh()
+
+    del plan_rows[2]  # 스냅샷 저장 후 원격에서 삭제
+    sync = TableSync(fake_client, "plan", store=store)
+    assert sync.warm_start()
+    assert len(sync.snapshot()) == 3
+    assert sync.refresh()
+    assert _rows(sync.snapshot()) == [(1, 100), (2, 50)]
+
+
+def test_snapshot_store_parquet_requires_pyarrow(tmp_path, monkeypatch):
+    import importlib.util
+
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name: None)
+    with pytest.raises(ImportError, match="pyarrow"):
+        SnapshotStore(str(tmp_path), parquet=True)
+    store = SnapshotStore(str(tmp_path))
+    assert store.parquet is False
+    store.save("x", pd.DataFrame({"a": [1, 2]}))
+    df, meta = store.load("x")
+    assert meta["format"] == "pkl" and df["a"].tolist() == [1, 2]
+
+
+def test_snapshot_does_not_wait_for_remote_fetch(fake_client, plan_rows):
+    import threading
+
+    fake_client.tables["plan"] = plan_rows
+    sync = TableSync(fake_client, "plan")
+    sync.refresh()
+
+    started, release = threading.Event(), threading.Event()
+    fetch_since = sync._fetch_since
+
+    def slow_fetch(col, mark):
+        started.set()
+        release.wait(5)
+        return fetch_since(col, mark)
+
+    sync._fetch_since = slow_fetch
+    plan_rows.append({"id": 9, "plan_date": "2026-01-07", "line": "조립3", "product_name": "C", "qty": 5, "updated_at": "2026-01-03T00:00:00"})
+    t = threading.Thread(target=sync.refresh)
+    t.start()
+    try:
+        assert started.wait(5)
+        # 원격 조회가 걸려 있는 동안에도 기존 사본은 바로 읽힘
+        got = []
+        reader = threading.Thread(target=lambda: got.append(sync.snapshot()))
+        reader.start()
+        reader.join(1)
+        assert got and len(got[0]) == 3
+    finally:
+        release.set()
+        t.join(5)
+    assert len(sync.snapshot()) == 4
+
+
+def test_non_strict_refresh_skips_only_missing_tables(fake_client, plan_rows):
+    fake_client.tables["plan_01"] = plan_rows
+    sync = DataSync(fake_client, {"plan_01": {}, "plan_02": {}})
+    sync.refresh(strict=False)  # plan_02는 아직 없는 파티션 → 빈 것으로 취급
+    assert sync.table("plan_02").missing and not sync.table("plan_02").loaded
+    assert len(sync.concat(["plan_01", "plan_02"])) == 3
+
+    fake_client.errors["plan_02"] = FakeAPIError("42501", "permission denied for table plan_02")
+    with pytest.raises(RuntimeError, match="permission denied"):
+        sync.refresh(["plan_02"], strict=False)
+    assert not sync.table("plan_02").missing
+
+
+def test_snapshot_store_prune_keeps_latest(tmp_path):
+    import os
+    import time
+
+    store = SnapshotStore(str(tmp_path), parquet=False)
+    for i in range(5):
+        store.save(f"legacy_q{i}", pd.DataFrame({"a": [i]}))
+        os.utime(store._path(f"legacy_q{i}", "json"), (time.time() + i, time.time() + i))
+    store.save("plan", pd.DataFrame({"a": [0]}))
+
+    assert store.prune("legacy_", 2) == 3
+    assert [n for n in range(5) if store.load(f"legacy_q{n}") is not None] == [3, 4]
+    assert store.load("plan") is not None
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        f"{n}.{ext}" for n in ("legacy_q3", "legacy_q4", "plan") for ext in ("json", "pkl")
+    )
+
+
+def _wait_revalidated(name, timeout=2.0):
+    limit = time.monotonic() + timeout
+    while name in data_sync._REVALIDATING and time.monotonic() < limit:
+        time.sleep(0.01)
+
+
+def test_failed_background_revalidation_is_logged_and_reported(tmp_path, caplog):
+    store = SnapshotStore(str(tmp_path), parquet=False)
+    old = pd.DataFrame({"qty": [1]})
+    store.save("swr", old, {"fetched_at": "2020-01-01T00:00:00"})
+
+    def broken():
+        raise RuntimeError("remote down")
+
+    status = {}
+    with caplog.at_level(logging.WARNING, logger="data_sync"):
+        df = data_sync.stale_while_revalidate(store, "swr", broken, max_age_sec=600, status=status)
+        _wait_revalidated("swr")
+    assert df.equals(old)  # 실패해도 기존 스냅샷으로 응답
+    assert status["stale"] and status["age_sec"] > 600 and status["error"] is None
+    assert "swr" in caplog.text and "remote down" in caplog.text
+
+    # 다음 응답은 오래된 스냅샷 + 재조회 실패를 함께 알림
+    status = {}
+    data_sync.stale_while_revalidate(store, "swr", broken, max_age_sec=600, status=status)
+    _wait_revalidated("swr")
+    assert status["stale"] and "remote down" in status["error"]
+
+    fresh = pd.DataFrame({"qty": [2]})
+    data_sync.stale_while_revalidate(store, "swr", lambda: fresh, max_age_sec=600)
+    _wait_revalidated("swr")
+    status = {}
+    assert data_sync.stale_while_revalidate(store, "swr", broken, max_age_sec=600, status=status).equals(fresh)
+    assert status == {"age_sec": status["age_sec"], "stale": False, "error": None}
+    assert data_sync.revalidate_error("swr") is None
+
+
+def test_empty_lazy_table_returns_empty_frames_without_client():
+    hist = LazyTable.empty("production_investigation")
+    assert isinstance(hist, LazyTable) and not hist.loaded
+    assert hist.get().empty
+    assert list(hist.get(["날짜", "코드"]).columns) == ["날짜", "코드"]
@@ -0,0 +1,584 @@
+import random
+import threading
+import time
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import hybrid
+from llm_guard import CircuitBreaker
+
+
+def test_infer_target_line_ignores_lines_absent_on_date():
+    plan = pd.DataFrame(
+        {
+            "plan_date": ["2026-01-05", "2026-01-06", "2026-01-06"],
+            "line": pd.Categorical(["조립1", "조립3", "조립3"], categories=["조립1", "조립2", "조립3"]),
+            "product_name": ["A", "B", "C"],
+            "qty_1차": [500, 0, 0],
+        }
+    )
+    # 당일 행이 있는 라인은 조립3뿐 (물량 0이어도 관측되지 않은 조립1/조립2보다 우선)
+    assert hybrid._infer_target_line("물량 늘려줘", plan, "2026-01-06") == "조립3"
+
+
+def test_plan_snapshot_key_distinguishes_slices_sharing_attrs():
+    plan = pd.DataFrame(
+        {
+            "plan_date": ["2026-01-05", "2026-01-05", "2026-01-06", "2026-01-06"],
+            "line": ["조립1", "조립2", "조립1", "조립2"],
+            "qty_1차": [100, 200, 300, 400],
+        }
+    )
+    plan.attrs["snapshot_key"] = "2026-01-05:v1"
+    a = plan[plan["line"] == "조립1"].reset_index(drop=True)
+    b = plan[plan["line"] == "조립2"].reset_index(drop=True)
+    assert a.attrs["snapshot_key"] == b.attrs["snapshot_key"]  # attrs는 그대로 전파됨
+    assert hybrid.plan_snapshot_key(a) != hybrid.plan_snapshot_key(b)
+    assert hybrid.plan_snapshot_key(plan) == hybrid.plan_snapshot_key(plan.copy())
+    assert hybrid.plan_snapshot_key(plan).startswith("2026-01-05:v1:")
+
+
+def _small_plan():
+    return pd.DataFrame(
+        {
+            "plan_date": ["2026-01-06", "2026-01-07", "2026-01-07", "2026-01-08"],
+            "line": ["조립1", "조립1", "조립1", "조립2"],
+            "product_name": ["A", "A", "B", "A"],
+            "qty_0차": [0, 100, 50, 100],
+            "qty_1차": [150, 50, 50, 100],
+            "plt": [50, 50, 50, 50],
+        }
+    )
+
+
+def test_plan_index_apply_move_updates_product_rows():
+    plan = _small_plan()
+    index = hybrid.PlanIndex(plan)
+    index.apply_move("A", "2026-01-06_조립1", "2026-01-07_조립1", 50)
+    index.apply_move("A", "2026-01-06_조립1", "2026-01-09_조립3", 50)
+
+    rows = index.product_rows("A")
+    got = {(str(r.plan_date), str(r.line)): (int(r.qty_0차), int(r.qty_1차)) for r in rows.itertuples(index=False)}
+    assert got == {
+        ("2026-01-06", "조립1"): (0, 50),
+        ("2026-01-07", "조립1"): (100, 100),
+        ("2026-01-08", "조립2"): (100, 100),
+        ("2026-01-09", "조립3"): (0, 50),
+    }
+    assert plan["qty_1차"].tolist() == [150, 50, 50, 100]  # 원본 plan_df는 그대로
+    assert index.product_rows("B")["qty_1차"].tolist() == [50]
+    # 새 DueLedger도 이동 후 수량 기준으로 구축됨
+    ledger = hybrid.DueLedger(index)
+    assert ledger.check_move("A", "2026-01-06", "2026-01-09", 50) == (True, None)
+    assert ledger.check_move("A", "2026-01-06", "2026-01-09", 100)[0] is False
+
+
+def test_adjust_date_range_add_target_follows_earlier_moves(make_plan):
+    from datetime import date
+
+    plan = make_plan(1)
+    res = hybrid.adjust_date_range(
+        "1/12~1/16 조립1 추가 500", plan, "2026-01-12", "2026-01-16", today=date(2026, 1, 5), use_ai=False
+    )
+    days = res["days"]
+    assert len(days) == 5
+    # 앞 날짜 이동으로 부하가 바뀐 날도 목표 = 그 시점 현재량 + 500
+    assert ((days["target_qty"] - days["current_qty"]) == 500).all()
+    assert res["load_after"]["조립1"].tolist() == days["qty_after"].tolist()
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_increase_fallback_proposals_pass_validation(make_plan, seed):
+    from datetime import date
+
+    plan = make_plan(seed)
+    ctx = hybrid.EngineContext.build(plan, today=date(2026, 1, 5), capa_limits={"조립1": 3300, "조립2": 3700, "조립3": 3600})
+    checked = 0
+    for d in ("2026-01-08", "2026-01-13", "2026-01-20"):
+        for line in ("조립1", "조립2", "조립3"):
+            stages, err = hybrid._prepare_stages(plan, d, line, ctx)
+            if err:
+                continue
+            current = ctx.plan_index.slot_qty(d, line)
+            res = hybrid._solve_target(
+                plan_df=plan,
+                stages=stages,
+                question_date=d,
+                target_line=line,
+                target_qty=current + 2000,
+                capa_target=(current + 2000) / ctx.capa_limits[line],
+                ctx=ctx,
+                use_ai=False,
+                suggest_events=False,
+            )
+            checked += 1
+            assert not [v for v in res["violations"] if "[폴백검증]" in v]
+            limit = {x["name"]: int(x["max_movable"]) for x in stages["constraint_info"]}
+            moved = {}
+            for m in res["final_moves"]:
+                moved[m["item"]] = moved.get(m["item"], 0) + int(m["qty"])
+            assert all(q <= limit[name] for name, q in moved.items())
+            assert sum(1 for n in res["extra_notes"] if "CAPA 잔여" in n) <= 1
+    assert checked
+
+
+def test_search_capa_events_returns_pareto_front_with_results():
+    class FakeWhatIf:
+        def __init__(self):
+            self.calls = []
+
+        def evaluate(self, events):
+            self.calls.append(events)
+            qty = sum(e["delta_capa"] for e in events)
+            return {"achievement": min(qty / 10, 100.0), "final_moves": [{"qty": qty}]}
+
+    ev = lambda *caps: [{"date": "2026-01-13", "line": "조립1", "type": "잔업", "delta_capa": c} for c in caps]
+    candidates = [ev(200), ev(100), ev(100, 100), ev(300), ev(600, 600)]
+    whatif = FakeWhatIf()
+    front = hybrid.search_capa_events(whatif, candidates)
+
+    assert len(whatif.calls) == len(candidates)  # 후보당 1회
+    assert [o["extra_capa"] for o in front] == [100, 200, 300, 1200]  # 같은 점수(200)는 앞선 후보만
+    assert front[1]["events"] is candidates[0]
+    for o in front:
+        assert o["result"]["final_moves"][0]["qty"] == o["extra_capa"]  # 평가 결과를 그대로 보관
+
+
+class FakeLLM:
+    """지연/오류를 주입하는 가짜 LLM (hybrid.LLMCall)"""
+
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def __call__(self, prompt, timeout_sec):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("fake LLM down")
+        return '{"strategy": "fake", "explanation": "fake", "moves": []}'
+
+
+def _ask_with_llm(plan, llm, **kw):
+    kw.setdefault("speculative_fallback", False)
+    return hybrid.ask_professional_scheduler(
+        "1/21 조립1 70%", plan, pd.DataFrame(), {}, {}, "2026-01-21", today=date(2026, 1, 5), llm=llm, **kw
+    )
+
+
+def test_step5_uses_injected_llm():
+    seen = []
+
+    def llm(prompt, timeout_sec):
+        seen.append(timeout_sec)
+        return '```json\n{"strategy": "s", "explanation": "e", "moves": []}\n```'
+
+    strategy, err, source = hybrid.step5_ask_ai_strategy(
+        "facts", "reduce", 100, "조립1", "2026-01-21", "2026-01-05", 70, genai_key="", timeout_sec=3.0, llm=llm
+    )
+    assert err is None and source == hybrid.AI_STRATEGY_SOURCE
+    assert strategy["strategy"] == "s"
+    assert seen == [3.0]
+
+
+def test_slow_llm_falls_back_within_budget(make_plan):
+    llm = FakeLLM(delay=1.0)
+    started = time.monotonic()
+    report = _ask_with_llm(make_plan(1), llm, ai_timeout_sec=0.1)[0]
+    assert time.monotonic() - started < 0.9  # 늦은 응답을 기다리지 않음
+    assert "Python 폴백 (AI 응답 시간 초과)" in report
+
+
+def test_breaker_opens_half_opens_and_closes(make_plan):
+    plan = make_plan(1)
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, cooldown_sec=30, clock=lambda: now[0])
+
+    down = FakeLLM(fail=True)
+    for _ in range(2):
+        assert "Python 폴백 (AI 오류)" in _ask_with_llm(plan, down, breaker=breaker)[0]
+    assert breaker.is_open
+
+    # 열림: 쿨다운 동안은 LLM을 부르지 않고 바로 폴백
+    ok = FakeLLM()
+    assert "Python 폴백 (AI 차단: 연속 실패 쿨다운)" in _ask_with_llm(plan, ok, breaker=breaker)[0]
+    assert ok.calls == 0
+
+    # 반열림: 쿨다운이 지나면 시험 호출 1건, 실패하면 다시 열림
+    now[0] = 30.0
+    slow = FakeLLM(delay=0.5)
+    assert "Python 폴백 (AI 응답 시간 초과)" in _ask_with_llm(plan, slow, breaker=breaker, ai_timeout_sec=0.05)[0]
+    assert slow.calls == 1 and breaker.is_open
+    assert "AI 차단" in _ask_with_llm(plan, ok, breaker=breaker)[0] and ok.calls == 0
+
+    # 다음 시험 호출이 성공하면 닫힘
+    now[0] = 60.0
+    report = _ask_with_llm(plan, ok, breaker=breaker)[0]
+    assert ok.calls == 1 and not breaker.is_open
+    assert f"전략 수립: {hybrid.AI_STRATEGY_SOURCE}" in report
+
+
+def test_ai_calls_share_one_deadline_and_are_bounded(make_plan):
+    plan = make_plan(1)
+    seen = []
+
+    def llm(prompt, timeout_sec):
+        seen.append(timeout_sec)
+        return '{"strategy": "fake", "explanation": "fake", "moves": []}'
+
+    _ask_with_llm(plan, llm, ai_timeout_sec=5.0)
+    assert 0 < seen[0] <= 5.0  # 요청 타임아웃 = 제출 시점 마감까지 남은 시간
+
+    # 진행 중(버려진 호출 포함) 호출이 한도에 차면 큐에 쌓지 않고 폴백
+    gate = threading.Event()
+    held = []
+    while True:
+        fut = hybrid._submit_ai(lambda timeout_sec: gate.wait(5), None)
+        if fut is None:
+            break
+        held.append(fut)
+    assert len(held) <= hybrid.AI_WORKERS
+    busy = FakeLLM()
+    assert "Python 폴백 (AI 동시 호출 한도 초과)" in _ask_with_llm(plan, busy)[0]
+    assert busy.calls == 0
+
+    gate.set()
+    for fut in held:
+        fut.result()
+    # 자리 반환은 완료 콜백에서 → 잠깐 기다린다
+    limit = time.monotonic() + 2
+    while hybrid._submit_ai(lambda timeout_sec: None, None) is None and time.monotonic() < limit:
+        time.sleep(0.01)
+    _ask_with_llm(plan, busy)
+    assert busy.calls == 1
+
+
+def _scalar_move_codes(move, name_to_item, target_line, plan, today_str):
+    """_check_moves 이전의 move별 검증을 plan_df에서 직접 다시 계산 → (pre_fail, qty_eff, post_fail)"""
+    name = str(move.get("item", "") or "")
+    qty = int(move.get("qty", 0) or 0)
+    to_loc, from_loc = str(move.get("to", "") or ""), str(move.get("from", "") or "")
+    item = name_to_item.get(name) if name else None
+    if item is None:
+        return 1, qty, 0
+    if qty <= 0:
+        return 2, qty, 0
+    if qty > item["max_movable"]:
+        return 3, qty, 0
+    if qty % item["plt"] != 0:
+        return 4, qty, 0
+    if "_" not in to_loc:
+        return 5, qty, 0
+    to_date, to_line = (x.strip() for x in to_loc.split("_", 1))
+    from_date = from_line = ""
+    if "_" in from_loc:
+        from_date, from_line = (x.strip() for x in from_loc.split("_", 1))
+    has_from = bool(from_date and from_line)
+    if has_from and from_date == to_date and from_line == to_line:
+        return 6, qty, 0
+    if item["is_t6"] and has_from and from_date == to_date and from_line != to_line:
+        qty = min(qty, hybrid.MAX_T6_SAMEDAY_SHIFT_PLTS * item["plt"])
+
+    rows = plan[plan["product_name"] == name]
+    due = rows[rows["qty_0차"] > 0]["plan_date"]
+    last_due = str(due.max())[:10] if not due.empty else None
+    day = plan[plan["plan_date"] == to_date]
+    if item["is_a2xx"] and to_line == "조립3":
+        return 0, qty, 1
+    if not item["is_t6"] and not item["is_a2xx"] and to_line != target_line:
+        return 0, qty, 2
+    if day.empty or not bool(day["is_workday"].any()):
+        return 0, qty, 3
+    if to_date <= today_str:
+        return 0, qty, 4
+    if last_due and to_date > last_due:
+        return 0, qty, 5
+    if has_from:
+        src = rows[(rows["plan_date"] == from_date) & (rows["line"] == from_line)]["qty_1차"].sum()
+        if src < qty:
+            return 0, qty, 6
+    return 0, qty, 0
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_check_moves_matches_per_move_validation(make_plan, seed):
+    rnd = random.Random(seed)
+    plan = make_plan(seed, n_products=8)
+    ctx = hybrid.EngineContext.build(plan, today=date(2026, 1, 5))
+    names = sorted(plan["product_name"].unique())
+    name_to_item = {
+        nm: {
+            "name": nm,
+            "plt": int(plan.loc[plan["product_name"] == nm, "plt"].iloc[0]),
+            "max_movable": rnd.choice([0, 300, 1000]),
+            "is_t6": nm.startswith("T6"),
+            "is_a2xx": nm.startswith("A2XX"),
+        }
+        for nm in names
+    }
+    dates = [f"2026-01-{d:02d}" for d in range(1, 32)]
+    lines = ["조립1", "조립2", "조립3"]
+
+    def loc():
+        r = rnd.random()
+        if r < 0.1:
+            return rnd.choice(["", "2026-01-10", " _ "])
+        return f"{rnd.choice(dates)}_{rnd.choice(lines)}"
+
+    moves = []
+    for _ in range(400):
+        nm = rnd.choice(names + ["없는 품목", ""])
+        plt = name_to_item[nm]["plt"] if nm in name_to_item else 100
+        mv = {"item": nm, "qty": rnd.choice([plt * rnd.randint(-1, 8), plt * 2 + 1]), "to": loc()}
+        if rnd.random() < 0.8:
+            mv["from"] = loc() if rnd.random() < 0.7 else mv["to"].split("_")[0] + "_" + rnd.choice(lines)
+        moves.append(mv)
+
+    first = name_to_item[names[0]]
+    first["max_movable"] = 1000
+    moves.append({"item": names[0], "qty": first["plt"], "to": "2026-01-10"})  # 목적지 형식 오류
+
+    parsed = hybrid._parse_moves(moves, name_to_item)
+    pre, _, qty_eff, post, _, _ = hybrid._check_moves(parsed, "조립1", ctx.plan_index, ctx.calendar, ctx.today_str)
+    expected = [_scalar_move_codes(m, name_to_item, "조립1", plan, ctx.today_str) for m in moves]
+    live = pre == 0
+    assert list(pre) == [e[0] for e in expected]
+    assert list(qty_eff[live]) == [e[1] for e, ok in zip(expected, live) if ok]
+    assert list(post[live]) == [e[2] for e, ok in zip(expected, live) if ok]
+    assert {int(c) for c in pre} >= {0, 1, 2, 3, 4, 5, 6}  # 실패 경로가 골고루 섞였는지
+    assert {int(c) for c in post[live]} >= {0, 2, 3, 4}
+
+
+def test_engine_context_is_isolated_across_threads(make_plan):
+    plan = make_plan(2)
+    index, calendar = hybrid.PlanIndex(plan), hybrid.WorkdayCalendar(plan)
+    jobs = [
+        (q, qd, today, limits)
+        for qd, q in [("2026-01-21", "1/21 조립1 70%"), ("2026-01-14", "1/14 조립2 60%"), ("2026-01-20", "1/20 조립1 추가 500")]
+        for today in (date(2026, 1, 5), date(2026, 1, 13))
+        for limits in ({"조립1": 3300, "조립2": 3700, "조립3": 3600}, {"조립1": 2000, "조립2": 2500, "조립3": 2400})
+    ]
+
+    def run(job):
+        # 1~6단계를 LLM 없이 (AI 호출은 동시 호출 한도가 있어 스레드 수와 무관한 경로만 비교)
+        q, qd, today, limits = job
+        ctx = hybrid.EngineContext.build(plan, today=today, capa_limits=limits, plan_index=index, calendar=calendar)
+        line = hybrid._infer_target_line(q, plan, qd)
+        stages, err = hybrid._prepare_stages(plan, qd, line, ctx)
+        assert not err
+        target_qty, capa_target = hybrid._parse_target(q, int(stages["stock_res"]["total"]), int(limits[line]))
+        res = hybrid._solve_target(
+            plan_df=plan, stages=stages, question_date=qd, target_line=line, target_qty=target_qty,
+            capa_target=capa_target, ctx=ctx, use_ai=False,
+        )
+        return res["final_moves"], res["violations"], res["achievement"], res["status"]
+
+    expected = [run(job) for job in jobs]
+    assert len({repr(r) for r in expected}) >= 4  # today/CAPA에 따라 결과가 실제로 달라짐
+
+    results = [None] * len(jobs)
+    barrier = threading.Barrier(len(jobs))
+
+    def worker(k):
+        barrier.wait()
+        results[k] = run(jobs[k])
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in range(len(jobs))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == expected
+
+
+def _event_whatif(plan, question_date, line, cap, qty_pct="30%"):
+    """검증 전 원장 기준 감축 what-if (빈 폴백 전략) → (CapaEventWhatIf, 이벤트 후보, 준비 단계)"""
+    limits = {"조립1": cap, "조립2": cap, "조립3": cap}
+    ctx = hybrid.EngineContext.build(plan, today=date(2026, 1, 5), capa_limits=limits)
+    stages, err = hybrid._prepare_stages(plan, question_date, line, ctx)
+    assert not err
+    total = int(stages["stock_res"]["total"])
+    target_qty, _ = hybrid._parse_target(qty_pct, total, cap)
+    op_qty = total - target_qty
+    whatif = hybrid.CapaEventWhatIf(
+        plan, stages["constraint_info"], {"strategy": "Python 폴백", "moves": []}, stages["capa_status"],
+        hybrid.DueLedger(ctx.plan_index), question_date, line, "reduce", op_qty, ctx, reduce_solver="greedy",
+    )
+    remaining = whatif.evaluate([])["remaining"]
+    candidates = hybrid._capa_event_candidates(
+        plan_df=plan, question_date=question_date, target_line=line, shortfall_qty=remaining,
+        plt_base=50, calendar=ctx.calendar, limit=24,
+    )
+    return whatif, candidates, (ctx, stages, target_qty)
+
+
+def test_search_capa_events_parallel_matches_sequential(make_plan, monkeypatch):
+    whatif, candidates, _ = _event_whatif(make_plan(1), "2026-01-12", "조립1", 1200)
+    assert len(candidates) >= hybrid.EVENT_SEARCH_MIN_PARALLEL
+
+    threads = set()
+    evaluate = hybrid._event_search_eval
+
+    def spy(w, events):
+        threads.add(threading.current_thread().name)
+        return evaluate(w, events)
+
+    monkeypatch.setattr(hybrid, "_event_search_eval", spy)
+    seq = hybrid.search_capa_events(whatif, candidates, max_workers=1)
+    assert threads == {threading.current_thread().name}
+    threads.clear()
+    par = hybrid.search_capa_events(whatif, candidates, max_workers=4)
+    assert all(name.startswith("capa-event") for name in threads)
+
+    def key(front):
+        return [
+            (o["events"], o["achievement"], o["moved_qty"], o["result"]["final_moves"], o["result"]["violations"])
+            for o in front
+        ]
+
+    assert len(seq) >= 2
+    assert key(par) == key(seq)
+
+
+def test_capa_load_matrix_matches_slot_totals_after_moves():
+    plan = _small_plan()
+    index = hybrid.PlanIndex(plan)
+    limits = {"조립1": 3300, "조립2": 3700, "조립3": 3600}
+    index.apply_move("A", "2026-01-06_조립1", "2026-01-08_조립2", 100)
+    dates = index.dates() + ["2026-01-31"]
+    load = hybrid.capa_load_matrix(index, limits, dates)
+    assert list(load.columns) == list(limits) and list(load.index) == dates
+    assert load.to_numpy().tolist() == [[index.slot_qty(d, ln) for ln in limits] for d in dates]
+
+
+def test_adjust_date_range_with_stage_cache_matches_uncached(make_plan):
+    plan = make_plan(1)
+    args = ("1/12~1/16 조립1 70%", plan, "2026-01-12", "2026-01-16")
+    plain = hybrid.adjust_date_range(*args, today=date(2026, 1, 5))
+    cache = hybrid.StageCache()
+    for _ in range(2):
+        cached = hybrid.adjust_date_range(*args, today=date(2026, 1, 5), stage_cache=cache)
+        assert cached["moves"] == plain["moves"]
+        assert pd.DataFrame(cached["days"]).equals(pd.DataFrame(plain["days"]))
+        assert cached["load_after"].equals(plain["load_after"])
+    assert cache.hits >= 1
+
+
+def test_evaluate_scenarios_pool_matches_sequential(make_plan):
+    plan = make_plan(2)
+    scenarios = [
+        ("2026-01-13", "조립1", 60),
+        ("2026-01-13", "조립1", 90),
+        ("2026-01-14", "조립2", 50),
+        {"date": "2026-01-20", "line": "조립1", "add_qty": 500},
+        ("2026-01-21", "조립4", 70),
+    ]
+    seq = hybrid.evaluate_scenarios(plan, scenarios, max_workers=1)
+    pool = hybrid.evaluate_scenarios(plan, scenarios, max_workers=2)
+    assert list(seq["scenario"]) == list(range(len(scenarios)))
+    assert seq["status"].iloc[-1] == "[ERROR] 라인 미지정"
+    pd.testing.assert_frame_equal(seq, pool)
+
+    # 호출 측 인덱스(이동 반영)는 두 경로 모두 평가 기준
+    index = hybrid.PlanIndex(plan)
+    name, qty = next((r["name"], r["qty_1차"]) for r in index.rows("2026-01-13", "조립1") if r["qty_1차"] > 0)
+    index.apply_move(name, "2026-01-13_조립1", "2026-01-14_조립1", qty)
+    moved = [hybrid.evaluate_scenarios(plan, scenarios[:3], max_workers=w, plan_index=index) for w in (1, 2)]
+    pd.testing.assert_frame_equal(moved[0], moved[1])
+    assert moved[0]["current_qty"].iloc[0] == seq["current_qty"].iloc[0] - qty
+
+
+def test_entry_points_fall_back_to_engine_defaults(make_plan):
+    plan = make_plan(1)
+    explicit = {"today": date(2026, 1, 5), "capa_limits": {"조립1": 3300, "조립2": 3700, "조립3": 3600}}
+    ctx = hybrid.EngineContext.for_request(plan)
+    assert ctx.today == hybrid.DEFAULT_TODAY and dict(ctx.capa_limits) == explicit["capa_limits"]
+
+    q = ("2026-01-12 조립1 70%", plan, pd.DataFrame(), {}, {}, "2026-01-12")
+    assert hybrid.ask_professional_scheduler(*q)[0] == hybrid.ask_professional_scheduler(*q, **explicit)[0]
+    level = [hybrid.level_capa_month(plan, start_date="2026-01-12", end_date="2026-01-16", **kw) for kw in ({}, explicit)]
+    assert level[0]["moves"] == level[1]["moves"]
+    rng = [hybrid.adjust_date_range("1/12~1/16 조립1 70%", plan, "2026-01-12", "2026-01-16", **kw) for kw in ({}, explicit)]
+    assert rng[0]["moves"] == rng[1]["moves"]
+    scen = [hybrid.evaluate_scenarios(plan, [("2026-01-13", "조립1", 60)], max_workers=1, **kw) for kw in ({}, explicit)]
+    pd.testing.assert_frame_equal(scen[0], scen[1])
+
+
+def test_leveling_report_uses_target_pct_from_result(make_plan):
+    plan = make_plan(1)
+    result = hybrid.level_capa_month(plan, start_date="2026-01-12", end_date="2026-01-16", target_pct=80)
+    assert result["target_pct"] == 80 and not result["slots"].empty
+    assert all(row["limit"] == hybrid.DEFAULT_CAPA_LIMITS[row["line"]] * 80 // 100 for _, row in result["slots"].iterrows())
+    assert "- 기준: CAPA 80% 이하" in hybrid.format_leveling_report(result)
+
+
+def _reduce_cases(plan, caps=(3300, 1500), pcts=("50%", "70%")):
+    """감축 케이스 (ctx, stages, 날짜, 라인, target_qty, capa_target) — 1~4단계 실패 슬롯은 제외"""
+    for cap in caps:
+        ctx = hybrid.EngineContext.build(plan, today=date(2026, 1, 5), capa_limits={"조립1": cap, "조립2": cap, "조립3": cap})
+        for d in ("2026-01-08", "2026-01-13", "2026-01-21"):
+            for line in ("조립1", "조립2", "조립3"):
+                stages, err = hybrid._prepare_stages(plan, d, line, ctx)
+                if err:
+                    continue
+                total = int(stages["stock_res"]["total"])
+                for pct in pcts:
+                    target_qty, capa_target = hybrid._parse_target(pct, total, cap)
+                    if total > target_qty:
+                        yield ctx, stages, d, line, target_qty, capa_target
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_optimize_reduce_moves_pass_validation(make_plan, seed):
+    plan = make_plan(seed)
+    checked = 0
+    for ctx, stages, d, line, target_qty, _ in _reduce_cases(plan):
+        need = int(stages["stock_res"]["total"]) - target_qty
+        moves, _ = hybrid.python_optimize_reduce(
+            plan, stages["constraint_info"], stages["capa_status"].fork(), d, line, need,
+            ctx=ctx, due_ledger=hybrid.DueLedger(ctx.plan_index),
+        )
+        approved, violations = hybrid.step6_validate_ai_strategy(
+            {"moves": moves}, stages["constraint_info"], stages["capa_status"].fork(), plan, line,
+            ctx=ctx, due_ledger=hybrid.DueLedger(ctx.plan_index),
+        )
+        assert violations == []
+        assert [(m["item"], m["qty"], m["to"]) for m in approved] == [(m["item"], m["qty"], m["to"]) for m in moves]
+        checked += bool(moves)
+    assert checked
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_flow_reduce_achievement_not_below_greedy(make_plan, seed):
+    plan = make_plan(seed)
+    for ctx, stages, d, line, target_qty, capa_target in _reduce_cases(plan):
+        res = {
+            solver: hybrid._solve_target(
+                plan_df=plan, stages=stages, question_date=d, target_line=line, target_qty=target_qty,
+                capa_target=capa_target, ctx=ctx, use_ai=False, suggest_events=False, reduce_solver=solver,
+            )
+            for solver in ("flow", "greedy")
+        }
+        assert res["flow"]["achievement"] >= res["greedy"]["achievement"] - 1e-9, (d, line, target_qty)
+
+
+@pytest.mark.parametrize("seed,question_date,line,cap", [(1, "2026-01-12", "조립1", 1200), (3, "2026-01-12", "조립2", 1200), (3, "2026-01-13", "조립1", 1800)])
+def test_capa_event_whatif_matches_fresh_solve(make_plan, seed, question_date, line, cap):
+    plan = make_plan(seed)
+    whatif, candidates, (ctx, stages, target_qty) = _event_whatif(plan, question_date, line, cap)
+    assert candidates
+    for events in [[]] + candidates:
+        got = whatif.evaluate(events)
+        capa = stages["capa_status"].fork()
+        hybrid._apply_capa_events_to_status(capa, events, ctx.capa_limits)
+        fresh = hybrid._solve_target(
+            plan_df=plan, stages={**stages, "capa_status": capa}, question_date=question_date, target_line=line,
+            target_qty=target_qty, capa_target=target_qty / cap, ctx=ctx, use_ai=False, suggest_events=False,
+            reduce_solver="greedy",
+        )
+        assert got["final_moves"] == fresh["final_moves"], events
+        assert got["achievement"] == fresh["achievement"]
+        assert got["capa_status"].remaining.tolist() == capa.remaining.tolist()
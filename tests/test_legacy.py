@@ -0,0 +1,55 @@
+import legacy
+from data_sync import SnapshotStore
+
+
+def _daily_rows():
+    # id 컬럼이 없는 테이블, 정렬 앞부분(월/라인)이 같은 행이 여러 페이지에 걸침
+    rows = []
+    for day in range(1, 8):
+        for line, qty in (("1", 1000), ("2", 1500), ("조립3", 1500)):
+            rows.append({"날짜": f"2025-01-{day:02d}", "월": 1, "라인": line, "총_생산량": qty + day, "버전": "최종"})
+    rows.append({"날짜": "2025-02-01", "월": 2, "라인": "1", "총_생산량": 9999, "버전": "최종"})
+    return rows
+
+
+def test_monthly_query_pages_without_unknown_key_column(fake_client):
+    fake_client.tables["daily_total_production"] = _daily_rows()
+    out = legacy.fetch_db_data_legacy("1월 생산량 알려줘", fake_client, page_size=4, max_workers=2)
+
+    assert "조립1: 7028" in out and "조립2: 10528" in out and "조립3: 10528" in out
+    assert "Total: 28084" in out
+    # 유일 키가 설정되지 않은 테이블은 선택한 컬럼 전체로 정렬 (없는 id로 정렬하지 않음)
+    assert set(fake_client.orders) == {("daily_total_production", ("월", "라인", "총_생산량"))}
+    assert len(fake_client.orders) >= 6  # 4행씩 21행 → 6페이지 이상 (병렬 묶음 단위 요청)
+
+
+def test_page_order_appends_configured_key_or_selected_columns(monkeypatch):
+    assert legacy._page_order("daily_total_production", "날짜, 라인, 총_생산량", ("라인",)) == ("라인", "날짜", "총_생산량")
+    assert legacy._page_order("daily_capa", "*", ("라인",)) == ("라인",)
+    monkeypatch.setitem(legacy.LEGACY_TABLE_KEYS, "daily_capa", ("id",))
+    assert legacy._page_order("daily_capa", "*", ("라인",)) == ("라인", "id")
+    assert legacy._page_order("daily_capa", "월, 라인", ("id",)) == ("id",)
+
+
+def test_freshness_note_marks_stale_snapshot_answers():
+    assert legacy.format_freshness_note([]) == ""
+    note = legacy.format_freshness_note([{"snapshot": "a", "age_sec": 3600.0, "error": "RuntimeError: remote down"}])
+    assert "60분 전" in note and "재조회 실패: RuntimeError: remote down" in note
+    assert "갱신 중" in legacy.format_freshness_note([{"snapshot": "a", "age_sec": 900.0, "error": None}])
+
+
+def test_legacy_answer_reports_stale_snapshot(fake_client, tmp_path):
+    fake_client.tables["daily_total_production"] = _daily_rows()
+    store = SnapshotStore(str(tmp_path), parquet=False)
+    legacy.fetch_db_data_legacy("1월 생산량 알려줘", fake_client, store=store)  # 스냅샷 생성
+
+    name = "legacy_daily_total_production_month_1_최종"
+    df, _ = store.load(name)
+    store.save(name, df, {"fetched_at": "2020-01-01T00:00:00"})
+    fake_client.errors["daily_total_production"] = RuntimeError("remote down")
+
+    freshness = []
+    out = legacy.fetch_db_data_legacy("1월 생산량 알려줘", fake_client, store=store, freshness=freshness)
+    assert "Total: 28084" in out  # 오래된 스냅샷으로라도 답함
+    assert [x["snapshot"] for x in freshness] == ["daily_total_production_month_1_최종"]
+    assert freshness[0]["age_sec"] > legacy.LEGACY_SNAPSHOT_MAX_AGE_SEC